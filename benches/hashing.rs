@@ -0,0 +1,96 @@
+// lb1ext is a cdylib for python, so the hashing modules get built straight into the benchmark instead
+#[allow(dead_code)]
+#[path = "../rust_lib/pow.rs"]
+mod pow;
+#[allow(dead_code)]
+#[path = "../rust_lib/ripemd160.rs"]
+mod ripemd160;
+#[allow(dead_code)]
+#[path = "../rust_lib/sha256.rs"]
+mod sha256;
+#[allow(dead_code)]
+#[path = "../rust_lib/sha512.rs"]
+mod sha512;
+#[allow(dead_code)]
+#[path = "../rust_lib/work.rs"]
+mod work;
+
+use criterion::{black_box, criterion_group, criterion_main, Criterion, Throughput};
+
+fn blocks<const N: usize>() -> [[u8; 64]; N] {
+    let mut blocks = [[0u8; 64]; N];
+    for (lane, block) in blocks.iter_mut().enumerate() {
+        for (idx, byte) in block.iter_mut().enumerate() {
+            *byte = (lane * 64 + idx) as u8;
+        }
+    }
+    blocks
+}
+
+fn bench_sha256(c: &mut Criterion) {
+    let mut group = c.benchmark_group("sha256_compress");
+    let [block] = blocks::<1>();
+    let mut state = sha256::H;
+    group.throughput(Throughput::Elements(1));
+    group.bench_function("scalar", |b| {
+        b.iter(|| sha256::sha256_compress_scalar(black_box(&mut state), black_box(&block)))
+    });
+    group.bench_function(sha256::backend(), |b| {
+        b.iter(|| sha256::sha256_compress(black_box(&mut state), black_box(&block)))
+    });
+    let blocks4 = blocks::<4>();
+    let mut states4 = [sha256::H; 4];
+    group.throughput(Throughput::Elements(4));
+    group.bench_function("x4", |b| {
+        b.iter(|| sha256::sha256_compress_x4(black_box(&mut states4), black_box(&blocks4)))
+    });
+    let blocks8 = blocks::<8>();
+    let mut states8 = [sha256::H; 8];
+    group.throughput(Throughput::Elements(8));
+    group.bench_function("x8", |b| {
+        b.iter(|| sha256::sha256_compress_x8(black_box(&mut states8), black_box(&blocks8)))
+    });
+    group.finish();
+}
+
+fn bench_pow(c: &mut Criterion) {
+    let mut group = c.benchmark_group("proof_of_work");
+    let headers = [[7u8; pow::HEADER_SIZE]; pow::LANES];
+    group.throughput(Throughput::Elements(1));
+    group.bench_function("single", |b| b.iter(|| pow::proof_of_work(black_box(&headers[0]))));
+    group.bench_function("sha512_short", |b| b.iter(|| sha512::sha512_short(black_box(&[7u8; 32]))));
+    group.bench_function("ripemd160_short", |b| {
+        b.iter(|| ripemd160::ripemd160_short(black_box(&[7u8; 32])))
+    });
+    group.throughput(Throughput::Elements(pow::LANES as u64));
+    group.bench_function("x8", |b| b.iter(|| pow::proof_of_work_x8(black_box(&headers))));
+    let count = 1024;
+    let batch = vec![7u8; count * pow::HEADER_SIZE];
+    let (mut hashes, mut mask) = (vec![0u8; count * 32], vec![0u8; count]);
+    group.throughput(Throughput::Elements(count as u64));
+    group.bench_function("hash_headers", |b| {
+        b.iter(|| pow::hash_headers(black_box(&batch), &[0xff; 32], &mut hashes, &mut mask))
+    });
+    group.finish();
+}
+
+fn bench_work(c: &mut Criterion) {
+    // a coinbase of about the usual size and five merkle branches, as the test job has
+    let mut group = c.benchmark_group("work");
+    let (coinbase_prefix, coinbase2) = ([1u8; 60], [2u8; 120]);
+    let branches = [[3u8; 32]; 5];
+    let branches: Vec<&[u8; 32]> = branches.iter().collect();
+    let mut frame = [0u8; work::FRAME_SIZE];
+    group.throughput(Throughput::Elements(1));
+    group.bench_function("encode_job", |b| {
+        b.iter(|| {
+            let root = work::merkle_root(&coinbase_prefix, black_box(&[0; 4]), &coinbase2, &branches);
+            let (job_data, _) = work::encode_work(&[4; work::HEADER_PREFIX_SIZE], &root, &[5; work::HEADER_SUFFIX_SIZE]);
+            work::encode_frame(&mut frame, 0x33333333, 0, 0xffffffff, 1, 1, &job_data);
+        })
+    });
+    group.finish();
+}
+
+criterion_group!(benches, bench_sha256, bench_pow, bench_work);
+criterion_main!(benches);
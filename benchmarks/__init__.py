@@ -0,0 +1,6 @@
+from lb1miner.miner import Job, Work
+from tests.test_miner import STRATUM_PARAMS
+
+
+def sample_work(target: bytes = bytes.fromhex('0000000033333333' + 'ff' * 24)) -> Work:
+    return Work.from_job(Job.from_stratum(*STRATUM_PARAMS), bytes.fromhex("485fd81a"), bytes(4), target)
@@ -0,0 +1,26 @@
+"""
+Host side nonce search throughput of the CPU backend for a growing number of worker threads.
+
+    python -m benchmarks.bench_cpu [nonces]
+"""
+import os
+import sys
+
+from benchmarks import sample_work
+from lb1miner.cpu import CPUMiner
+
+
+def main():
+    nonces = int(sys.argv[1]) if len(sys.argv) > 1 else 1 << 18
+    work = sample_work()
+    workers = 1
+    while workers <= (os.cpu_count() or 1):
+        miner = CPUMiner(workers)
+        hits = miner.scan(work, 0, nonces - 1)
+        miner.close()
+        print(f"{workers:>3} workers: {miner.hashrate / 1e3:10.1f} kH/s {len(hits)} hits")
+        workers *= 2
+
+
+if __name__ == '__main__':
+    main()
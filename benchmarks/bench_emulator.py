@@ -0,0 +1,54 @@
+"""
+How many nonces per second the host side takes in from emulated boards over socketpairs: framing, job lookup
+and the nonce queue, with every nonce checked the way the stratum client does.
+
+    python -m benchmarks.bench_emulator [boards] [nonces per second per board] [seconds]
+"""
+import asyncio
+import sys
+import time
+
+from benchmarks import sample_work
+from lb1miner.device import LB1Device
+from lb1miner.emulator import start_boards
+
+
+async def run(boards: int, rate: float, seconds: float):
+    pairs = await start_boards(boards, hashrate=1e9, nonce_rate=rate)
+    devices = [await LB1Device.connect(host, hashrate=1e9, name=f'emulated-{index}')
+               for index, (_, host) in enumerate(pairs)]
+    checked = 0
+
+    async def consume(device: LB1Device):
+        nonlocal checked
+        while True:
+            work, packet = await device.nonces.get()
+            work.check_nonce(packet.nonce.to_bytes(8, 'little'))
+            checked += 1
+
+    work = sample_work()
+    consumers = []
+    for device in devices:
+        device.start()
+        device.submit(work, 0, 0xffffffff)
+        consumers.append(asyncio.create_task(consume(device)))
+    started = time.perf_counter()
+    await asyncio.sleep(seconds)
+    elapsed = time.perf_counter() - started
+    sent = sum(board.sent_nonces for board, _ in pairs)
+    print(f"{boards:>5} boards: {sent / elapsed:10.0f} nonces/s sent {checked / elapsed:10.0f} nonces/s checked "
+          f"{sum(device.framer.errors for device in devices)} framing errors")
+    for task in consumers:
+        task.cancel()
+    await asyncio.gather(*(device.close() for device in devices))
+
+
+def main():
+    boards = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    rate = float(sys.argv[2]) if len(sys.argv) > 2 else 100
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 5
+    asyncio.run(run(boards, rate, seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""
+Per nonce cost of the python `proof_of_work` against the native check resuming from `Work.midstate` and the batch
+`hash_headers` over whole headers.
+
+    python -m benchmarks.bench_pow
+"""
+import os
+import timeit
+
+from benchmarks import sample_work
+from lb1miner.miner import Work, hash_headers, proof_of_work
+
+
+NONCES = 4096
+
+
+def python_check(work: Work, nonces: bytes):
+    # what Work.check_nonce did before going native: the whole header is hashed for every nonce
+    hits = []
+    for idx in range(0, len(nonces), 8):
+        nonce = nonces[idx:idx + 8]
+        ntime = int.from_bytes(work.raw_data[100:104], 'little') + int.from_bytes(nonce[4:8], 'little')
+        data = work.raw_data[:100] + (ntime & 0xffffffff).to_bytes(4, 'little') + work.raw_data[104:108] + nonce[:4]
+        if proof_of_work(data)[::-1] < work.target:
+            hits.append(idx // 8)
+    return hits
+
+
+def main():
+    work = sample_work()
+    nonces = os.urandom(NONCES * 8)
+    headers = os.urandom(NONCES * 112)
+    assert python_check(work, nonces) == work.check_nonces(nonces)
+    for name, run in (('python proof_of_work', lambda: python_check(work, nonces)),
+                      ('native from midstate', lambda: work.check_nonces(nonces)),
+                      ('native hash_headers', lambda: hash_headers(headers, work.target))):
+        best = min(timeit.repeat(run, number=1, repeat=5))
+        print(f"{name:>24}: {best * 1e9 / NONCES:10.1f} ns/nonce {NONCES / best:12.0f} nonces/s")
+
+
+if __name__ == '__main__':
+    main()
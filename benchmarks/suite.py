@@ -0,0 +1,149 @@
+"""
+Timings for the hashing, work building and serialization hot paths, plus a replay of a synthetic serial stream
+through the packet framer. Results go to JSON so a release can be compared against the previous one.
+
+    python -m benchmarks.suite [-o results.json] [--compare baseline.json] [--threshold 0.1] [-k filter]
+
+With --compare it exits with 1 when any case got slower than the baseline by more than the threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+from typing import Callable, Dict, List, Tuple
+
+from benchmarks import STRATUM_PARAMS, sample_work
+from lb1ext.lb1ext import py_sha256_backend, py_sha256_transform  # pylint: disable=no-name-in-module, import-error
+from lb1miner.miner import Job, JobTemplate, Work, diff_to_target, hash_headers, proof_of_work, sha256d
+from lb1miner.serialization import PacketFramer, TXDeviceParametersPacket, TXJobDataPacket, \
+    TXQueryDeviceInformationPacket, TXRestartPacket, deserialize_packet
+
+# frames as captured from a board
+RX_FRAMES = {
+    'status': bytes.fromhex('a53c9652101b000000087878203c00ae01ee02000000003f00000000fc0869c35a'),
+    'nonce': bytes.fromhex('a53c9651101200000011010511dba0d13a0000000069c35a'),
+    'job_result': bytes.fromhex('a53c965510070000001569c35a'),
+    'device_information': bytes.fromhex('a53c965410360000000d476f6c647368656c6c2d4c423100000005302e302e3100'
+                                        '00000f4a4a4a4a4a4a4a4a4a4a4a4a4a4a4a00006d31000869c35a'),
+}
+# a board mostly sends nonces, with a job result for every job taken and a status now and then
+STREAM_MIX = (('nonce', 48), ('job_result', 8), ('status', 1))
+STREAM_REPEATS = 64
+REPEAT = 5
+
+Case = Tuple[str, Callable[[], object], int]
+
+
+def synthetic_stream() -> Tuple[bytes, int]:
+    frames = [RX_FRAMES[name] for name, count in STREAM_MIX for _ in range(count)] * STREAM_REPEATS
+    return b''.join(frames), len(frames)
+
+
+def replay(stream: bytes, chunk: int):
+    framer = PacketFramer()
+    for start in range(0, len(stream), chunk):
+        for _ in framer.feed(stream[start:start + chunk]):
+            pass
+
+
+def cases() -> List[Case]:
+    # (name, run, operations per run)
+    work = sample_work()
+    job = Job.from_stratum(*STRATUM_PARAMS)
+    extra_nonce1 = bytes.fromhex("485fd81a")
+    template = JobTemplate.from_job(job, extra_nonce1, work.target)
+    frame_buffer = bytearray(PacketFramer.MAX_FRAME_SIZE)
+    header = work.raw_data
+    nonces = os.urandom(1024 * 8)
+    headers = os.urandom(1024 * 112)
+    stream, packets = synthetic_stream()
+    found: List[Case] = [
+        ('sha256d', lambda: sha256d(header), 1),
+        ('sha256_transform', lambda: py_sha256_transform(header[:64]), 1),
+        ('proof_of_work', lambda: proof_of_work(header), 1),
+        ('job_from_stratum', lambda: Job.from_stratum(*STRATUM_PARAMS), 1),
+        ('work_from_job', lambda: Work.from_job(job, extra_nonce1, bytes(4), work.target), 1),
+        ('template_work', lambda: template.work(bytes(4)), 1),
+        ('template_encode_job', lambda: template.encode_job(bytes(4), 0x33333333, buffer=frame_buffer), 1),
+        ('check_nonce', lambda: work.check_nonce(nonces[:8]), 1),
+        ('check_nonces', lambda: work.check_nonces(nonces), 1024),
+        ('hash_headers', lambda: hash_headers(headers, work.target), 1024),
+        ('diff_to_target', lambda: diff_to_target(512), 1),
+    ]
+    for name, frame in RX_FRAMES.items():
+        found.append((f'deserialize_{name}', lambda frame=frame: deserialize_packet(frame), 1))
+    for name, packet in (('job_data', TXJobDataPacket(target=0x33333333, end_nonce=0xffffffff, job_data=work.data)),
+                         ('device_parameters', TXDeviceParametersPacket(flag=TXDeviceParametersPacket.SET,
+                                                                        voltage=430, freq=750)),
+                         ('query_device_information', TXQueryDeviceInformationPacket()),
+                         ('restart', TXRestartPacket())):
+        found.append((f'pack_{name}', packet.pack, 1))
+    for chunk in (64, 4096):
+        found.append((f'replay_stream_{chunk}', lambda chunk=chunk: replay(stream, chunk), packets))
+    return found
+
+
+def measure(run: Callable[[], object], operations: int) -> Dict[str, float]:
+    timer = timeit.Timer(run)
+    number, _ = timer.autorange()
+    samples = [elapsed / (number * operations) for elapsed in timer.repeat(REPEAT, number)]
+    return {'best_ns': min(samples) * 1e9, 'median_ns': statistics.median(samples) * 1e9, 'loops': number,
+            'operations': operations}
+
+
+def environment() -> Dict[str, str]:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, check=True,
+                                text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = ''
+    return {'python': platform.python_version(), 'implementation': platform.python_implementation(),
+            'platform': platform.platform(), 'machine': platform.machine(), 'cpus': str(os.cpu_count()),
+            'sha256_backend': py_sha256_backend(), 'commit': commit,
+            'date': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())}
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> List[str]:
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result['best_ns'] / baseline[name]['best_ns']
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f"{name:>34}: {baseline[name]['best_ns']:12.1f} -> {result['best_ns']:12.1f} ns/op {ratio:6.2f}x{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-o', '--output', help='where to save the results as JSON')
+    parser.add_argument('--compare', help='results JSON from an earlier run')
+    parser.add_argument('--threshold', type=float, default=0.1, help='tolerated slowdown, 0.1 is 10%%')
+    parser.add_argument('-k', dest='keyword', default='', help='only run the cases with this in their name')
+    args = parser.parse_args()
+
+    results = {}
+    for name, run, operations in cases():
+        if args.keyword not in name:
+            continue
+        results[name] = measure(run, operations)
+        print(f"{name:>34}: {results[name]['best_ns']:12.1f} ns/op (median {results[name]['median_ns']:.1f})")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump({'environment': environment(), 'results': results}, output, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as baseline:
+            if compare(results, json.load(baseline)['results'], args.threshold):
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1 +1,2 @@
-from .lb1ext import py_sha256_transform
+from .lb1ext import (py_sha256_transform, py_sha256_backend, py_check_nonces, py_check_nonces_midstate,
+                     py_scan_nonces, py_hash_headers, py_encode_work, py_encode_job)
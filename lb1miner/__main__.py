@@ -0,0 +1,5 @@
+import sys
+
+from lb1miner.cli import main
+
+sys.exit(main())
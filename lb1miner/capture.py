@@ -0,0 +1,149 @@
+"""
+Append only captures of the stratum and serial traffic, to reproduce incidents offline and to benchmark the parsing
+and verification pipeline on real traffic.
+
+A capture is `MAGIC` followed by entries: a header with the wall clock time, the kind, the stream (which device
+for serial entries) and the payload size, then the payload. Stratum entries hold the JSON of the method params as
+received, serial ones the raw bytes exactly as they were read or written.
+"""
+import json
+import mmap
+import os
+import time
+from collections import Counter
+from struct import Struct
+from typing import BinaryIO, Counter as CounterType, Dict, Iterator, List, Tuple
+
+from lb1miner.miner import BELOW_TARGET, INVALID, SHARE, Job, Target, Work, diff_to_target
+from lb1miner.serialization import PacketFramer, RXNoncePacket, TXJobDataPacket
+
+MAGIC = b'LB1CAP\x00\x01'
+NOTIFY, DIFFICULTY, EXTRANONCE, SERIAL_RX, SERIAL_TX = range(1, 6)
+KINDS = {NOTIFY: 'notify', DIFFICULTY: 'difficulty', EXTRANONCE: 'extranonce', SERIAL_RX: 'serial_rx',
+         SERIAL_TX: 'serial_tx'}
+GRADES = {SHARE: 'shares', BELOW_TARGET: 'below_target', INVALID: 'invalid'}
+
+Entry = Tuple[float, int, int, memoryview]
+
+
+class CaptureWriter:
+    # entries go through the file buffer, so a crash loses at most its last few KB (and the reader stops at a
+    # truncated entry)
+    entry_parser = Struct('<dBHI')
+
+    def __init__(self, path: str, buffering: int = 1 << 16):
+        self.path = path
+        self.file: BinaryIO = open(path, 'ab', buffering=buffering)  # pylint: disable=consider-using-with
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+        self.entries = 0
+        self._streams = 0
+
+    def stream(self) -> int:
+        # a new stream number, one per device
+        self._streams += 1
+        return self._streams
+
+    def write(self, kind: int, stream: int, payload):
+        self.file.write(self.entry_parser.pack(time.time(), kind, stream, len(payload)))
+        self.file.write(payload)
+        self.entries += 1
+
+    def write_params(self, kind: int, params):
+        self.write(kind, 0, json.dumps(params, separators=(',', ':')).encode())
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class CaptureReader:
+    # memory maps the capture, entry payloads come out as views on it
+    entry_parser = CaptureWriter.entry_parser
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as capture:
+            if os.fstat(capture.fileno()).st_size < len(MAGIC) or capture.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f'{path} is not a capture')
+            self._map = mmap.mmap(capture.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+
+    def __iter__(self) -> Iterator[Entry]:
+        view, unpack_from, header_size = self._view, self.entry_parser.unpack_from, self.entry_parser.size
+        offset, end = len(MAGIC), len(view)
+        while offset + header_size <= end:
+            timestamp, kind, stream, size = unpack_from(view, offset)
+            offset += header_size
+            if offset + size > end:
+                return
+            yield timestamp, kind, stream, view[offset:offset + size]
+            offset += size
+
+    def close(self):
+        self._view.release()
+        self._map.close()
+
+
+def hardware_target(device_target: int) -> Target:
+    # widest 256 bits target behind the 32 bits word a job went to the device with
+    return Target((device_target << 192) | ((1 << 192) - 1))
+
+
+def replay(path: str) -> Tuple[CounterType[str], float]:
+    """
+    Feeds a capture through the pipeline as fast as it goes: notify params through `Job.from_stratum`, serial bytes
+    through a `PacketFramer` per stream and every nonce found graded by `Work.grade_nonces` against the job sent to
+    that device before it, at the pool target of when that job was notified. Returns what was seen
+    (entries by kind, packets by type, nonces meeting the pool target as `shares`, the device one as `below_target`
+    or else `invalid`) and the time it took.
+    """
+    found: CounterType[str] = Counter()
+    reader = CaptureReader(path)
+    started = time.perf_counter()
+    _replay(reader, found)
+    elapsed = time.perf_counter() - started
+    reader.close()
+    return found, elapsed
+
+
+def _replay(reader: CaptureReader, found: CounterType[str]):
+    # on its own so the views on the map are gone when it returns, the map can't close while any is left
+    framers: Dict[Tuple[int, int], PacketFramer] = {}
+    works: Dict[Tuple[int, int], Work] = {}
+    # a difficulty only applies from the next job on, so each job is checked against the target when it was notified.
+    # the serial side doesn't have the pool job id, the header suffix (trie hash, time and bits) identifies the job:
+    # notifies sharing it (only the coinbase changed) can't be told apart, the target of the latest one goes
+    targets: Dict[bytes, bytes] = {}
+    target: bytes = diff_to_target(1)
+    for _, kind, stream, payload in reader:
+        found[KINDS.get(kind, 'unknown')] += 1
+        if kind == NOTIFY:
+            targets[Job.from_stratum(*json.loads(bytes(payload))).header_suffix] = target
+        elif kind == DIFFICULTY:
+            target = diff_to_target(json.loads(bytes(payload))[0])
+        elif kind in (SERIAL_RX, SERIAL_TX):
+            framer = framers.get((kind, stream))
+            if framer is None:
+                framer = framers[(kind, stream)] = PacketFramer()
+            _feed(framer, stream, payload, works, targets, target, found)
+
+
+def _feed(framer: PacketFramer, stream: int, payload: memoryview, works: Dict[Tuple[int, int], Work],
+          targets: Dict[bytes, bytes], target: bytes, found: CounterType[str]):
+    # the nonces of an entry are graded together per job, as the verification pool batches them
+    nonces: Dict[Tuple[int, int], List[bytes]] = {}
+    for packet in framer.feed(payload):
+        found[type(packet).__name__] += 1
+        if isinstance(packet, TXJobDataPacket):
+            works[(stream, packet.job_id)] = Work.from_job_data(
+                packet.job_data, targets.get(packet.job_data[36:80], target), hardware_target(packet.target))
+        elif isinstance(packet, RXNoncePacket):
+            if (stream, packet.job_id) in works:
+                nonces.setdefault((stream, packet.job_id), []).append(packet.nonce.to_bytes(8, 'little'))
+            else:
+                found['unknown_job'] += 1
+    for job, packed in nonces.items():
+        for grade in works[job].grade_nonces(b''.join(packed)):
+            found[GRADES[grade]] += 1
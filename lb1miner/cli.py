@@ -0,0 +1,170 @@
+"""
+Command line for the miner.
+
+    lb1miner start pool.example.com:3334 wallet.worker [--device '/dev/ttyACM*'] [--tune tuning.json]
+    lb1miner probe [--device '/dev/ttyACM*']
+    lb1miner bench [--nonces 262144] [--workers 4]
+    lb1miner replay capture.lb1 [--chunk 4096]
+
+Every command imports what it needs when it runs, so starting up doesn't pay for the stratum client, numpy or
+the native extension. Probing the boards skips the stratum client and numpy, but the device driver works on
+`Work` and so loads the native extension.
+"""
+# pylint: disable=import-outside-toplevel
+import argparse
+import logging
+import os
+import sys
+
+
+async def start(args) -> int:
+    import asyncio
+    from lb1miner.orchestrator import Orchestrator
+    host, _, port = args.pool.rpartition(':')
+    orchestrator = Orchestrator(host, int(port), args.user, args.password, job_seconds=args.job_seconds)
+    devices = await orchestrator.discover(args.device, nonce_rate=args.nonce_rate)
+    if not devices:
+        print('no boards found', file=sys.stderr)
+        orchestrator.close()
+        return 1
+    if args.capture:
+        from lb1miner.capture import CaptureWriter
+        orchestrator.record(CaptureWriter(args.capture))
+    tasks = [asyncio.create_task(device.poll_status(args.status_interval)) for device in devices]
+    if args.metrics_port:
+        from lb1miner.metrics import METRICS
+        METRICS.enable()
+        await METRICS.serve(port=args.metrics_port)
+    if args.tune:
+        from lb1miner.tuner import TuningStore, tune_all
+        tasks.append(asyncio.create_task(tune_all(devices, TuningStore(args.tune), args.retune)))
+    try:
+        await orchestrator.run()
+    finally:
+        for task in tasks:
+            task.cancel()
+        if orchestrator.capture is not None:
+            orchestrator.capture.close()
+        orchestrator.close()
+    return 0
+
+
+async def probe(args) -> int:
+    from lb1miner.device import discover
+    devices = await discover(args.device)
+    for device in devices:
+        information = device.information or await device.query_information()
+        model, firmware, serial = (field.rstrip(b'\x00') for field in (
+            information.model_name, information.firmware_version, information.serial_number))
+        status = await device.query_status()
+        print(f"{device.name}: {model.decode(errors='replace')} {firmware.decode(errors='replace')} "
+              f"serial {serial.hex()} work depth {information.work_depth}, {status.freq} MHz {status.voltage} mV "
+              f"{status.temp} C {status.rpm} rpm, {status.good_cores}/{status.chips * status.cores} cores")
+        await device.close()
+    return 0 if devices else 1
+
+
+def bench(args) -> int:
+    import time
+    from lb1miner.cpu import CPUMiner
+    from lb1miner.miner import Work, diff_to_target
+    work = Work(b'', b'', diff_to_target(1), b'', 0, b'', os.urandom(112), int(time.time()), False)
+    nonces = os.urandom(8 * args.nonces)
+    started = time.perf_counter()
+    work.check_nonces(nonces)
+    elapsed = time.perf_counter() - started
+    print(f"nonce checks: {args.nonces / elapsed / 1e3:10.1f} k/s")
+    miner = CPUMiner(args.workers)
+    try:
+        miner.scan(work, 0, args.nonces - 1)
+    finally:
+        miner.close()
+    print(f"cpu scan ({miner.workers} workers): {miner.hashrate / 1e3:10.1f} kH/s")
+    return 0
+
+
+def frame_stream(path: str, chunk: int):
+    import time
+    from collections import Counter
+    from lb1miner.serialization import PacketFramer
+    with open(path, 'rb') as stream_file:
+        stream = stream_file.read()
+    framer = PacketFramer()
+    found: 'Counter[str]' = Counter()
+    started = time.perf_counter()
+    for offset in range(0, len(stream), chunk):
+        for packet in framer.feed(stream[offset:offset + chunk]):
+            found[type(packet).__name__] += 1
+    return found, time.perf_counter() - started
+
+
+def replay(args) -> int:
+    # captures taken with `start --capture` go through the whole pipeline, anything else is framed as raw serial
+    from lb1miner import capture
+    with open(args.path, 'rb') as stream_file:
+        is_capture = stream_file.read(len(capture.MAGIC)) == capture.MAGIC
+    found, elapsed = capture.replay(args.path) if is_capture else frame_stream(args.path, args.chunk)
+    for name, count in sorted(found.items()):
+        print(f"{name:>28}: {count}")
+    print(f"{elapsed:.3f}s, {os.path.getsize(args.path) / elapsed / 1e6:.1f} MB/s")
+    return 0
+
+
+def parser() -> argparse.ArgumentParser:
+    main_parser = argparse.ArgumentParser(prog='lb1miner', description=__doc__,
+                                          formatter_class=argparse.RawDescriptionHelpFormatter)
+    main_parser.add_argument('-v', '--verbose', action='store_true')
+    commands = main_parser.add_subparsers(dest='command', required=True)
+
+    start_parser = commands.add_parser('start', help='mine on a pool with every board found')
+    start_parser.add_argument('pool', help='host:port')
+    start_parser.add_argument('user')
+    start_parser.add_argument('--password', default='x')
+    start_parser.add_argument('--job-seconds', type=float, default=5.0)
+    start_parser.add_argument('--nonce-rate', type=float, help='nonces per second per board, to measure hashrate')
+    start_parser.add_argument('--status-interval', type=float, default=10.0)
+    start_parser.add_argument('--metrics-port', type=int, help='serve prometheus metrics on this port')
+    start_parser.add_argument('--tune', metavar='PATH', help='tune freq and voltage, keeping the results here')
+    start_parser.add_argument('--retune', action='store_true', help='tune even the boards with stored settings')
+    start_parser.add_argument('--capture', metavar='PATH', help='append the pool and serial traffic to a capture')
+    start_parser.set_defaults(run=start)
+
+    probe_parser = commands.add_parser('probe', help='list the boards found and their status')
+    probe_parser.set_defaults(run=probe)
+
+    for command in (start_parser, probe_parser):
+        command.add_argument('--device', action='append', help='serial port glob, /dev/ttyACM* by default')
+
+    bench_parser = commands.add_parser('bench', help='host side nonce checking and scanning speed')
+    bench_parser.add_argument('--nonces', type=int, default=1 << 18)
+    bench_parser.add_argument('--workers', type=int)
+    bench_parser.set_defaults(run=bench)
+
+    replay_parser = commands.add_parser('replay', help='run a capture (or raw serial bytes) through the parsing and '
+                                                       'verification as fast as possible')
+    replay_parser.add_argument('path')
+    replay_parser.add_argument('--chunk', type=int, default=4096, help='bytes per read, for raw serial bytes')
+    replay_parser.set_defaults(run=replay)
+    return main_parser
+
+
+def main(argv=None) -> int:
+    args = parser().parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    if getattr(args, 'device', False) is None:
+        from lb1miner.device import DEVICE_PATTERNS
+        args.device = list(DEVICE_PATTERNS)
+    result = args.run(args)
+    if not isinstance(result, int):
+        # the commands talking to boards or pools are coroutines, asyncio alone takes half the start up budget
+        import asyncio
+        try:
+            result = asyncio.run(result)
+        except KeyboardInterrupt:
+            result = 130
+    return result
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,69 @@
+import asyncio
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from lb1ext.lb1ext import py_scan_nonces  # pylint: disable=no-name-in-module, import-error
+
+from lb1miner.miner import Work
+from lb1miner.serialization import RXNoncePacket
+
+
+class CPUMiner:
+    """
+    Software stand-in for an LB1 board: searches a `Work` nonce range on the host and reports hits as the device
+    would. The native scan releases the GIL, so the range is split across plain threads.
+    """
+
+    def __init__(self, workers: Optional[int] = None, chunk_size: int = 1 << 16):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.hashes = 0
+        self.elapsed = 0.0
+        self._worker = threading.local()
+        self._worker_ids = itertools.count()
+        self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix='lb1-cpu', initializer=self._start_worker)
+
+    @property
+    def hashrate(self) -> float:
+        return self.hashes / self.elapsed if self.elapsed else 0.0
+
+    def close(self):
+        self.executor.shutdown()
+
+    def _start_worker(self):
+        # each executor thread numbers itself once, that is the chip_id of the hits it finds
+        self._worker.id = next(self._worker_ids)
+
+    def _scan_chunk(self, midstate: bytes, tail: bytes, target: bytes, start_nonce: int, end_nonce: int, job_id: int):
+        return [RXNoncePacket(length=18, job_id=job_id, chip_id=self._worker.id, nonce=nonce)
+                for nonce in py_scan_nonces(midstate, tail, start_nonce, end_nonce, target)]
+
+    def _submit(self, work: Work, start_nonce: int, end_nonce: int, job_id: int):
+        midstate, tail = work.get_midstate(), work.raw_data[64:]
+        futures = []
+        for chunk_start in range(start_nonce, end_nonce + 1, self.chunk_size):
+            chunk_end = min(chunk_start + self.chunk_size - 1, end_nonce)
+            futures.append(self.executor.submit(
+                self._scan_chunk, midstate, tail, work.target, chunk_start, chunk_end, job_id))
+        return futures
+
+    def scan(self, work: Work, start_nonce: int = 0, end_nonce: int = 0xffffffff,
+             job_id: int = 0) -> List[RXNoncePacket]:
+        # inclusive range, same as TXJobDataPacket.start_nonce/end_nonce. chip_id tells which worker found it
+        started = time.perf_counter()
+        hits = [hit for future in self._submit(work, start_nonce, end_nonce, job_id) for hit in future.result()]
+        self.elapsed += time.perf_counter() - started
+        self.hashes += end_nonce - start_nonce + 1
+        return hits
+
+    async def scan_async(self, work: Work, start_nonce: int = 0, end_nonce: int = 0xffffffff,
+                         job_id: int = 0) -> List[RXNoncePacket]:
+        started = time.perf_counter()
+        results = await asyncio.gather(*map(asyncio.wrap_future, self._submit(work, start_nonce, end_nonce, job_id)))
+        self.elapsed += time.perf_counter() - started
+        self.hashes += end_nonce - start_nonce + 1
+        return [hit for hits in results for hit in hits]
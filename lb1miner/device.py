@@ -0,0 +1,352 @@
+import asyncio
+import glob
+import logging
+import os
+import termios
+import tty
+from collections import Counter, deque
+from typing import Callable, Counter as CounterType, Deque, Dict, Iterable, List, Optional, Tuple
+
+from lb1miner.capture import SERIAL_RX, SERIAL_TX, CaptureWriter
+from lb1miner.miner import Work, expected_hashes, rate_difficulty
+from lb1miner.serialization import Packet, PacketFramer, RXDeviceInformationPacket, RXJobResultPacket, \
+    RXNoncePacket, RXStatusPacket, TXDeviceParametersPacket, TXJobDataPacket, TXQueryDeviceInformationPacket
+from lb1miner.telemetry import StatusHistory
+
+log = logging.getLogger(__name__)
+
+DEVICE_PATTERNS = ('/dev/ttyACM*',)
+
+
+def device_target(work: Work) -> int:
+    # the device takes the second 32 bits word of the 256 bits target, the first one has to be zero: anything
+    # easier than difficulty 1 goes as difficulty 1
+    return min(0xffffffff, int.from_bytes((work.hardware_target or work.target)[:8], 'big'))
+
+
+class HashrateMeter:
+    # hashrate from the expected hashes behind each nonce found, over a sliding window
+    def __init__(self, window: float = 300.0, min_samples: int = 16):
+        self.window = window
+        self.min_samples = min_samples
+        self.samples: Deque[Tuple[float, float]] = deque()
+        self.hashes = 0.0
+        self.started: Optional[float] = None
+
+    def start(self, now: float):
+        if self.started is None:
+            self.started = now
+
+    def add(self, hashes: float, now: float):
+        self.samples.append((now, hashes))
+        self.hashes += hashes
+        while self.samples[0][0] < now - self.window:
+            self.hashes -= self.samples.popleft()[1]
+
+    def rate(self, now: float) -> Optional[float]:
+        if self.started is None or len(self.samples) < self.min_samples or now <= self.started:
+            return None
+        return self.hashes / min(now - self.started, self.window)
+
+
+class JobIndex:
+    # the Work behind each job id sent to the device, on a ring as big as the single byte job id space (way past any
+    # work_depth). midstates get computed as the Work goes in, so checking its nonces starts hashing right away.
+    # valid and invalid nonces are counted per (chip, core) to tell the bad cores apart, and `valid_hashes` adds up
+    # the hashes expected behind the valid ones
+    SIZE = 256
+
+    def __init__(self):
+        self._works: List[Optional[Work]] = [None] * self.SIZE
+        self.valid: CounterType[Tuple[int, int]] = Counter()
+        self.invalid: CounterType[Tuple[int, int]] = Counter()
+        self.valid_hashes = 0.0
+
+    def __setitem__(self, job_id: int, work: Work):
+        work.get_midstate()
+        self._works[job_id] = work
+
+    def get(self, job_id: int) -> Optional[Work]:
+        return self._works[job_id]
+
+    def record(self, packet: RXNoncePacket, valid: bool):
+        (self.valid if valid else self.invalid)[(packet.chip_id, packet.core_id)] += 1
+        work = self._works[packet.job_id]
+        if valid and work is not None:
+            self.valid_hashes += expected_hashes(work.hardware_target or work.target)
+
+    def bad_cores(self, min_nonces: int = 16, max_invalid: float = 0.1) -> List[Tuple[int, int]]:
+        # (chip, core) pairs with at least `min_nonces` checked and more than `max_invalid` of them invalid
+        bad = []
+        for core, invalid in self.invalid.items():
+            total = invalid + self.valid[core]
+            if total >= min_nonces and invalid > max_invalid * total:
+                bad.append(core)
+        return sorted(bad)
+
+
+class LB1Device(asyncio.Protocol):
+    """
+    Drives one LB1 board over any asyncio transport (serial port, pty, socketpair).
+    Jobs are pipelined: up to `work_depth` of them are kept queued on the device, each one expected to last for
+    its nonce range at the current `hashrate`, so the chips always have the next job at hand.
+    Nonces come back on `nonces` together with the `Work` they were found for (looked up by job id on `jobs`,
+    which also keeps the per core counts of valid and invalid nonces), and `hashrate` follows what
+    they add up to once there are enough of them.
+    With `nonce_rate` set, every job goes out with a hardware target easier than the pool one, picked from the
+    current hashrate so about that many nonces come back per second: enough to keep measuring the hashrate without
+    flooding the serial link. Without it the device only reports the nonces meeting the pool target.
+    Every status report lands on `history`, which `poll_status` keeps fed.
+    """
+    ACK_TIMEOUT = 2.0
+    QUERY_TIMEOUT = 5.0
+
+    def __init__(self, hashrate: float = 1e9, name: str = '', nonce_rate: Optional[float] = None):
+        self.name = name
+        self.hashrate = hashrate
+        self.nonce_rate = nonce_rate
+        self.transport: Optional[asyncio.WriteTransport] = None
+        self._read_transport: Optional[asyncio.BaseTransport] = None
+        self.framer = PacketFramer()
+        self.information: Optional[RXDeviceInformationPacket] = None
+        self.status: Optional[RXStatusPacket] = None
+        self.history = StatusHistory()
+        self.work_depth = 1
+        self.jobs = JobIndex()
+        self.nonces: asyncio.Queue = asyncio.Queue()
+        self.acks = 0
+        self.ack_timeouts = 0
+        self.unknown_nonces = 0
+        self.on_job_sent: Optional[Callable[['LB1Device', Work], None]] = None
+        self.capture: Optional[CaptureWriter] = None
+        self.capture_stream = 0
+        self.meter = HashrateMeter()
+        self._last_job_id = 0
+        self._pending: asyncio.Queue = asyncio.Queue()
+        self._queued: Deque[float] = deque()
+        self._acks: Dict[int, asyncio.Future] = {}
+        self._replies: Dict[int, Deque[asyncio.Future]] = {}
+        self._feeder: Optional[asyncio.Task] = None
+        self._generation = 0
+        self._slot_freed = asyncio.Event()
+        self.closed = asyncio.Event()
+
+    @classmethod
+    async def connect(cls, sock, **kwargs) -> 'LB1Device':
+        device = cls(**kwargs)
+        await asyncio.get_running_loop().create_connection(lambda: device, sock=sock)
+        return device
+
+    @classmethod
+    async def open_serial(cls, path: str, baudrate: int = 115200, **kwargs) -> 'LB1Device':
+        # ttys are character devices, which asyncio pipe transports handle on their own file objects
+        speed = getattr(termios, f'B{baudrate}', None)
+        if speed is None:
+            raise ValueError(f'{baudrate} is not a baudrate the tty supports')
+        fd = os.open(path, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+        try:
+            tty.setraw(fd)
+            attributes = termios.tcgetattr(fd)
+            attributes[4] = attributes[5] = speed
+            termios.tcsetattr(fd, termios.TCSANOW, attributes)
+        except BaseException:
+            os.close(fd)
+            raise
+        device = cls(name=kwargs.pop('name', path), **kwargs)
+        loop = asyncio.get_running_loop()
+        await loop.connect_read_pipe(lambda: device, os.fdopen(fd, 'rb', buffering=0))
+        await loop.connect_write_pipe(lambda: device, os.fdopen(os.dup(fd), 'wb', buffering=0))
+        return device
+
+    def connection_made(self, transport):
+        # serial ports come with a read and a write pipe transport, sockets with a single one
+        if isinstance(transport, asyncio.WriteTransport):
+            self.transport = transport
+        else:
+            self._read_transport = transport
+
+    def connection_lost(self, exc):
+        if self.closed.is_set():
+            return
+        self.closed.set()
+        if self._feeder:
+            self._feeder.cancel()
+        for waiter in [*self._acks.values(), *(future for futures in self._replies.values() for future in futures)]:
+            if not waiter.done():
+                waiter.set_exception(ConnectionError(f'{self.name} disconnected'))
+
+    def record(self, capture: CaptureWriter):
+        self.capture, self.capture_stream = capture, capture.stream()
+
+    def data_received(self, data):
+        if self.capture is not None:
+            self.capture.write(SERIAL_RX, self.capture_stream, data)
+        for packet in self.framer.feed(data):
+            self.packet_received(packet)
+
+    def packet_received(self, packet: Packet):
+        if isinstance(packet, RXNoncePacket):
+            work = self.jobs.get(packet.job_id)
+            if work is None:
+                self.unknown_nonces += 1
+                return
+            now = asyncio.get_running_loop().time()
+            self.meter.add(expected_hashes(work.hardware_target or work.target), now)
+            self.hashrate = self.meter.rate(now) or self.hashrate
+            self.nonces.put_nowait((work, packet))
+            return
+        if isinstance(packet, RXJobResultPacket):
+            ack = self._acks.pop(packet.job_id, None)
+            if ack is not None and not ack.done():
+                ack.set_result(packet)
+            return
+        if isinstance(packet, RXStatusPacket):
+            self.status = packet
+            self.history.add(packet)
+        elif isinstance(packet, RXDeviceInformationPacket):
+            self.information = packet
+            self.work_depth = max(1, packet.work_depth)
+        waiters = self._replies.get(packet.type)
+        while waiters:
+            waiter = waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(packet)
+                break
+
+    def send(self, packet: Packet):
+        if self.transport is None or self.closed.is_set():
+            raise ConnectionError(f'{self.name} is not connected')
+        # a frame of its own: since python 3.12 transports queue what they can't write right away without copying it
+        frame = packet.pack()
+        if self.capture is not None:
+            self.capture.write(SERIAL_TX, self.capture_stream, frame)
+        self.transport.write(frame)
+
+    async def _request(self, packet: Packet, reply_type: int):
+        waiter = asyncio.get_running_loop().create_future()
+        self._replies.setdefault(reply_type, deque()).append(waiter)
+        self.send(packet)
+        return await asyncio.wait_for(waiter, self.QUERY_TIMEOUT)
+
+    async def query_information(self) -> RXDeviceInformationPacket:
+        return await self._request(TXQueryDeviceInformationPacket(), RXDeviceInformationPacket.type)
+
+    async def query_status(self) -> RXStatusPacket:
+        return await self._request(TXDeviceParametersPacket(flag=TXDeviceParametersPacket.QUERY), RXStatusPacket.type)
+
+    async def set_parameters(self, voltage: int, freq: int, mode: int = 0, temp: int = 80) -> RXStatusPacket:
+        return await self._request(
+            TXDeviceParametersPacket(flag=TXDeviceParametersPacket.SET, voltage=voltage, freq=freq, mode=mode,
+                                     temp=temp),
+            RXStatusPacket.type)
+
+    async def poll_status(self, interval: float = 10.0):
+        # keeps `history` filled, the board only reports its status when asked
+        while not self.closed.is_set():
+            try:
+                await self.query_status()
+            except asyncio.TimeoutError:
+                log.warning("%s didn't answer a status query", self.name)
+            except ConnectionError:
+                return
+            await asyncio.sleep(interval)
+
+    def start(self):
+        if self._feeder is None:
+            self._feeder = asyncio.create_task(self._feed())
+
+    async def close(self):
+        if self._feeder:
+            self._feeder.cancel()
+        for transport in (self._read_transport, self.transport):
+            if transport:
+                transport.close()
+        await self.closed.wait()
+
+    def submit(self, work: Work, start_nonce: int = 0, end_nonce: int = 0xffffffff):
+        self._pending.put_nowait((work, start_nonce, end_nonce, self._generation))
+
+    def clear(self):
+        # drops the jobs not sent yet and frees the device queue, so the next submit goes out right away
+        self._generation += 1
+        while not self._pending.empty():
+            self._pending.get_nowait()
+        self._queued.clear()
+        self._slot_freed.set()
+
+    @property
+    def queued_jobs(self) -> int:
+        self._retire(asyncio.get_running_loop().time())
+        return len(self._queued)
+
+    def _retire(self, now: float):
+        while self._queued and self._queued[0] <= now:
+            self._queued.popleft()
+
+    def _next_job_id(self) -> int:
+        # job ids are a single byte on the wire, 0 is left out
+        self._last_job_id = self._last_job_id % 0xff + 1
+        return self._last_job_id
+
+    async def _wait_for_slot(self):
+        loop = asyncio.get_running_loop()
+        self._retire(loop.time())
+        while len(self._queued) >= self.work_depth:
+            self._slot_freed.clear()
+            try:
+                await asyncio.wait_for(self._slot_freed.wait(), self._queued[0] - loop.time())
+            except asyncio.TimeoutError:
+                pass
+            self._retire(loop.time())
+
+    async def _feed(self):
+        while True:
+            work, start_nonce, end_nonce, generation = await self._pending.get()
+            await self._wait_for_slot()
+            if generation == self._generation:
+                await self._send_job(work, start_nonce, end_nonce)
+
+    async def _send_job(self, work: Work, start_nonce: int, end_nonce: int):
+        loop = asyncio.get_running_loop()
+        job_id = self._next_job_id()
+        if self.nonce_rate:
+            work = work.for_hardware(rate_difficulty(self.hashrate, self.nonce_rate))
+        self.jobs[job_id] = work
+        ack = self._acks[job_id] = loop.create_future()
+        self.send(TXJobDataPacket(target=device_target(work), start_nonce=start_nonce, end_nonce=end_nonce, job_num=1,
+                                  job_id=job_id, job_data=work.data))
+        if self.on_job_sent is not None:
+            self.on_job_sent(self, work)
+        now = loop.time()
+        self.meter.start(now)
+        finish = self._queued[-1] if self._queued else now
+        self._queued.append(max(finish, now) + (end_nonce - start_nonce + 1) / self.hashrate)
+        try:
+            await asyncio.wait_for(ack, self.ACK_TIMEOUT)
+            self.acks += 1
+        except asyncio.TimeoutError:
+            self._acks.pop(job_id, None)
+            self.ack_timeouts += 1
+            log.warning("%s did not acknowledge job %i", self.name, job_id)
+
+
+async def discover(patterns: Iterable[str] = DEVICE_PATTERNS, **kwargs) -> List[LB1Device]:
+    # opens every matching port, keeping the ones answering the device information query
+    async def probe(path: str) -> Optional[LB1Device]:
+        try:
+            device = await LB1Device.open_serial(path, **kwargs)
+        except OSError as error:
+            log.warning("can't open %s: %s", path, error)
+            return None
+        try:
+            information = await device.query_information()
+        except (asyncio.TimeoutError, ConnectionError):
+            await device.close()
+            return None
+        log.info("found %s (%s) on %s", information.model_name.rstrip(b'\x00').decode(errors='replace'),
+                 information.serial_number.hex(), path)
+        return device
+
+    paths = sorted({path for pattern in patterns for path in glob.glob(pattern)})
+    found = await asyncio.gather(*map(probe, paths))
+    return [device for device in found if device is not None]
@@ -0,0 +1,227 @@
+"""
+Software LB1 boards for load testing the host side without hardware.
+
+    python -m lb1miner.emulator [--boards 64] [--hashrate 1.6e9] [--nonce-rate 50] [--link-dir /tmp/lb1]
+
+Every board gets a pty, `--link-dir` adds stable names for them to point `discover` at.
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import tty
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+
+from lb1ext.lb1ext import py_scan_nonces  # pylint: disable=no-name-in-module, import-error
+
+from lb1miner.miner import Target
+from lb1miner.serialization import Packet, PacketFramer, RXDeviceInformationPacket, RXJobResultPacket, \
+    RXNoncePacket, RXStatusPacket, TXDeviceParametersPacket, TXJobDataPacket, TXQueryDeviceInformationPacket, \
+    TXRestartPacket
+
+
+class EmulatedJob:  # pylint: disable=too-few-public-methods
+    __slots__ = ('packet', 'position', 'owed')
+
+    def __init__(self, packet: TXJobDataPacket):
+        self.packet = packet
+        self.position = packet.start_nonce
+        self.owed = 0.0
+
+
+class EmulatedBoard(asyncio.Protocol):
+    """
+    Answers the host as an LB1 would: device information and status queries, parameter changes, restarts and
+    job acks. Queued jobs are worked through at `hashrate`, sending nonces at the rate their target gives
+    (or at a fixed `nonce_rate`), random ones unless `hit_difficulty` is set: then the job ranges get actually
+    scanned at that difficulty on the executor, as fast as the host CPU goes, so the nonces pass any pool target
+    up to it. Packets going out in a tick are written together.
+    """
+    TICK = 0.01
+
+    def __init__(self, hashrate: float = 1.6e9, nonce_rate: Optional[float] = None,
+                 hit_difficulty: Optional[float] = None, work_depth: int = 8, chunk_size: int = 1 << 16):
+        self.hashrate = hashrate
+        self.nonce_rate = nonce_rate
+        self.hit_target = Target.from_difficulty(hit_difficulty) if hit_difficulty else None
+        self.chunk_size = chunk_size
+        self.information = RXDeviceInformationPacket(
+            model_name_length=13, model_name=b'Goldshell-LB1', firmware_version_length=5, firmware_version=b'0.0.1',
+            serial_number=os.urandom(16), work_depth=work_depth)
+        self.status = RXStatusPacket(chips=8, cores=120, good_cores=120, scanbits=32, scantime=60, voltage=430,
+                                     freq=750, temp=63, rpm=2300)
+        self.transport: Optional[asyncio.WriteTransport] = None
+        self._read_transport: Optional[asyncio.BaseTransport] = None
+        self.framer = PacketFramer()
+        self.jobs: Deque[EmulatedJob] = deque()
+        self.received = 0
+        self.sent_nonces = 0
+        self._outgoing = bytearray()
+        self._miner: Optional[asyncio.Task] = None
+        self._slave: Optional[int] = None
+        self.closed = asyncio.Event()
+
+    @classmethod
+    async def socketpair(cls, **kwargs) -> Tuple['EmulatedBoard', socket.socket]:
+        # returns the board and the host end, as `LB1Device.connect` takes it
+        host, board_socket = socket.socketpair()
+        board = cls(**kwargs)
+        await asyncio.get_running_loop().create_connection(lambda: board, sock=board_socket)
+        return board, host
+
+    @classmethod
+    async def pty(cls, **kwargs) -> Tuple['EmulatedBoard', str]:
+        # returns the board and the path of the pty to open with `LB1Device.open_serial`
+        master, slave = os.openpty()
+        tty.setraw(slave)
+        path = os.ttyname(slave)
+        board = cls(**kwargs)
+        loop = asyncio.get_running_loop()
+        os.set_blocking(master, False)
+        await loop.connect_read_pipe(lambda: board, os.fdopen(master, 'rb', buffering=0))
+        await loop.connect_write_pipe(lambda: board, os.fdopen(os.dup(master), 'wb', buffering=0))
+        # the slave end stays open here, otherwise the master reads fail whenever the host has it closed
+        board._slave = slave  # pylint: disable=protected-access
+        return board, path
+
+    def connection_made(self, transport):
+        if isinstance(transport, asyncio.WriteTransport):
+            self.transport = transport
+        else:
+            self._read_transport = transport
+        if self._miner is None:
+            self._miner = asyncio.get_running_loop().create_task(self._mine())
+
+    def connection_lost(self, exc):
+        if self._miner is not None:
+            self._miner.cancel()
+        self.closed.set()
+
+    def close(self):
+        for transport in (self._read_transport, self.transport):
+            if transport:
+                transport.close()
+        if self._slave is not None:
+            os.close(self._slave)
+            self._slave = None
+
+    def data_received(self, data):
+        for packet in self.framer.feed(data):
+            self.received += 1
+            self.packet_received(packet)
+        self.flush()
+
+    def write(self, packet: Packet):
+        self._outgoing += packet.pack()
+
+    def flush(self):
+        if self._outgoing and self.transport is not None and not self.transport.is_closing():
+            self.transport.write(bytes(self._outgoing))
+        self._outgoing.clear()
+
+    def packet_received(self, packet: Packet):
+        if isinstance(packet, TXJobDataPacket):
+            self.jobs.append(EmulatedJob(packet))
+            while len(self.jobs) > self.information.work_depth:
+                self.jobs.popleft()
+            self.write(RXJobResultPacket(job_id=packet.job_id))
+        elif isinstance(packet, TXRestartPacket):
+            self.jobs.clear()
+            self.status.reboot_count += 1
+        elif isinstance(packet, TXQueryDeviceInformationPacket):
+            self.write(self.information)
+        elif isinstance(packet, TXDeviceParametersPacket):
+            if packet.flag == TXDeviceParametersPacket.SET:
+                self.status.voltage, self.status.freq = packet.voltage, packet.freq
+                self.status.mode, self.status.temp = packet.mode, packet.temp
+            self.write(self.status)
+
+    def _nonce(self, job: EmulatedJob, nonce: int) -> RXNoncePacket:
+        self.sent_nonces += 1
+        return RXNoncePacket(job_id=job.packet.job_id, chip_id=random.randrange(self.status.chips),
+                             core_id=random.randrange(self.status.cores), nonce=nonce)
+
+    async def _mine(self):
+        loop = asyncio.get_running_loop()
+        last = loop.time()
+        while True:
+            if self.hit_target is None:
+                await asyncio.sleep(self.TICK)
+                now = loop.time()
+                self._emulate(now - last)
+                last = now
+            elif self.jobs:
+                await self._scan(loop)
+            else:
+                await asyncio.sleep(self.TICK)
+            self.flush()
+
+    def _emulate(self, elapsed: float):
+        # works through `elapsed` seconds of hashes, sending the nonces they would have found
+        hashes = self.hashrate * elapsed
+        while hashes > 0 and self.jobs:
+            job = self.jobs[0]
+            done = min(hashes, job.packet.end_nonce - job.position + 1)
+            if self.nonce_rate:
+                job.owed += self.nonce_rate * done / self.hashrate
+            else:
+                job.owed += done * (job.packet.target + 1) / (1 << 64)
+            while job.owed >= 1:
+                job.owed -= 1
+                self.write(self._nonce(job, job.position + random.randrange(max(1, int(done)))))
+            job.position += int(done)
+            hashes -= done
+            if job.position > job.packet.end_nonce:
+                self.jobs.popleft()
+
+    async def _scan(self, loop: asyncio.AbstractEventLoop):
+        job = self.jobs[0]
+        data = job.packet.job_data
+        start, end = job.position, min(job.position + self.chunk_size - 1, job.packet.end_nonce)
+        hits = await loop.run_in_executor(None, py_scan_nonces, data[:32], data[32:80], start, end, self.hit_target)
+        for nonce in hits:
+            self.write(self._nonce(job, nonce))
+        job.position = end + 1
+        if job.position > job.packet.end_nonce and self.jobs and self.jobs[0] is job:
+            self.jobs.popleft()
+
+
+async def start_boards(count: int, **kwargs) -> List[Tuple[EmulatedBoard, socket.socket]]:
+    return list(await asyncio.gather(*(EmulatedBoard.socketpair(**kwargs) for _ in range(count))))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--boards', type=int, default=1)
+    parser.add_argument('--hashrate', type=float, default=1.6e9)
+    parser.add_argument('--nonce-rate', type=float, help='nonces per second per board, instead of what the '
+                                                         'job target gives')
+    parser.add_argument('--hit-difficulty', type=float, help='scan for real hits at this difficulty')
+    parser.add_argument('--link-dir', help='directory for ttyLB1-<n> links to the ptys')
+    args = parser.parse_args()
+    boards = []
+    for index in range(args.boards):
+        board, path = await EmulatedBoard.pty(hashrate=args.hashrate, nonce_rate=args.nonce_rate,
+                                              hit_difficulty=args.hit_difficulty)
+        boards.append(board)
+        if args.link_dir:
+            link = os.path.join(args.link_dir, f'ttyLB1-{index}')
+            if os.path.islink(link):
+                os.unlink(link)
+            os.symlink(path, link)
+            path = link
+        print(path, flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        for board in boards:
+            board.close()
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,149 @@
+import asyncio
+import functools
+import logging
+import time
+from bisect import bisect_left
+from typing import Dict, List, Tuple
+
+from lb1miner.miner import Job, JobTemplate, Work
+from lb1miner.serialization import PacketFramer, TXJobDataPacket
+
+log = logging.getLogger(__name__)
+
+# upper bounds in seconds, doubling from 1us to ~8s
+BUCKETS = tuple(1e-6 * 2 ** power for power in range(24))
+
+# (owner, attribute, stage): what the mining loop goes through, from a notify to the nonces found graded
+PROBES = (
+    (Job, 'from_stratum', 'job_from_stratum'),
+    (JobTemplate, 'from_job', 'template_from_job'),
+    (JobTemplate, 'work', 'template_work'),
+    (TXJobDataPacket, 'pack', 'job_pack'),
+    (PacketFramer, '_next_packet', 'framer_next_packet'),
+    (Work, 'grade_nonces', 'grade_nonces'),
+    (Work, 'hash_nonces', 'hash_nonces'),
+)
+
+
+class Histogram:
+    __slots__ = ('bounds', 'counts', 'count', 'total')
+
+    def __init__(self, bounds: Tuple[float, ...] = BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        # may lose an update when threads race on it, which is fine for metrics
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        buckets, running = [], 0
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            running += count
+            buckets.append((bound, running))
+        return buckets
+
+
+class Metrics:
+    """
+    Per stage latency histograms for the hot path, off by default.
+    Enabling swaps each probed function for a timed wrapper and disabling puts the original back, so there is no
+    cost at all while off. Counters are plain integers anyone can bump with `count`.
+    """
+
+    def __init__(self, probes=PROBES, bounds: Tuple[float, ...] = BUCKETS):
+        self.probes = probes
+        self.histograms: Dict[str, Histogram] = {stage: Histogram(bounds) for _, _, stage in probes}
+        self.counters: Dict[str, int] = {}
+        self.enabled = False
+        self._originals: List[Tuple[object, str, object, bool]] = []
+
+    def enable(self):
+        if self.enabled:
+            return
+        for owner, attribute, stage in self.probes:
+            own = attribute in vars(owner)
+            original = vars(owner)[attribute] if own else getattr(owner, attribute)
+            setattr(owner, attribute, self._wrap(original, self.histograms[stage]))
+            self._originals.append((owner, attribute, original, own))
+        self.enabled = True
+
+    def disable(self):
+        while self._originals:
+            owner, attribute, original, own = self._originals.pop()
+            if own:
+                setattr(owner, attribute, original)
+            else:
+                delattr(owner, attribute)
+        self.enabled = False
+
+    @staticmethod
+    def _wrap(original, histogram: Histogram):
+        if isinstance(original, (classmethod, staticmethod)):
+            return type(original)(Metrics._wrap(original.__func__, histogram))
+        perf_counter = time.perf_counter
+
+        @functools.wraps(original)
+        def timed(*args, **kwargs):
+            started = perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                histogram.observe(perf_counter() - started)
+        return timed
+
+    def count(self, name: str, value: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def reset(self):
+        for histogram in self.histograms.values():
+            histogram.counts[:] = [0] * len(histogram.counts)
+            histogram.count, histogram.total = 0, 0.0
+        self.counters.clear()
+
+    def snapshot(self) -> dict:
+        return {
+            'enabled': self.enabled,
+            'stages': {stage: {'count': histogram.count, 'sum': histogram.total, 'buckets': histogram.cumulative()}
+                       for stage, histogram in self.histograms.items()},
+            'counters': dict(self.counters),
+        }
+
+    def prometheus(self, prefix: str = 'lb1') -> str:
+        # text exposition format, https://prometheus.io/docs/instrumenting/exposition_formats/
+        lines = [f'# TYPE {prefix}_stage_seconds histogram']
+        for stage, histogram in self.histograms.items():
+            for bound, count in histogram.cumulative():
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {count}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {histogram.total!r}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+        for name, value in sorted(self.counters.items()):
+            lines.append(f'# TYPE {prefix}_{name} counter')
+            lines.append(f'{prefix}_{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 9464) -> asyncio.AbstractServer:
+        # answers any request on the socket with the current metrics, enough for a prometheus scrape
+        async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+            try:
+                await reader.readuntil(b'\r\n\r\n')
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                pass
+            body = self.prometheus().encode()
+            writer.write(b'HTTP/1.0 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n'
+                         b'Content-Length: %d\r\n\r\n%s' % (len(body), body))
+            try:
+                await writer.drain()
+            except ConnectionError as error:
+                log.debug("metrics scrape went away: %s", error)
+            writer.close()
+
+        return await asyncio.start_server(handle, host, port)
+
+
+METRICS = Metrics()
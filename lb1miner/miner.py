@@ -1,10 +1,29 @@
 import math
+import sys
 import time
-from dataclasses import dataclass
-from typing import List
+from array import array
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from fractions import Fraction
+from struct import Struct
+from typing import Iterable, List, Optional, Tuple, Union
 import hashlib
 
-from lb1ext.lb1ext import py_sha256_transform  # pylint: disable=no-name-in-module, import-error
+from lb1ext.lb1ext import (  # pylint: disable=no-name-in-module, import-error
+    py_sha256_transform, py_hash_nonces_midstate, py_hash_headers, py_encode_work, py_encode_job)
+
+# what a nonce found by a device is worth, as `Work.grade_nonces` tells
+INVALID, BELOW_TARGET, SHARE = range(3)
+
+
+@lru_cache(maxsize=None)
+def numpy_module():
+    # numpy takes longer to import than everything else in the miner, so it only gets loaded once needed
+    try:
+        import numpy  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return None
+    return numpy
 
 
 def sha256d(payload: bytes) -> bytes:
@@ -38,6 +57,11 @@ class Job:
                    [convert(branch) for branch in merkle_root], convert(version), convert(bit), convert(current_time),
                    clean)
 
+    @property
+    def header_suffix(self) -> bytes:
+        # the header from the trie hash on (nonce zeroed), as the device gets it: all of it comes from the job alone
+        return swap_words(self.trie_hash + self.encoded_time + self.encoded_nbit + b'\x00\x00\x00\x00')
+
 
 @dataclass
 class Work:
@@ -50,37 +74,202 @@ class Work:
     raw_data: bytes
     time: int
     clean: bool
+    midstate: bytes = b''
+    extra_nonce2: bytes = b''
 
     @classmethod
     def from_job(cls, job: Job, extra_nonce1: bytes, extra_nonce2: bytes, target):
-        coinbase = sha256d(job.coinbase1 + extra_nonce1 + extra_nonce2 + job.coinbase2)
-        merkle_root = coinbase
-        for branch in job.merkle_root:
+        return JobTemplate.from_job(job, extra_nonce1, target).work(extra_nonce2)
+
+    @classmethod
+    def from_job_data(cls, job_data: bytes, target: bytes, hardware_target: bytes = b'') -> 'Work':
+        # the Work behind a job sent to a device, as far as its job data tells: the first block of the header only
+        # comes as its midstate, which is all checking nonces takes
+        return cls(b'', b'', target, hardware_target, 0, job_data, bytes(64) + job_data[32:80], 0, False,
+                   job_data[:32])
+
+    def check_nonce(self, nonce, target: Optional[bytes] = None):
+        return bool(self.check_nonces(nonce, target))
+
+    def check_nonces(self, nonces: bytes, target: Optional[bytes] = None) -> List[int]:
+        # nonces are 8 bytes each, packed together. returns the indexes of the ones meeting the target (the pool
+        # one unless given)
+        return Target.from_bytes(target or self.target).matches(self.hash_nonces(nonces))
+
+    def grade_nonce(self, nonce) -> int:
+        return self.grade_nonces(nonce)[0]
+
+    def grade_nonces(self, nonces: bytes) -> List[int]:
+        # SHARE for the nonces meeting the pool target, BELOW_TARGET for those only meeting the hardware one and
+        # INVALID for the rest, hashing each once for both
+        hashes = self.hash_nonces(nonces)
+        grades = [INVALID] * (len(hashes) // 32)
+        if self.hardware_target:
+            for index in Target.from_bytes(self.hardware_target).matches(hashes):
+                grades[index] = BELOW_TARGET
+        for index in Target.from_bytes(self.target).matches(hashes):
+            grades[index] = SHARE
+        return grades
+
+    def hash_nonces(self, nonces: bytes) -> bytes:
+        # the proof of work of each nonce, 32 bytes apiece as `hash_headers` gives them. only the last block of the
+        # first sha256 gets hashed, the first 64 bytes come from the cached midstate
+        return py_hash_nonces_midstate(self.get_midstate(), self.raw_data[64:], nonces)
+
+    def for_hardware(self, difficulty: int) -> 'Work':
+        # the same work for a device reporting the nonces at `difficulty`, unless that is harder than the pool target
+        hardware_target: bytes = diff_to_target(difficulty)
+        if hardware_target <= self.target:
+            hardware_target, difficulty = b'', 0
+        if hardware_target == self.hardware_target:
+            return self
+        return replace(self, hardware_target=hardware_target, hardware_difficulty=difficulty)
+
+    def get_midstate(self) -> bytes:
+        if not self.midstate:
+            self.midstate = py_sha256_transform(self.raw_data[:64])
+        return self.midstate
+
+
+@dataclass
+class JobTemplate:
+    # everything from a Job that doesn't change when rolling extranonce2, so each Work only costs the coinbase and
+    # merkle hashing plus the midstate
+    job: Job
+    extra_nonce1: bytes
+    target: bytes
+    coinbase_prefix: bytes
+    header_prefix: bytes
+    header_suffix: bytes
+
+    @classmethod
+    def from_job(cls, job: Job, extra_nonce1: bytes, target):
+        # the merkle root is swapped twice (on its own and together with the header), so it goes in as is
+        header_prefix = swap_words(job.encoded_version + job.previous_hash)
+        return cls(job, extra_nonce1, target, job.coinbase1 + extra_nonce1, header_prefix, job.header_suffix)
+
+    def merkle_root(self, extra_nonce2: bytes) -> bytes:
+        merkle_root = sha256d(self.coinbase_prefix + extra_nonce2 + self.job.coinbase2)
+        for branch in self.job.merkle_root:
             merkle_root = sha256d(merkle_root + branch)
-        trie_hash = job.trie_hash
-        # trie_hash = b''.join([trie_hash[i:i+4][::-1] for i in range(0, len(trie_hash), 4)])
-        merkle_root = b''.join([merkle_root[i:i + 4][::-1] for i in range(0, len(merkle_root), 4)])
-        data = (job.encoded_version + job.previous_hash + merkle_root +
-                trie_hash + job.encoded_time + job.encoded_nbit + b'\x00\x00\x00\x00')
-        data = b''.join([data[i:i + 4][::-1] for i in range(0, len(data), 4)])
-        prehash = bytes(py_sha256_transform(data[:64]))
-        final = (prehash + data[64:])
-        final = final + bytes([0] * (136 - len(final)))
-        return cls(job.job_id, extra_nonce1, target, bytes(0), 0, final, data, int(time.time()), job.clean)
+        return merkle_root
+
+    def work(self, extra_nonce2: bytes) -> Work:
+        # merkle root, header, midstate and padding all in one native call
+        final, data = py_encode_work(self.coinbase_prefix, extra_nonce2, self.job.coinbase2, self.job.merkle_root,
+                                     self.header_prefix, self.header_suffix)
+        return Work(self.job.job_id, self.extra_nonce1, self.target, bytes(0), 0, final, data, int(time.time()),
+                    self.job.clean, final[:32], extra_nonce2)
 
-    def check_nonce(self, nonce):
-        ntime = int.from_bytes(self.raw_data[100:104], 'little')
-        ntime += int.from_bytes(nonce[4:8], 'little')
-        data = self.raw_data[:100] + ntime.to_bytes(4, 'little') + self.raw_data[104:108] + nonce[:4]
-        return proof_of_work(data)[::-1] < self.target
+    def encode_job(self, extra_nonce2: bytes, target: int, start_nonce: int = 0, end_nonce: int = 0xffffffff,
+                   job_id: int = 0, buffer=None, offset: int = 0) -> Tuple:
+        # the finished TXJobDataPacket frame for `target` (the device's 32 bits word) and the header to check its
+        # nonces against. with a writable `buffer` the frame goes on it at `offset` and its size comes instead
+        return py_encode_job(self.coinbase_prefix, extra_nonce2, self.job.coinbase2, self.job.merkle_root,
+                             self.header_prefix, self.header_suffix, target, start_nonce, end_nonce, 1, job_id,
+                             buffer, offset)
 
+    def works(self, extra_nonce2s: Iterable[bytes]) -> List[Work]:
+        return [self.work(extra_nonce2) for extra_nonce2 in extra_nonce2s]
 
-def diff_to_target(difficulty: int):
-    temp = hex(math.floor(0xffffffff / difficulty))[2:]
-    return bytes.fromhex(f"{''.join(['0' * (16 - len(temp))])}{temp}{''.join(['f'] * 48)}")
+
+def swap_words(data: bytes) -> bytes:
+    # reverses the byte order of every 4 bytes word
+    words = array('I', data)
+    words.byteswap()
+    return words.tobytes()
+
+
+def expected_hashes(target: bytes) -> float:
+    # how many hashes it takes, on average, to find one meeting the target
+    return (1 << 256) / (int.from_bytes(target, 'big') + 1)
+
+
+def rate_difficulty(hashrate: float, rate: float) -> int:
+    # difficulty at which `hashrate` finds about `rate` nonces per second. 1 is the easiest a device takes
+    return max(1, int(hashrate / (rate * (1 << 32))))
+
+
+class Target(bytes):
+    """
+    256 bits target, the big endian bytes the native checks take, built with exact integer math from any
+    difficulty (fractional ones included). Hashes are compared as the little endian numbers `proof_of_work` and
+    the native code return, without reversing them, and `matches` settles almost every hash of a batch on its top
+    64 bits alone.
+    """
+    MAX = (1 << 224) - 1  # difficulty 1
+    NUMPY_BATCH = 32  # hashes, numpy only pays off from there
+    high_parser = Struct('<24xQ')
+    value: int
+    high: int
+
+    def __new__(cls, value: int):
+        target = super().__new__(cls, value.to_bytes(32, 'big'))
+        target.value = value
+        target.high = value >> 192
+        return target
+
+    def __getnewargs__(self):
+        return (self.value,)
+
+    @classmethod
+    def from_bytes(cls, target: bytes) -> 'Target':
+        # from the big endian bytes targets travel as, kept as is when already one
+        return target if isinstance(target, cls) else cls(int.from_bytes(target, 'big'))
+
+    @classmethod
+    def from_difficulty(cls, difficulty: Union[int, float, str, Fraction]) -> 'Target':
+        # floats go through their shortest repr, so the 0.1 a pool sends is exactly 1/10
+        if not isinstance(difficulty, int):
+            difficulty = Fraction(repr(difficulty)) if isinstance(difficulty, float) else Fraction(difficulty)
+        if difficulty <= 0:
+            raise ValueError(f'difficulty has to be positive, got {difficulty}')
+        return cls(min((1 << 256) - 1, cls.MAX // difficulty))
+
+    @property
+    def difficulty(self) -> float:
+        return self.MAX / self.value if self.value else math.inf
+
+    def meets(self, pow_hash) -> bool:
+        return int.from_bytes(pow_hash, 'little') < self.value
+
+    def matches(self, hashes) -> List[int]:
+        # indexes of the hashes meeting the target among N * 32 bytes of them, as `hash_headers` returns. only the
+        # ones whose top 64 bits are not above the target's get compared whole
+        view = memoryview(hashes).cast('B')
+        numpy = numpy_module() if len(view) >= 32 * self.NUMPY_BATCH else None
+        if numpy is not None:
+            candidates = numpy.flatnonzero(numpy.frombuffer(view, dtype='<u8')[3::4] <= self.high).tolist()
+        else:
+            candidates = [index for index, (high,) in enumerate(self.high_parser.iter_unpack(view))
+                          if high <= self.high]
+        return [index for index in candidates if self.meets(view[index * 32:index * 32 + 32])]
+
+
+def diff_to_target(difficulty: Union[int, float, str, Fraction]) -> Target:
+    return Target.from_difficulty(difficulty)
 
 
 def proof_of_work(header: bytes):
     initial_hash = hashlib.sha512(sha256d(header)).digest()
     return sha256d(ripemd160(initial_hash[:len(initial_hash) // 2]) +
                    ripemd160(initial_hash[len(initial_hash) // 2:]))
+
+
+def hash_headers(headers, target: bytes) -> Tuple:
+    """
+    Proof of work of many headers at once: `headers` is an N x 112 uint8 array or any buffer of N * 112 bytes.
+    Returns the N x 32 hashes (byte order as `proof_of_work`) and a mask of the ones meeting `target`, as numpy
+    arrays when given one, otherwise as bytearrays of N * 32 and N bytes.
+    """
+    numpy = sys.modules.get('numpy')  # already loaded when given an array
+    if numpy is not None and isinstance(headers, numpy.ndarray):
+        headers = numpy.ascontiguousarray(headers, dtype=numpy.uint8).reshape(-1, 112)
+        hash_array = numpy.empty((len(headers), 32), dtype=numpy.uint8)
+        mask_array = numpy.zeros(len(headers), dtype=numpy.bool_)
+        py_hash_headers(headers, target, hash_array, mask_array.view(numpy.uint8))
+        return hash_array, mask_array
+    count = memoryview(headers).nbytes // 112
+    hashes, mask = bytearray(count * 32), bytearray(count)
+    py_hash_headers(headers, target, hashes, mask)
+    return hashes, mask
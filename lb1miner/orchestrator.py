@@ -0,0 +1,62 @@
+from typing import Dict, Iterable, List, Tuple
+
+from lb1miner.device import DEVICE_PATTERNS, LB1Device, discover
+from lb1miner.miner import Work
+from lb1miner.stratum import StratumClient
+from lb1miner.verifier import VerificationPool
+
+MAX_NONCE = 0xffffffff
+
+
+class Orchestrator(StratumClient):
+    """
+    Runs many boards from one event loop and one stratum connection.
+    Each device carves its own extranonce2 `Work` into consecutive nonce ranges sized to last `job_seconds` at the
+    device's measured hashrate, so fast and slow boards are refilled at the same pace. All nonce checks go through
+    one shared verification pool.
+    """
+    MIN_RANGE = 1 << 20
+
+    def __init__(self, host: str, port: int, username: str, password: str = 'x', job_seconds: float = 5.0,
+                 verification_workers: int = 0, **kwargs):
+        # a pool made here is ours to close, one passed in belongs to the caller
+        self._own_verifier = kwargs.get('verifier') is None
+        if self._own_verifier:
+            kwargs['verifier'] = VerificationPool(verification_workers or None)
+        super().__init__(host, port, username, password, **kwargs)
+        self.job_seconds = job_seconds
+        self._cursors: Dict[LB1Device, Tuple[Work, int]] = {}
+
+    async def discover(self, patterns: Iterable[str] = DEVICE_PATTERNS, **kwargs) -> List[LB1Device]:
+        devices = await discover(patterns, **kwargs)
+        for device in devices:
+            if self.session is None:
+                self.devices.append(device)
+            else:
+                self.add_device(device)
+        return devices
+
+    def close(self):
+        if self._own_verifier and isinstance(self.verifier, VerificationPool):
+            self.verifier.close()
+
+    def range_size(self, device: LB1Device) -> int:
+        return max(self.MIN_RANGE, min(MAX_NONCE + 1, int(device.hashrate * self.job_seconds)))
+
+    def assign(self, device: LB1Device, work: Work):
+        self._cursors[device] = (work, 0)
+        self._submit_range(device)
+
+    def _submit_range(self, device: LB1Device):
+        work, start = self._cursors.pop(device)
+        end = min(start + self.range_size(device) - 1, MAX_NONCE)
+        device.submit(work, start, end)
+        if end < MAX_NONCE:
+            self._cursors[device] = (work, end + 1)
+
+    def job_taken(self, device: LB1Device):
+        cursor = self._cursors.get(device)
+        if cursor is not None and self.template is not None and cursor[0].job_id == self.template.job.job_id:
+            self._submit_range(device)
+        else:
+            super().job_taken(device)
@@ -1,6 +1,7 @@
-from dataclasses import dataclass
+import struct
+from dataclasses import dataclass, fields
 from struct import Struct
-from typing import Dict, Type
+from typing import ClassVar, Dict, Iterator, Optional, Tuple, Type, TypeVar, Union
 
 
 def deserialize_packet(payload: bytes):
@@ -8,24 +9,76 @@ def deserialize_packet(payload: bytes):
     return DESERIALIZERS[payload[3]].unpack(payload)
 
 
+_T = TypeVar('_T', bound=type)
+# packet fields that are also read from the class (`RXNoncePacket.type`) to tell the packet classes apart
+_CLASS_DEFAULTS = ('type', 'version')
+
+
+class _ClassDefault:
+    # a slot that reads as the field default on the class, so `RXNoncePacket.type` still tells the packet type
+    __slots__ = ('slot', 'default')
+
+    def __init__(self, slot, default):
+        self.slot = slot
+        self.default = default
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self.default
+        return self.slot.__get__(instance, owner)
+
+    def __set__(self, instance, value):
+        self.slot.__set__(instance, value)
+
+
+def slotted(cls: _T) -> _T:
+    # dataclass(slots=True) only comes with python 3.10: rebuilds the dataclass with a slot per field instead of the
+    # per instance __dict__. defaults live on the generated __init__, so they can go from the class
+    namespace = {key: value for key, value in cls.__dict__.items() if key not in ('__dict__', '__weakref__')}
+    inherited = {name for base in cls.__mro__[1:] for name in getattr(base, '__slots__', ())}
+    declared = [field for field in fields(cls) if field.name in cls.__dict__.get('__annotations__', {})]
+    for field in declared:
+        namespace.pop(field.name, None)
+    namespace['__slots__'] = tuple(field.name for field in declared if field.name not in inherited)
+    slotted_cls = type(cls)(cls.__name__, cls.__bases__, namespace)
+    for field in declared:
+        if field.name in _CLASS_DEFAULTS:
+            slot = next(vars(base)[field.name] for base in slotted_cls.__mro__ if field.name in vars(base))
+            setattr(slotted_cls, field.name, _ClassDefault(getattr(slot, 'slot', slot), field.default))
+    return slotted_cls
+
+
+@slotted
 @dataclass
 class Packet:
-    preamble = bytes.fromhex('A53C96')
-    finalizer = bytes.fromhex('69C35A')
+    preamble: ClassVar[bytes] = bytes.fromhex('A53C96')
+    finalizer: ClassVar[bytes] = bytes.fromhex('69C35A')
     type: int = 0x00
+    version: int = 0x10
 
     @classmethod
-    def unpack(cls, payload: bytes):
+    def unpack(cls, payload: Union[bytes, memoryview]):
         pass
 
-    def pack(self):
-        pass
+    def frame(self) -> Tuple[Struct, tuple]:
+        # the struct for the whole frame, preamble to finalizer, and the values going in
+        raise NotImplementedError(f"{type(self).__name__} can't be packed")
+
+    def pack(self) -> bytes:
+        frame, values = self.frame()
+        return frame.pack(*values)
 
+    def pack_into(self, buffer, offset: int = 0) -> int:
+        # writes the frame straight on a writable buffer (bytearray, memoryview...), returning its size
+        frame, values = self.frame()
+        frame.pack_into(buffer, offset, *values)
+        return frame.size
 
+
+@slotted
 @dataclass
 class RXStatusPacket(Packet):
     type: int = 0x52
-    version: int = 0x10
     length: int = 0
     chips: int = 0
     cores: int = 0
@@ -42,23 +95,28 @@ class RXStatusPacket(Packet):
     powerwarn: int = 0
     rpm: int = 0
     parser = Struct('<IBBBBHHHIBBBBBH')
+    frame_parser = Struct('<3sBBIBBBBHHHIBBBBBH3s')
 
     @classmethod
-    def unpack(cls, payload: bytes):
+    def unpack(cls, payload: Union[bytes, memoryview]):
         assert payload[:3] == cls.preamble
         assert payload[-3:] == cls.finalizer
         assert payload[3] == cls.type
         assert payload[4] == cls.version
-        return cls(cls.type, cls.version, *cls.parser.unpack(payload[5:-3]))
+        return cls(payload[3], payload[4], *cls.parser.unpack(payload[5:-3]))
 
-    def pack(self):
-        raise NotImplementedError("this packet comes from the device, packing not supported")
+    def frame(self) -> Tuple[Struct, tuple]:
+        self.length = self.frame_parser.size - 6
+        return self.frame_parser, (self.preamble, self.type, self.version, self.length, self.chips, self.cores,
+                                   self.good_cores, self.scanbits, self.scantime, self.voltage, self.freq, self.mode,
+                                   self.temp, self.reboot_count, self.tempwarn, self.fanwarn, self.powerwarn, self.rpm,
+                                   self.finalizer)
 
 
+@slotted
 @dataclass
 class RXDeviceInformationPacket(Packet):
     type: int = 0x54
-    version: int = 0x10
     length: int = 0
     model_name_length: int = 0
     model_name: bytes = b''
@@ -66,24 +124,28 @@ class RXDeviceInformationPacket(Packet):
     firmware_version: bytes = b''
     serial_number: bytes = b''
     work_depth: int = 0
-    parser = Struct('<BBIB16sB8s21sB')
+    parser = Struct('<IB16sB8s21sB')
+    frame_parser = Struct('<3sBBIB16sB8s21sB3s')
 
     @classmethod
-    def unpack(cls, payload: bytes):
+    def unpack(cls, payload: Union[bytes, memoryview]):
         assert payload[:3] == cls.preamble
         assert payload[-3:] == cls.finalizer
         assert payload[3] == cls.type
         assert payload[4] == cls.version
-        return cls(*cls.parser.unpack(payload[3:-3]))
+        return cls(payload[3], payload[4], *cls.parser.unpack(payload[5:-3]))
 
-    def pack(self):
-        raise NotImplementedError("this packet comes from the device, packing not supported")
+    def frame(self) -> Tuple[Struct, tuple]:
+        self.length = self.frame_parser.size - 6
+        return self.frame_parser, (self.preamble, self.type, self.version, self.length, self.model_name_length,
+                                   self.model_name, self.firmware_version_length, self.firmware_version,
+                                   self.serial_number, self.work_depth, self.finalizer)
 
 
+@slotted
 @dataclass
 class RXNoncePacket(Packet):
     type: int = 0x51
-    version: int = 0x10
     length: int = 0
     job_id: int = 0
     chip_id: int = 0
@@ -92,45 +154,52 @@ class RXNoncePacket(Packet):
     has_hash: bool = False
     hash: bytes = b''
     parser = Struct('<IBBBQ')
+    frame_parser = Struct('<3sBBIBBBQB3s')
 
     @classmethod
-    def unpack(cls, payload: bytes):
+    def unpack(cls, payload: Union[bytes, memoryview]):
         assert payload[:3] == cls.preamble
         assert payload[-3:] == cls.finalizer
         assert payload[3] == cls.type
         assert payload[4] == cls.version
         if payload[20] == 0:
-            return cls(0x51, 0x10, *cls.parser.unpack(payload[5:20]))
+            return cls(payload[3], payload[4], *cls.parser.unpack(payload[5:20]))
         raise NotImplementedError('need a sample')
 
-    def pack(self):
-        raise NotImplementedError("this packet comes from the device, packing not supported")
+    def frame(self) -> Tuple[Struct, tuple]:
+        if self.has_hash:
+            raise NotImplementedError('need a sample')
+        self.length = self.frame_parser.size - 6
+        return self.frame_parser, (self.preamble, self.type, self.version, self.length, self.job_id, self.chip_id,
+                                   self.core_id, self.nonce, 0, self.finalizer)
 
 
+@slotted
 @dataclass
 class RXJobResultPacket(Packet):
     type: int = 0x55
-    version: int = 0x10
     length: int = 0
     job_id: int = 0
     parser = Struct('<IB')
+    frame_parser = Struct('<3sBBIB3s')
 
     @classmethod
-    def unpack(cls, payload: bytes):
+    def unpack(cls, payload: Union[bytes, memoryview]):
         assert payload[:3] == cls.preamble
         assert payload[-3:] == cls.finalizer
         assert payload[3] == cls.type
         assert payload[4] == cls.version
-        return cls(0x55, 0x10, *cls.parser.unpack(payload[5:10]))
+        return cls(payload[3], payload[4], *cls.parser.unpack(payload[5:10]))
 
-    def pack(self):
-        raise NotImplementedError("this packet comes from the device, packing not supported")
+    def frame(self) -> Tuple[Struct, tuple]:
+        self.length = self.frame_parser.size - 6
+        return self.frame_parser, (self.preamble, self.type, self.version, self.length, self.job_id, self.finalizer)
 
 
+@slotted
 @dataclass
 class TXJobDataPacket(Packet):
     type: int = 0xA1
-    version: int = 0x10
     length: int = 0
     target: int = 0
     start_nonce: int = 0
@@ -138,110 +207,96 @@ class TXJobDataPacket(Packet):
     job_num: int = 0
     job_id: int = 0
     job_data: bytes = b''
-    parser = Struct('<BBIQQQBB')
+    parser = Struct('<3sBBIQQQBB')
+    frames: ClassVar[Dict[int, Struct]] = {}
 
     @classmethod
-    def unpack(cls, payload: bytes):
+    def unpack(cls, payload: Union[bytes, memoryview]):
         assert payload[:3] == cls.preamble
         assert payload[-3:] == cls.finalizer
         assert payload[3] == cls.type
         assert payload[4] == cls.version
-        packet = cls(*cls.parser.unpack(payload[3:35]))
-        packet.job_data = payload[35:-3]
+        packet = cls(*cls.parser.unpack(payload[:35])[1:])
+        packet.job_data = bytes(payload[35:-3])
         return packet
 
-    def pack(self):
-        self.length = len(self.job_data) + 32
-        return b''.join(
-            [self.preamble,
-             self.parser.pack(self.type, self.version, self.length, self.target, self.start_nonce, self.end_nonce,
-                              self.job_num, self.job_id),
-             self.job_data,
-             self.finalizer])
+    def frame(self) -> Tuple[Struct, tuple]:
+        frame = self.frames.get(len(self.job_data))
+        if frame is None:
+            frame = self.frames[len(self.job_data)] = Struct(f'<3sBBIQQQBB{len(self.job_data)}s3s')
+        self.length = frame.size - 6
+        return frame, (self.preamble, self.type, self.version, self.length, self.target, self.start_nonce,
+                       self.end_nonce, self.job_num, self.job_id, self.job_data, self.finalizer)
 
 
+@slotted
 @dataclass
 class TXDeviceParametersPacket(Packet):
     type: int = 0xA2
-    version: int = 0x10
     length: int = 0
     flag: int = 0
     voltage: int = 0
     freq: int = 0
     mode: int = 0
     temp: int = 0
-    parser = Struct('<BBIBHHIB')
-    QUERY = 0x52  # pylint: disable=invalid-name
-    SET = 0xA2   # pylint: disable=invalid-name
+    parser = Struct('<3sBBIBHHIB3s')
+    query_parser = Struct('<3sBBIB3s')
+    QUERY: ClassVar[int] = 0x52  # pylint: disable=invalid-name
+    SET: ClassVar[int] = 0xA2   # pylint: disable=invalid-name
 
     @classmethod
-    def unpack(cls, payload: bytes):
+    def unpack(cls, payload: Union[bytes, memoryview]):
         assert payload[:3] == cls.preamble
         assert payload[-3:] == cls.finalizer
         assert payload[3] == cls.type
         assert payload[4] == cls.version
         if payload[9] == cls.QUERY:
-            return cls(cls.type, cls.version, int.from_bytes(payload[5:8], 'little', signed=False), 0x52)
+            return cls(payload[3], payload[4], int.from_bytes(payload[5:8], 'little', signed=False), cls.QUERY)
         if payload[9] == cls.SET:
-            return cls(*cls.parser.unpack(payload[3:-3]))
+            return cls(*cls.parser.unpack(payload)[1:-1])
         raise NotImplementedError(f'{hex(payload[9])} is not a known flag')
 
-    def pack(self):
+    def frame(self) -> Tuple[Struct, tuple]:
         if self.flag == self.QUERY:
-            self.length = 7
-            return b''.join(
-                [self.preamble,
-                 self.parser.pack(self.type, self.version, self.length, self.flag, self.voltage, self.freq, self.mode,
-                                  self.temp)[:7],
-                 self.finalizer])
+            self.length = self.query_parser.size - 6
+            return self.query_parser, (self.preamble, self.type, self.version, self.length, self.flag, self.finalizer)
         if self.flag == self.SET:
-            self.length = 16
-            return b''.join(
-                [self.preamble,
-                 self.parser.pack(self.type, self.version, self.length, self.flag, self.voltage, self.freq, self.mode,
-                                  self.temp),
-                 self.finalizer])
+            self.length = self.parser.size - 6
+            return self.parser, (self.preamble, self.type, self.version, self.length, self.flag, self.voltage,
+                                 self.freq, self.mode, self.temp, self.finalizer)
         raise Exception(f'unknown flag {hex(self.flag)}')
 
 
+@slotted
 @dataclass
-class TXQueryDeviceInformationPacket(Packet):
-    type: int = 0xA4
-    version: int = 0x10
+class _TXCommandPacket(Packet):
+    # the commands with no payload, only their type tells them apart
     length: int = 6
-    parser = Struct('<BBI')
+    parser = Struct('<3sBBI3s')
 
     @classmethod
-    def unpack(cls, payload: bytes):
+    def unpack(cls, payload: Union[bytes, memoryview]):
         assert payload[:3] == cls.preamble
         assert payload[-3:] == cls.finalizer
         assert payload[3] == cls.type
         assert payload[4] == cls.version
-        return cls(*cls.parser.unpack(payload[3:-3]))
+        return cls(*cls.parser.unpack(payload)[1:-1])
 
-    def pack(self):
+    def frame(self) -> Tuple[Struct, tuple]:
         self.length = self.length or 6
-        return b''.join([self.preamble, self.parser.pack(self.type, self.version, self.length), self.finalizer])
+        return self.parser, (self.preamble, self.type, self.version, self.length, self.finalizer)
 
 
+@slotted
 @dataclass
-class TXRestartPacket(Packet):
-    type: int = 0xAC
-    version: int = 0x10
-    length: int = 6
-    parser = Struct('<BBI')
+class TXQueryDeviceInformationPacket(_TXCommandPacket):
+    type: int = 0xA4
 
-    @classmethod
-    def unpack(cls, payload: bytes):
-        assert payload[:3] == cls.preamble
-        assert payload[-3:] == cls.finalizer
-        assert payload[3] == cls.type
-        assert payload[4] == cls.version
-        return cls(*cls.parser.unpack(payload[3:-3]))
 
-    def pack(self):
-        self.length = self.length or 6
-        return b''.join([self.preamble, self.parser.pack(self.type, self.version, self.length), self.finalizer])
+@slotted
+@dataclass
+class TXRestartPacket(_TXCommandPacket):
+    type: int = 0xAC
 
 
 DESERIALIZERS: Dict[int, Type[Packet]] = {
@@ -254,3 +309,102 @@ DESERIALIZERS: Dict[int, Type[Packet]] = {
     TXQueryDeviceInformationPacket.type: TXQueryDeviceInformationPacket,
     TXRestartPacket.type: TXRestartPacket
 }
+
+
+class PacketFramer:
+    """
+    Incremental framer for the device byte stream. Chunks of any size go in, complete packets come out parsed
+    straight from a reusable buffer. Garbage and corrupt frames are skipped until the next preamble.
+    `get_buffer`/`buffer_updated` follow `asyncio.BufferedProtocol`, so reads can land on the buffer directly.
+    """
+    MIN_FRAME_SIZE = 12
+    MAX_FRAME_SIZE = 512
+    length_parser = Struct('<I')
+
+    def __init__(self, size: int = 1 << 16):
+        assert size >= 2 * self.MAX_FRAME_SIZE
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+        self.discarded = 0
+        self.errors = 0
+
+    def __len__(self):
+        return self._end - self._start
+
+    def get_buffer(self, sizehint: int = -1) -> memoryview:  # pylint: disable=unused-argument
+        if self._start:
+            pending = self._end - self._start
+            self._view[:pending] = self._view[self._start:self._end]
+            self._start, self._end = 0, pending
+        return self._view[self._end:]
+
+    def buffer_updated(self, nbytes: int):
+        self._end += nbytes
+
+    def feed(self, data: Union[bytes, memoryview]) -> Iterator[Packet]:
+        # data is all copied in right away, so packets left unconsumed stay on the buffer for the next feed
+        data = memoryview(data).cast('B')
+        free = self.get_buffer()
+        if len(free) < len(data):
+            self._grow(self._end + len(data))
+            free = self.get_buffer()
+        free[:len(data)] = data
+        self.buffer_updated(len(data))
+        return iter(self)
+
+    def _grow(self, size: int):
+        buffer = bytearray(max(size, 2 * len(self._buffer)))
+        buffer[:self._end] = self._view[:self._end]
+        self._buffer, self._view = buffer, memoryview(buffer)
+
+    def __iter__(self) -> Iterator[Packet]:
+        while True:
+            packet = self._next_packet()
+            if packet is None:
+                return
+            yield packet
+
+    def _resync(self, start: int):
+        # skips the current preamble, searching for the next from the following byte
+        self.errors += 1
+        self.discarded += 1
+        self._start = start + 1
+
+    def _next_packet(self) -> Optional[Packet]:
+        buffer, view = self._buffer, self._view
+        while self._end - self._start >= self.MIN_FRAME_SIZE:
+            start = self._start
+            found = buffer.find(Packet.preamble, start, self._end)
+            if found < 0:
+                # the tail can still be the beginning of a preamble
+                self.discarded += self._end - start - (len(Packet.preamble) - 1)
+                self._start = self._end - (len(Packet.preamble) - 1)
+                return None
+            if found > start:
+                self.discarded += found - start
+                self._start = start = found
+                continue
+            size = self.length_parser.unpack_from(buffer, start + 5)[0] + 6
+            deserializer = DESERIALIZERS.get(buffer[start + 3])
+            if deserializer is None or not self.MIN_FRAME_SIZE <= size <= self.MAX_FRAME_SIZE:
+                self._resync(start)
+                continue
+            if self._end - start < size:
+                return None
+            if view[start + size - 3:start + size] != Packet.finalizer:
+                self._resync(start)
+                continue
+            frame = view[start:start + size]
+            try:
+                packet = deserializer.unpack(frame)
+            except (AssertionError, NotImplementedError, struct.error):
+                self.errors += 1
+                self.discarded += size
+                continue
+            finally:
+                frame.release()
+                self._start = start + size
+            return packet
+        return None
@@ -0,0 +1,281 @@
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import partial
+from typing import Deque, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from aiorpcx import JSONRPC, JSONRPCConnection, JSONRPCv1, RPCError, RPCSession, connect_rs
+
+from lb1miner.capture import DIFFICULTY, EXTRANONCE, NOTIFY, CaptureWriter
+from lb1miner.device import LB1Device
+from lb1miner.metrics import METRICS
+from lb1miner.miner import BELOW_TARGET, SHARE, Job, JobTemplate, Work, diff_to_target
+from lb1miner.serialization import RXNoncePacket
+from lb1miner.verifier import VerificationPool
+
+log = logging.getLogger(__name__)
+
+
+class StratumSession(RPCSession):
+
+    def __init__(self, client: 'StratumClient', transport, **kwargs):
+        super().__init__(transport, connection=JSONRPCConnection(JSONRPCv1), **kwargs)
+        self.client = client
+        self.closed = asyncio.Event()
+
+    async def handle_request(self, request):
+        handler = self.client.handlers.get(request.method)
+        if handler is None:
+            raise RPCError(JSONRPC.METHOD_NOT_FOUND, f'unknown method "{request.method}"')
+        return await handler(*request.args)
+
+    async def connection_lost(self):
+        await super().connection_lost()
+        self.closed.set()
+
+
+class ShareFilter:
+    # remembers the last `size` nonces (keyed on job, extranonces and the 8 bytes device nonce, which carries the
+    # ntime offset) so repeats get dropped before any hashing. meant to be cleared on clean jobs
+    def __init__(self, size: int = 1 << 16):
+        self.size = size
+        self.duplicates = 0
+        self._seen: 'OrderedDict[Tuple[bytes, bytes, bytes, int], None]' = OrderedDict()
+
+    def __len__(self):
+        return len(self._seen)
+
+    def add(self, work: Work, nonce: int) -> bool:
+        key = (work.job_id, work.nonce, work.extra_nonce2, nonce)
+        if key in self._seen:
+            self._seen.move_to_end(key)
+            self.duplicates += 1
+            return False
+        self._seen[key] = None
+        if len(self._seen) > self.size:
+            self._seen.popitem(last=False)
+        return True
+
+    def clear(self):
+        self._seen.clear()
+
+
+class StratumClient:
+    """
+    Pool side of the miner: subscribes and authorizes, turns `mining.notify` into `Work` for every device
+    (built on an executor, off the event loop), keeps each device fed with fresh extranonce2 values and submits
+    the nonces that meet the pool target concurrently. Nonces for dropped jobs and repeated ones are discarded
+    before being checked, and the ones only meeting a device's hardware target are counted on `below_target`.
+    A clean job clears the devices before its work is pushed, and the time from notify to the job being written
+    to each device is kept on `notify_latency`.
+    """
+
+    def __init__(self, host: str, port: int, username: str, password: str = 'x',
+                 devices: Iterable[LB1Device] = (), executor: Optional[Executor] = None, agent: str = 'lb1miner',
+                 latency_samples: int = 1024, verifier: Optional[Union[Executor, VerificationPool]] = None,
+                 share_memory: int = 1 << 16):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.agent = agent
+        self.devices: List[LB1Device] = list(devices)
+        self.executor = executor or ThreadPoolExecutor(2, thread_name_prefix='lb1-stratum')
+        self.verifier = verifier
+        self.session: Optional[StratumSession] = None
+        self.capture: Optional[CaptureWriter] = None
+        self.handlers = {
+            'mining.notify': self.on_notify,
+            'mining.set_difficulty': self.on_set_difficulty,
+            'mining.set_extranonce': self.on_set_extranonce,
+        }
+        self.extra_nonce1 = b''
+        self.extra_nonce2_size = 4
+        self.target = diff_to_target(1)
+        self.templates: Dict[bytes, JobTemplate] = {}
+        self.template: Optional[JobTemplate] = None
+        self.notify_latency: Deque[float] = deque(maxlen=latency_samples)
+        self.shares = ShareFilter(share_memory)
+        self.accepted = 0
+        self.rejected = 0
+        self.stale = 0
+        self.invalid = 0
+        self.below_target = 0
+        self._extra_nonce2 = 0
+        self._notify_count = 0
+        self._clean_pending = False
+        self._latency_pending: Dict[LB1Device, Tuple[bytes, float]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def run(self):
+        async with connect_rs(self.host, self.port, session_factory=partial(StratumSession, self)) as session:
+            self.session = session
+            await self.subscribe()
+            await self.authorize()
+            for device in self.devices:
+                self.add_device(device)
+            try:
+                await session.closed.wait()
+            finally:
+                for task in list(self._tasks):
+                    task.cancel()
+
+    async def _send_request(self, method: str, args: list):
+        if self.session is None:
+            raise ConnectionError(f'not connected to {self.host}:{self.port}')
+        return await self.session.send_request(method, args)
+
+    def record(self, capture: CaptureWriter):
+        # captures the pool traffic and the serial traffic of every device, the ones added later included
+        self.capture = capture
+        for device in self.devices:
+            device.record(capture)
+
+    def add_device(self, device: LB1Device):
+        if device not in self.devices:
+            self.devices.append(device)
+        if self.capture is not None and device.capture is None:
+            device.record(self.capture)
+        device.on_job_sent = self._job_sent
+        device.start()
+        self._spawn(self._process_nonces(device))
+        if self.template is not None:
+            self._spawn(self._refill(device, self.template))
+
+    async def subscribe(self):
+        _, extra_nonce1, extra_nonce2_size = await self._send_request('mining.subscribe', [self.agent])
+        if self.capture is not None:
+            self.capture.write_params(EXTRANONCE, [extra_nonce1, extra_nonce2_size])
+        self.extra_nonce1 = bytes.fromhex(extra_nonce1)
+        self.extra_nonce2_size = extra_nonce2_size
+
+    async def authorize(self):
+        if not await self._send_request('mining.authorize', [self.username, self.password]):
+            raise RPCError(JSONRPC.INVALID_REQUEST, f'pool refused to authorize {self.username}')
+
+    async def on_set_difficulty(self, difficulty):
+        # as usual for stratum, applies from the next job on
+        if self.capture is not None:
+            self.capture.write_params(DIFFICULTY, [difficulty])
+        self.target = diff_to_target(difficulty)
+
+    async def on_set_extranonce(self, extra_nonce1, extra_nonce2_size):
+        if self.capture is not None:
+            self.capture.write_params(EXTRANONCE, [extra_nonce1, extra_nonce2_size])
+        self.extra_nonce1 = bytes.fromhex(extra_nonce1)
+        self.extra_nonce2_size = extra_nonce2_size
+
+    def _next_extra_nonce2(self) -> bytes:
+        self._extra_nonce2 = (self._extra_nonce2 + 1) % (1 << (8 * self.extra_nonce2_size))
+        return self._extra_nonce2.to_bytes(self.extra_nonce2_size, 'little')
+
+    def _build(self, params, extra_nonce2s: List[bytes]) -> Tuple[JobTemplate, List[Work]]:
+        template = JobTemplate.from_job(Job.from_stratum(*params), self.extra_nonce1, self.target)
+        return template, template.works(extra_nonce2s)
+
+    async def on_notify(self, *params):
+        loop = asyncio.get_running_loop()
+        received = loop.time()
+        if self.capture is not None:
+            self.capture.write_params(NOTIFY, params)
+        self._notify_count += 1
+        sequence = self._notify_count
+        # a clean job voids everything before it even when a newer job wins the build, whichever goes in clears
+        self._clean_pending = self._clean_pending or bool(params[-1])
+        extra_nonce2s = [self._next_extra_nonce2() for _ in self.devices]
+        template, works = await loop.run_in_executor(self.executor, self._build, params, extra_nonce2s)
+        if sequence != self._notify_count:
+            return  # a newer job arrived while this one was being built
+        if self._clean_pending:
+            self._clean_pending = False
+            self.templates.clear()
+            self.shares.clear()
+            for device in self.devices:
+                device.clear()
+        self.templates[template.job.job_id] = template
+        self.template = template
+        for device, work in zip(self.devices, works):
+            self._latency_pending[device] = (template.job.job_id, received)
+            self.assign(device, work)
+
+    def assign(self, device: LB1Device, work: Work):
+        device.submit(work)
+
+    def job_taken(self, device: LB1Device):
+        # the device just took a job, have the next one ready
+        if self.template is not None:
+            self._spawn(self._refill(device, self.template))
+
+    def _job_sent(self, device: LB1Device, work: Work):
+        pending = self._latency_pending.get(device)
+        if pending is not None and pending[0] == work.job_id:
+            del self._latency_pending[device]
+            self.notify_latency.append(asyncio.get_running_loop().time() - pending[1])
+        self.job_taken(device)
+
+    async def _refill(self, device: LB1Device, template: JobTemplate):
+        loop = asyncio.get_running_loop()
+        work = await loop.run_in_executor(self.executor, template.work, self._next_extra_nonce2())
+        if template is self.template:
+            self.assign(device, work)
+
+    async def _grade(self, work: Work, nonce: bytes) -> int:
+        if self.verifier is None:
+            return work.grade_nonce(nonce)
+        if isinstance(self.verifier, VerificationPool):
+            return await self.verifier.grade(work, nonce)
+        return await asyncio.get_running_loop().run_in_executor(self.verifier, work.grade_nonce, nonce)
+
+    async def _process_nonces(self, device: LB1Device):
+        # everything the device sent meanwhile gets checked together, so a verification pool can batch it
+        while True:
+            found = [await device.nonces.get()]
+            while not device.nonces.empty():
+                found.append(device.nonces.get_nowait())
+            await asyncio.gather(*(self._process_nonce(device, work, packet) for work, packet in found))
+
+    async def _process_nonce(self, device: LB1Device, work: Work, packet: RXNoncePacket):
+        if work.job_id not in self.templates:
+            self.stale += 1
+            METRICS.count('stale')
+            return
+        if not self.shares.add(work, packet.nonce):
+            METRICS.count('duplicates')
+            return
+        nonce = packet.nonce.to_bytes(8, 'little')
+        grade = await self._grade(work, nonce)
+        if grade == SHARE:
+            self._spawn(self.submit(work, nonce))
+            device.jobs.record(packet, True)
+        elif grade == BELOW_TARGET:
+            self.below_target += 1
+            METRICS.count('below_target')
+            device.jobs.record(packet, True)
+        else:
+            self.invalid += 1
+            METRICS.count('invalid')
+            device.jobs.record(packet, False)
+
+    async def submit(self, work: Work, nonce: bytes) -> bool:
+        ntime = (int.from_bytes(work.raw_data[100:104], 'little') + int.from_bytes(nonce[4:8], 'little')) & 0xffffffff
+        params = [self.username, work.job_id.hex(), work.extra_nonce2.hex(), ntime.to_bytes(4, 'big').hex(),
+                  nonce[3::-1].hex()]
+        try:
+            accepted = bool(await self._send_request('mining.submit', params))
+        except RPCError as error:
+            log.info("share rejected: %s", error)
+            accepted = False
+        if accepted:
+            self.accepted += 1
+            METRICS.count('accepted')
+        else:
+            self.rejected += 1
+            METRICS.count('rejected')
+        return accepted
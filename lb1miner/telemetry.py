@@ -0,0 +1,121 @@
+import time
+from array import array
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+from lb1miner.serialization import RXStatusPacket
+
+FIELDS = ('temp', 'voltage', 'freq', 'rpm', 'good_cores', 'tempwarn', 'fanwarn', 'powerwarn')
+# (seconds per bucket, buckets kept): raw samples, then a minute for six hours and an hour for a week
+TIERS = ((0, 256), (60, 360), (3600, 168))
+
+
+class Tier:
+    """
+    Ring of fixed size arrays holding, per bucket, the start time, the sample count and the sum, min and max of
+    every field. Buckets with a period of 0 take one sample each.
+    """
+
+    def __init__(self, period: float, capacity: int, fields: Sequence[str] = FIELDS):
+        self.period = period
+        self.capacity = capacity
+        self.times = array('d', bytes(8 * capacity))
+        self.counts = array('L', bytes(array('L').itemsize * capacity))
+        self.sums = {field: array('f', bytes(4 * capacity)) for field in fields}
+        self.mins = {field: array('f', bytes(4 * capacity)) for field in fields}
+        self.maxs = {field: array('f', bytes(4 * capacity)) for field in fields}
+        self.size = 0
+        self._head = -1
+
+    def add(self, now: float, values: Dict[str, float]):
+        start = now - now % self.period if self.period else now
+        head = self._head
+        if self.size and self.period and self.times[head] == start:
+            self.counts[head] += 1
+            for field, value in values.items():
+                self.sums[field][head] += value
+                self.mins[field][head] = min(self.mins[field][head], value)
+                self.maxs[field][head] = max(self.maxs[field][head], value)
+            return
+        head = self._head = (head + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        self.times[head] = start
+        self.counts[head] = 1
+        for field, value in values.items():
+            self.sums[field][head] = self.mins[field][head] = self.maxs[field][head] = value
+
+    def oldest(self) -> Optional[float]:
+        return self.times[self._slot(0)] if self.size else None
+
+    def _slot(self, index: int) -> int:
+        # physical position of the `index`th bucket, oldest first
+        return (self._head - self.size + 1 + index) % self.capacity
+
+    def _first(self, start: float) -> int:
+        # index of the first bucket ending after `start`, buckets are in time order so it's a binary search
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if self.times[self._slot(middle)] + self.period <= start and \
+                    (self.period or self.times[self._slot(middle)] < start):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def slots(self, start: float, end: float) -> Iterator[int]:
+        # buckets overlapping [start, end]
+        for index in range(self._first(start), self.size):
+            slot = self._slot(index)
+            if self.times[slot] > end:
+                return
+            yield slot
+
+
+class StatusHistory:
+    """
+    Fixed memory history of the status packets of one device, kept at several resolutions at once: raw samples,
+    per minute and per hour aggregates (count, sum, min and max of each field). Everything is allocated up front,
+    so a few hundred boards cost the same after a week as after a minute.
+    Window queries read the coarsest tier that still gives `MIN_BUCKETS` buckets over the window (or the finest
+    one still holding its start), so a day long `max` reads 24 hour buckets instead of the raw samples.
+    """
+    MIN_BUCKETS = 16
+
+    def __init__(self, tiers: Sequence[Tuple[float, int]] = TIERS, fields: Sequence[str] = FIELDS):
+        self.fields = tuple(fields)
+        self.tiers = [Tier(period, capacity, self.fields) for period, capacity in tiers]
+        self.last: Optional[RXStatusPacket] = None
+
+    def add(self, status: RXStatusPacket, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        values = {field: getattr(status, field) for field in self.fields}
+        for tier in self.tiers:
+            tier.add(now, values)
+        self.last = status
+
+    def tier(self, start: float, end: float) -> Tier:
+        chosen = self.tiers[0]
+        for tier in self.tiers[1:]:
+            oldest = chosen.oldest()
+            if tier.period * self.MIN_BUCKETS <= end - start or (oldest is not None and oldest > start):
+                chosen = tier
+        return chosen
+
+    def query(self, field: str, stat: str, window: float, now: Optional[float] = None) -> Optional[float]:
+        # `stat` of `field` over the last `window` seconds: one of max, min, mean or count. None when empty
+        end = time.time() if now is None else now
+        start = end - window
+        tier = self.tier(start, end)
+        slots = list(tier.slots(start, end))
+        if not slots:
+            return None
+        if stat == 'max':
+            return max(tier.maxs[field][slot] for slot in slots)
+        if stat == 'min':
+            return min(tier.mins[field][slot] for slot in slots)
+        count = sum(tier.counts[slot] for slot in slots)
+        if stat == 'count':
+            return count
+        if stat == 'mean':
+            return sum(tier.sums[field][slot] for slot in slots) / count
+        raise ValueError(f'unknown stat {stat}')
@@ -0,0 +1,168 @@
+import asyncio
+import json
+import logging
+import os
+from dataclasses import asdict, dataclass
+from itertools import product
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+from lb1miner.device import LB1Device
+from lb1miner.serialization import RXStatusPacket
+
+log = logging.getLogger(__name__)
+
+FREQS = tuple(range(600, 851, 50))
+
+
+@dataclass(frozen=True)
+class Setting:
+    freq: int
+    voltage: int
+
+
+@dataclass
+class Trial:
+    setting: Setting
+    hashrate: float
+    invalid: float
+    stable: bool
+    score: float
+
+
+def dynamic_power(setting: Setting) -> float:
+    # relative power draw of a CMOS chip, the board has no power meter
+    return setting.voltage ** 2 * setting.freq
+
+
+class TuningStore:
+    # best setting found per board serial number, on a JSON file when given a path
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.boards: Dict[str, dict] = {}
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as stored:
+                self.boards = json.load(stored)
+
+    def get(self, serial: str) -> Optional[Setting]:
+        board = self.boards.get(serial)
+        return Setting(board['freq'], board['voltage']) if board else None
+
+    def save(self, serial: str, trial: Trial):
+        self.boards[serial] = dict(asdict(trial.setting), hashrate=trial.hashrate, score=trial.score)
+        if self.path:
+            with open(self.path + '.tmp', 'w', encoding='utf-8') as stored:
+                json.dump(self.boards, stored, indent=2, sort_keys=True)
+            os.replace(self.path + '.tmp', self.path)
+
+
+class Tuner:
+    """
+    Finds the freq and voltage giving a board the most valid hashes per watt: a sweep over `freqs` at the current
+    voltage, then a hill climb over freq and voltage steps from the best one until no neighbour improves on
+    it by `min_gain`. The device has to be mining meanwhile, nonces checked by the stratum client.
+    Each setting gets `settle` seconds and then `duration` seconds of measuring the valid hashes the board returns,
+    querying its status every `STATUS_INTERVAL`. Any temperature or power warning, a good core lost or more than
+    `max_invalid` invalid nonces make the setting unstable, scoring 0. Watts come from `power`, by default the
+    dynamic power model since the board doesn't measure it.
+    The best setting is kept per serial number on `store` and applied right away on the next run.
+    """
+    FREQ_BOUNDS = (500, 900)
+    VOLTAGE_BOUNDS = (380, 480)
+    STATUS_INTERVAL = 10.0
+
+    def __init__(self, device: LB1Device, store: TuningStore, freqs: Sequence[int] = FREQS, freq_step: int = 25,
+                 voltage_step: int = 10, settle: float = 30.0, duration: float = 120.0, max_invalid: float = 0.02,
+                 min_gain: float = 0.01, power: Callable[[Setting], float] = dynamic_power):
+        self.device = device
+        self.store = store
+        self.freqs = freqs
+        self.freq_step = freq_step
+        self.voltage_step = voltage_step
+        self.settle = settle
+        self.duration = duration
+        self.max_invalid = max_invalid
+        self.min_gain = min_gain
+        self.power = power
+        self.good_cores = 0
+        self.trials: Dict[Setting, Trial] = {}
+
+    async def run(self, retune: bool = False) -> Setting:
+        information = self.device.information or await self.device.query_information()
+        serial = information.serial_number.rstrip(b'\x00').hex()
+        stored = self.store.get(serial)
+        if stored is not None and not retune:
+            await self.apply(stored)
+            return stored
+        status = await self.device.query_status()
+        self.good_cores = status.good_cores
+        initial = Setting(status.freq, status.voltage)
+        best = await self.climb(await self.sweep(initial.voltage))
+        if not best.stable:
+            log.warning("%s: no stable setting found, going back to %s", self.device.name, initial)
+            await self.apply(initial)
+            return initial
+        log.info("%s: tuned to %s, %.3f GH/s", self.device.name, best.setting, best.hashrate / 1e9)
+        self.store.save(serial, best)
+        await self.apply(best.setting)
+        return best.setting
+
+    async def apply(self, setting: Setting) -> RXStatusPacket:
+        return await self.device.set_parameters(setting.voltage, setting.freq)
+
+    async def sweep(self, voltage: int) -> Trial:
+        trials = [await self.trial(Setting(freq, voltage)) for freq in self.freqs]
+        return max(trials, key=lambda trial: trial.score)
+
+    async def climb(self, best: Trial) -> Trial:
+        while True:
+            trials = [await self.trial(setting) for setting in self.neighbours(best.setting)]
+            better = max(trials, key=lambda trial: trial.score, default=best)
+            if better.score <= best.score * (1 + self.min_gain):
+                return best
+            best = better
+
+    def neighbours(self, setting: Setting) -> List[Setting]:
+        # diagonals too: going faster usually takes more voltage, and lower voltage a lower freq
+        found = []
+        for freq_steps, voltage_steps in product((-1, 0, 1), repeat=2):
+            freq = setting.freq + freq_steps * self.freq_step
+            voltage = setting.voltage + voltage_steps * self.voltage_step
+            if (freq_steps or voltage_steps) and self.FREQ_BOUNDS[0] <= freq <= self.FREQ_BOUNDS[1] and \
+                    self.VOLTAGE_BOUNDS[0] <= voltage <= self.VOLTAGE_BOUNDS[1]:
+                found.append(Setting(freq, voltage))
+        return found
+
+    async def trial(self, setting: Setting) -> Trial:
+        if setting not in self.trials:
+            self.trials[setting] = await self.measure(setting)
+            log.debug("%s: %s", self.device.name, self.trials[setting])
+        return self.trials[setting]
+
+    async def measure(self, setting: Setting) -> Trial:
+        await self.apply(setting)
+        await asyncio.sleep(self.settle)
+        loop = asyncio.get_running_loop()
+        jobs = self.device.jobs
+        hashes, valid, invalid = jobs.valid_hashes, sum(jobs.valid.values()), sum(jobs.invalid.values())
+        started = loop.time()
+        statuses = [await self.device.query_status()]
+        while loop.time() - started < self.duration:
+            await asyncio.sleep(min(self.STATUS_INTERVAL, self.duration - (loop.time() - started)))
+            statuses.append(await self.device.query_status())
+        hashrate = (jobs.valid_hashes - hashes) / (loop.time() - started)
+        valid, invalid = sum(jobs.valid.values()) - valid, sum(jobs.invalid.values()) - invalid
+        return self.judge(setting, hashrate, invalid / max(1, valid + invalid), statuses)
+
+    def judge(self, setting: Setting, hashrate: float, invalid: float, statuses: Iterable[RXStatusPacket]) -> Trial:
+        stable = invalid <= self.max_invalid
+        for status in statuses:
+            if status.tempwarn or status.powerwarn or status.good_cores < self.good_cores:
+                stable = False
+            self.good_cores = max(self.good_cores, status.good_cores)
+        score = hashrate / self.power(setting) if stable else 0.0
+        return Trial(setting, hashrate, invalid, stable, score)
+
+
+async def tune_all(devices: Iterable[LB1Device], store: TuningStore, retune: bool = False,
+                   **kwargs) -> List[Setting]:
+    return list(await asyncio.gather(*(Tuner(device, store, **kwargs).run(retune) for device in devices)))
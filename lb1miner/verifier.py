@@ -0,0 +1,91 @@
+import asyncio
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Deque, Dict, List, Optional, Tuple
+
+from lb1miner.miner import INVALID, Work
+
+Request = Tuple[Work, bytes, asyncio.Future]
+
+
+class VerificationPool:
+    """
+    Grades nonces off the event loop for many `Work.grade_nonce` callers at once: requests queue up and go out in
+    batches to `workers` threads, grouped by work so each group is one `grade_nonces` call, hashing natively with
+    the GIL released. A batch takes whatever is queued (up to `max_batch`) as soon as a worker is free, so batches
+    stay small and quick while idle and grow with the load. Once `max_pending` requests are waiting, `grade` waits
+    for room.
+    """
+
+    def __init__(self, workers: Optional[int] = None, max_batch: int = 4096, max_pending: int = 1 << 16):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix='lb1-verify')
+        self.batches = 0
+        self.checked = 0
+        self.pending = 0
+        self._queue: Deque[Request] = deque()
+        self._busy = 0
+        self._scheduled = False
+        self._room: Optional[asyncio.Semaphore] = None  # made on first use, from the running loop
+
+    async def grade(self, work: Work, nonce: bytes) -> int:
+        if self._room is None:
+            self._room = asyncio.Semaphore(self.max_pending)
+        async with self._room:
+            loop = asyncio.get_running_loop()
+            waiter = loop.create_future()
+            self._queue.append((work, nonce, waiter))
+            self.pending += 1
+            if not self._scheduled:
+                # the requests coming in on this loop iteration all go on the same batch
+                self._scheduled = True
+                loop.call_soon(self._dispatch, loop)
+            try:
+                return await waiter
+            finally:
+                self.pending -= 1
+
+    def _dispatch(self, loop: asyncio.AbstractEventLoop):
+        self._scheduled = False
+        while self._queue and self._busy < self.workers:
+            batch = [self._queue.popleft() for _ in range(min(len(self._queue), self.max_batch))]
+            self._busy += 1
+            self.batches += 1
+            done = loop.run_in_executor(self.executor, self.verify, batch)
+            done.add_done_callback(partial(self._finish, loop, batch))
+
+    @staticmethod
+    def verify(batch: List[Request]) -> List[int]:
+        groups: Dict[int, List[int]] = {}
+        for index, (work, _, _) in enumerate(batch):
+            groups.setdefault(id(work), []).append(index)
+        results = [INVALID] * len(batch)
+        for indexes in groups.values():
+            nonces = b''.join([batch[index][1] for index in indexes])
+            for index, grade in zip(indexes, batch[indexes[0]][0].grade_nonces(nonces)):
+                results[index] = grade
+        return results
+
+    def _finish(self, loop: asyncio.AbstractEventLoop, batch: List[Request], done: asyncio.Future):
+        self._busy -= 1
+        self.checked += len(batch)
+        cancelled = done.cancelled()
+        error = None if cancelled else done.exception()
+        results = [INVALID] * len(batch) if cancelled or error is not None else done.result()
+        for (_, _, waiter), result in zip(batch, results):
+            if waiter.done():
+                continue
+            if cancelled:
+                waiter.cancel()
+            elif error is None:
+                waiter.set_result(result)
+            else:
+                waiter.set_exception(error)
+        self._dispatch(loop)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
@@ -1,149 +1,266 @@
+mod pow;
+mod ripemd160;
+mod sha256;
+mod sha512;
+mod work;
+
+use pyo3::buffer::PyBuffer;
 use pyo3::exceptions::PyValueError;
-use pyo3::prelude::{pyfunction, pymodule, wrap_pyfunction, PyModule, PyResult, Python};
+use pyo3::prelude::{pyfunction, pymodule, wrap_pyfunction, IntoPy, PyAny, PyModule, PyObject, PyResult, Python};
+use pyo3::types::PyBytes;
 use std::convert::TryInto;
-use std::mem::transmute;
 
-#[pyfunction]
-fn py_sha256_transform(payload: &[u8]) -> PyResult<[u8; 32]> {
-    if payload.len() != 64 {
+fn check_length(payload: &[u8], name: &str, length: usize) -> PyResult<()> {
+    if payload.len() != length {
+        return Err(PyValueError::new_err(format!(
+            "{} needs to be exactly {} bytes long",
+            name, length
+        )));
+    }
+    Ok(())
+}
+
+fn check_nonces_length(nonces: &[u8]) -> PyResult<()> {
+    if nonces.len() % pow::NONCE_SIZE != 0 {
         return Err(PyValueError::new_err(
-            "payload needs to be exactly 64 bytes long",
+            "nonces need to be a multiple of 8 bytes long",
         ));
     }
-    Ok(sha256_transform(payload.try_into().unwrap()))
+    Ok(())
 }
 
-const H: [u32; 8] = [
-    0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a, 0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19,
-];
-const K: [u32; 64] = [
-    0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
-    0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
-    0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
-    0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
-    0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
-    0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
-    0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
-    0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2,
-];
-
-// https://en.wikipedia.org/wiki/SHA-2
-fn sha256_transform(payload: &[u8; 64]) -> [u8; 32] {
-    let mut w: [u32; 64] = [0; 64];
-
-    for (idx, chunk) in payload.chunks(4).enumerate() {
-        w[idx] = u32::from_be_bytes(chunk.try_into().unwrap());
+// numpy arrays, bytearrays, memoryviews... anything exposing a C contiguous buffer of bytes
+fn byte_buffer(obj: &PyAny, name: &str, writable: bool) -> PyResult<PyBuffer<u8>> {
+    let buffer = PyBuffer::<u8>::get(obj)?;
+    if !buffer.is_c_contiguous() {
+        return Err(PyValueError::new_err(format!("{} needs to be C contiguous", name)));
     }
-    for idx in 16..64 {
-        let s0 = w[idx - 15];
-        let s0 = (s0 >> 7 | s0 << 25) ^ (s0 >> 18 | s0 << 14) ^ (s0 >> 3);
-        let s1 = w[idx - 2];
-        let s1 = (s1 >> 17 | s1 << 15) ^ (s1 >> 19 | s1 << 13) ^ (s1 >> 10);
-        w[idx] = w[idx - 16]
-            .wrapping_add(s0)
-            .wrapping_add(w[idx - 7])
-            .wrapping_add(s1)
+    if writable && buffer.readonly() {
+        return Err(PyValueError::new_err(format!("{} needs to be writable", name)));
     }
-    //println!("w = {:?}", w);
-
-    let mut a: u32 = H[0];
-    let mut b: u32 = H[1];
-    let mut c: u32 = H[2];
-    let mut d: u32 = H[3];
-    let mut e: u32 = H[4];
-    let mut f: u32 = H[5];
-    let mut g: u32 = H[6];
-    let mut h: u32 = H[7];
-
-    fn round(
-        a: u32,
-        b: u32,
-        c: u32,
-        _d: u32,
-        e: u32,
-        f: u32,
-        g: u32,
-        h: u32,
-        k: u32,
-        w: u32,
-    ) -> (u32, u32) {
-        let s1 = e.rotate_right(6) ^ e.rotate_right(11) ^ e.rotate_right(25);
-        let ch = (e & f) ^ (!(e) & g);
-        let temp1 = h
-            .wrapping_add(s1)
-            .wrapping_add(ch)
-            .wrapping_add(k)
-            .wrapping_add(w);
-        let s0 = a.rotate_right(2) ^ a.rotate_right(13) ^ a.rotate_right(22);
-        let maj = (a & b) ^ (a & c) ^ (b & c);
-        let temp2 = s0.wrapping_add(maj);
-        (temp1, temp2)
+    Ok(buffer)
+}
+
+fn check_disjoint(buffers: &[(&PyBuffer<u8>, &str)]) -> PyResult<()> {
+    // the slices made from these can't overlap, a mutable one aliasing any other is undefined behaviour
+    for (index, (buffer, name)) in buffers.iter().enumerate() {
+        let start = buffer.buf_ptr() as usize;
+        for (other, other_name) in &buffers[index + 1..] {
+            let other_start = other.buf_ptr() as usize;
+            if start < other_start + other.len_bytes() && other_start < start + buffer.len_bytes() {
+                return Err(PyValueError::new_err(format!("{} and {} can't overlap", name, other_name)));
+            }
+        }
     }
-    for idx in 0..64 {
-        //println!("{} = {} {} {} {} {} {} {} {}", idx, a, b, c, d, e, f, g, h);
-        let (temp1, temp2) = round(a, b, c, d, e, f, g, h, K[idx], w[idx]);
-        h = g;
-        g = f;
-        f = e;
-        e = d.wrapping_add(temp1);
-        d = c;
-        c = b;
-        b = a;
-        a = temp1.wrapping_add(temp2);
+    Ok(())
+}
+
+#[pyfunction]
+fn py_sha256_transform<'py>(py: Python<'py>, payload: &[u8]) -> PyResult<&'py PyBytes> {
+    check_length(payload, "payload", 64)?;
+    Ok(PyBytes::new(py, &sha256::sha256_transform(payload.try_into().unwrap())))
+}
+
+#[pyfunction]
+fn py_sha256_backend() -> &'static str {
+    sha256::backend()
+}
+
+#[pyfunction]
+fn py_check_nonces(py: Python<'_>, header: &[u8], nonces: &[u8], target: &[u8]) -> PyResult<Vec<usize>> {
+    check_length(header, "header", pow::HEADER_SIZE)?;
+    check_nonces_length(nonces)?;
+    check_length(target, "target", 32)?;
+    let header = header.try_into().unwrap();
+    let target = target.try_into().unwrap();
+    Ok(py.allow_threads(|| pow::check_nonces(header, nonces, target)))
+}
+
+#[pyfunction]
+fn py_check_nonces_midstate(
+    py: Python<'_>,
+    midstate: &[u8],
+    tail: &[u8],
+    nonces: &[u8],
+    target: &[u8],
+) -> PyResult<Vec<usize>> {
+    check_length(midstate, "midstate", 32)?;
+    check_length(tail, "tail", pow::TAIL_SIZE)?;
+    check_nonces_length(nonces)?;
+    check_length(target, "target", 32)?;
+    let midstate = pow::midstate_from_bytes(midstate.try_into().unwrap());
+    let tail = tail.try_into().unwrap();
+    let target = target.try_into().unwrap();
+    Ok(py.allow_threads(|| pow::check_nonces_from_midstate(&midstate, tail, nonces, target)))
+}
+
+#[pyfunction]
+fn py_hash_nonces_midstate<'py>(
+    py: Python<'py>,
+    midstate: &[u8],
+    tail: &[u8],
+    nonces: &[u8],
+) -> PyResult<&'py PyBytes> {
+    check_length(midstate, "midstate", 32)?;
+    check_length(tail, "tail", pow::TAIL_SIZE)?;
+    check_nonces_length(nonces)?;
+    let midstate = pow::midstate_from_bytes(midstate.try_into().unwrap());
+    let tail = tail.try_into().unwrap();
+    let mut hashes = vec![0u8; nonces.len() / pow::NONCE_SIZE * 32];
+    py.allow_threads(|| pow::hash_nonces_from_midstate(&midstate, tail, nonces, &mut hashes));
+    Ok(PyBytes::new(py, &hashes))
+}
+
+#[pyfunction]
+fn py_scan_nonces(
+    py: Python<'_>,
+    midstate: &[u8],
+    tail: &[u8],
+    start_nonce: u64,
+    end_nonce: u64,
+    target: &[u8],
+) -> PyResult<Vec<u64>> {
+    check_length(midstate, "midstate", 32)?;
+    check_length(tail, "tail", pow::TAIL_SIZE)?;
+    check_length(target, "target", 32)?;
+    let midstate = pow::midstate_from_bytes(midstate.try_into().unwrap());
+    let tail = tail.try_into().unwrap();
+    let target = target.try_into().unwrap();
+    Ok(py.allow_threads(|| pow::scan_nonces(&midstate, tail, start_nonce, end_nonce, target)))
+}
+
+#[pyfunction]
+fn py_hash_headers(py: Python<'_>, headers: &PyAny, target: &[u8], hashes: &PyAny, mask: &PyAny) -> PyResult<usize> {
+    check_length(target, "target", 32)?;
+    let target: &[u8; 32] = target.try_into().unwrap();
+    let headers_buffer = byte_buffer(headers, "headers", false)?;
+    let hashes_buffer = byte_buffer(hashes, "hashes", true)?;
+    let mask_buffer = byte_buffer(mask, "mask", true)?;
+    if headers_buffer.len_bytes() % pow::HEADER_SIZE != 0 {
+        return Err(PyValueError::new_err(
+            "headers need to be a multiple of 112 bytes long",
+        ));
+    }
+    let count = headers_buffer.len_bytes() / pow::HEADER_SIZE;
+    if count == 0 {
+        return Ok(0);
+    }
+    if hashes_buffer.len_bytes() != count * 32 || mask_buffer.len_bytes() != count {
+        return Err(PyValueError::new_err(format!(
+            "hashes and mask need to be {} and {} bytes long",
+            count * 32,
+            count
+        )));
+    }
+    check_disjoint(&[(&headers_buffer, "headers"), (&hashes_buffer, "hashes"), (&mask_buffer, "mask")])?;
+    // exported buffers can't be resized or freed until released, which happens when the PyBuffers drop after this
+    let (headers, hashes, mask) = unsafe {
+        (
+            std::slice::from_raw_parts(headers_buffer.buf_ptr() as *const u8, headers_buffer.len_bytes()),
+            std::slice::from_raw_parts_mut(hashes_buffer.buf_ptr() as *mut u8, count * 32),
+            std::slice::from_raw_parts_mut(mask_buffer.buf_ptr() as *mut u8, count),
+        )
+    };
+    Ok(py.allow_threads(|| pow::hash_headers(headers, target, hashes, mask)))
+}
+
+fn job_data_and_header(
+    coinbase_prefix: &[u8],
+    extra_nonce2: &[u8],
+    coinbase2: &[u8],
+    branches: Vec<&[u8]>,
+    header_prefix: &[u8],
+    header_suffix: &[u8],
+) -> PyResult<([u8; work::JOB_DATA_SIZE], [u8; pow::HEADER_SIZE])> {
+    check_length(header_prefix, "header_prefix", work::HEADER_PREFIX_SIZE)?;
+    check_length(header_suffix, "header_suffix", work::HEADER_SUFFIX_SIZE)?;
+    let mut merkle_branches: Vec<&[u8; 32]> = Vec::with_capacity(branches.len());
+    for branch in branches {
+        check_length(branch, "merkle branch", 32)?;
+        merkle_branches.push(branch.try_into().unwrap());
+    }
+    let merkle_root = work::merkle_root(coinbase_prefix, extra_nonce2, coinbase2, &merkle_branches);
+    Ok(work::encode_work(
+        header_prefix.try_into().unwrap(),
+        &merkle_root,
+        header_suffix.try_into().unwrap(),
+    ))
+}
+
+#[pyfunction]
+fn py_encode_work<'py>(
+    py: Python<'py>,
+    coinbase_prefix: &[u8],
+    extra_nonce2: &[u8],
+    coinbase2: &[u8],
+    branches: Vec<&[u8]>,
+    header_prefix: &[u8],
+    header_suffix: &[u8],
+) -> PyResult<(&'py PyBytes, &'py PyBytes)> {
+    let (job_data, header) =
+        job_data_and_header(coinbase_prefix, extra_nonce2, coinbase2, branches, header_prefix, header_suffix)?;
+    Ok((PyBytes::new(py, &job_data), PyBytes::new(py, &header)))
+}
+
+// the whole TXJobDataPacket frame and the header, the frame as bytes or written on `buffer` at `offset` (then its
+// size is returned instead)
+#[pyfunction(buffer = "None", offset = "0")]
+#[allow(clippy::too_many_arguments)]
+fn py_encode_job<'py>(
+    py: Python<'py>,
+    coinbase_prefix: &[u8],
+    extra_nonce2: &[u8],
+    coinbase2: &[u8],
+    branches: Vec<&[u8]>,
+    header_prefix: &[u8],
+    header_suffix: &[u8],
+    target: u64,
+    start_nonce: u64,
+    end_nonce: u64,
+    job_num: u8,
+    job_id: u8,
+    buffer: Option<&PyAny>,
+    offset: usize,
+) -> PyResult<(PyObject, &'py PyBytes)> {
+    let (job_data, header) =
+        job_data_and_header(coinbase_prefix, extra_nonce2, coinbase2, branches, header_prefix, header_suffix)?;
+    let header = PyBytes::new(py, &header);
+    match buffer {
+        None => {
+            let mut frame = [0u8; work::FRAME_SIZE];
+            work::encode_frame(&mut frame, target, start_nonce, end_nonce, job_num, job_id, &job_data);
+            Ok((PyBytes::new(py, &frame).into_py(py), header))
+        }
+        Some(buffer) => {
+            let buffer = byte_buffer(buffer, "buffer", true)?;
+            // the offset comes from python, so the end of the frame can't be allowed to wrap around
+            if offset.checked_add(work::FRAME_SIZE).map_or(true, |end| end > buffer.len_bytes()) {
+                return Err(PyValueError::new_err(format!(
+                    "buffer needs {} bytes from offset {}",
+                    work::FRAME_SIZE,
+                    offset
+                )));
+            }
+            // the exported buffer stays put until `buffer` drops, after the frame is written
+            let frame = unsafe {
+                std::slice::from_raw_parts_mut((buffer.buf_ptr() as *mut u8).add(offset), work::FRAME_SIZE)
+            };
+            work::encode_frame(frame, target, start_nonce, end_nonce, job_num, job_id, &job_data);
+            Ok((work::FRAME_SIZE.into_py(py), header))
+        }
     }
-    a = u32::from_be(H[0].wrapping_add(a));
-    b = u32::from_be(H[1].wrapping_add(b));
-    c = u32::from_be(H[2].wrapping_add(c));
-    d = u32::from_be(H[3].wrapping_add(d));
-    e = u32::from_be(H[4].wrapping_add(e));
-    f = u32::from_be(H[5].wrapping_add(f));
-    g = u32::from_be(H[6].wrapping_add(g));
-    h = u32::from_be(H[7].wrapping_add(h));
-    unsafe { transmute([a, b, c, d, e, f, g, h]) }
 }
 
 #[pymodule]
 fn lb1ext(_py: Python<'_>, m: &PyModule) -> PyResult<()> {
     m.add_wrapped(wrap_pyfunction!(py_sha256_transform))?;
+    m.add_wrapped(wrap_pyfunction!(py_sha256_backend))?;
+    m.add_wrapped(wrap_pyfunction!(py_check_nonces))?;
+    m.add_wrapped(wrap_pyfunction!(py_check_nonces_midstate))?;
+    m.add_wrapped(wrap_pyfunction!(py_hash_nonces_midstate))?;
+    m.add_wrapped(wrap_pyfunction!(py_scan_nonces))?;
+    m.add_wrapped(wrap_pyfunction!(py_hash_headers))?;
+    m.add_wrapped(wrap_pyfunction!(py_encode_work))?;
+    m.add_wrapped(wrap_pyfunction!(py_encode_job))?;
     Ok(())
 }
-
-#[cfg(test)]
-mod tests {
-    use super::*;
-
-    #[test]
-    fn test_vectors() {
-        let result = sha256_transform(&[0; 64]);
-        assert_eq!(
-            result,
-            [
-                0xda, 0x56, 0x98, 0xbe, 0x17, 0xb9, 0xb4, 0x69, 0x62, 0x33, 0x57, 0x99, 0x77, 0x9f,
-                0xbe, 0xca, 0x8c, 0xe5, 0xd4, 0x91, 0xc0, 0xd2, 0x62, 0x43, 0xba, 0xfe, 0xf9, 0xea,
-                0x18, 0x37, 0xa9, 0xd8
-            ]
-        );
-
-        let result = sha256_transform(&[
-            0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20, 21, 22, 23,
-            24, 25, 26, 27, 28, 29, 30, 31, 32, 33, 34, 35, 36, 37, 38, 39, 40, 41, 42, 43, 44, 45,
-            46, 47, 48, 49, 50, 51, 52, 53, 54, 55, 56, 57, 58, 59, 60, 61, 62, 63,
-        ]);
-        assert_eq!(
-            result,
-            [
-                252, 153, 162, 223, 136, 244, 42, 122, 123, 185, 209, 128, 51, 205, 198, 162, 2,
-                86, 117, 95, 157, 91, 154, 80, 68, 169, 204, 49, 90, 190, 132, 167
-            ]
-        );
-
-        let result = sha256_transform(&[255; 64]);
-        assert_eq!(
-            result,
-            [
-                239, 12, 116, 141, 244, 218, 80, 168, 214, 196, 60, 1, 62, 220, 60, 231, 108, 157,
-                159, 169, 161, 69, 138, 222, 86, 235, 134, 192, 166, 68, 146, 210
-            ]
-        );
-    }
-}
@@ -0,0 +1,251 @@
+use crate::ripemd160::ripemd160_short;
+use crate::sha256::{
+    has_avx2, has_sha_extensions, sha256, sha256_compress, sha256_compress_x8, sha256d, state_to_bytes, H,
+};
+use crate::sha512::sha512_short;
+use std::convert::TryInto;
+
+pub const HEADER_SIZE: usize = 112;
+pub const TAIL_SIZE: usize = HEADER_SIZE - 64;
+pub const NONCE_SIZE: usize = 8;
+
+/// sha256 state after compressing the first 64 bytes of the header, which don't change between nonces.
+pub fn midstate(header: &[u8; HEADER_SIZE]) -> [u32; 8] {
+    let mut state = H;
+    sha256_compress(&mut state, header[..64].try_into().unwrap());
+    state
+}
+
+pub fn midstate_from_bytes(midstate: &[u8; 32]) -> [u32; 8] {
+    let mut state = [0; 8];
+    for (word, chunk) in state.iter_mut().zip(midstate.chunks(4)) {
+        *word = u32::from_be_bytes(chunk.try_into().unwrap());
+    }
+    state
+}
+
+pub const LANES: usize = 8;
+
+// the tail and the sha256 padding for a 112 bytes message
+fn tail_block(tail: &[u8; TAIL_SIZE]) -> [u8; 64] {
+    let mut block = [0u8; 64];
+    block[..TAIL_SIZE].copy_from_slice(tail);
+    block[TAIL_SIZE] = 0x80;
+    block[56..].copy_from_slice(&((HEADER_SIZE as u64) * 8).to_be_bytes());
+    block
+}
+
+// a single padded block for messages shorter than 56 bytes
+fn short_block(payload: &[u8]) -> [u8; 64] {
+    let mut block = [0u8; 64];
+    block[..payload.len()].copy_from_slice(payload);
+    block[payload.len()] = 0x80;
+    block[56..].copy_from_slice(&((payload.len() as u64) * 8).to_be_bytes());
+    block
+}
+
+// only the last block of the first sha256 is compressed, the second one is over the 32 bytes digest
+fn header_sha256d(midstate: &[u32; 8], tail: &[u8; TAIL_SIZE]) -> [u8; 32] {
+    let mut state = *midstate;
+    sha256_compress(&mut state, &tail_block(tail));
+    sha256(&state_to_bytes(&state))
+}
+
+// sha512 and both ripemd160 of the middle step, ready to go into the final sha256d
+fn combined_ripemd160(header_hash: &[u8; 32]) -> [u8; 40] {
+    let initial_hash = sha512_short(header_hash);
+    let mut combined = [0u8; 40];
+    combined[..20].copy_from_slice(&ripemd160_short(&initial_hash[..32]));
+    combined[20..].copy_from_slice(&ripemd160_short(&initial_hash[32..]));
+    combined
+}
+
+// sha256 over each lane's 32 bytes digest
+fn sha256_digests_x8(states: &[[u32; 8]; LANES]) -> [[u32; 8]; LANES] {
+    let mut blocks = [[0u8; 64]; LANES];
+    for (block, state) in blocks.iter_mut().zip(states.iter()) {
+        *block = short_block(&state_to_bytes(state));
+    }
+    let mut digests = [H; LANES];
+    sha256_compress_x8(&mut digests, &blocks);
+    digests
+}
+
+/// `proof_of_work` of 8 headers at once, all the sha256 steps going through the multi-buffer compression.
+pub fn proof_of_work_x8(headers: &[[u8; HEADER_SIZE]; LANES]) -> [[u8; 32]; LANES] {
+    let mut states = [H; LANES];
+    let mut blocks = [[0u8; 64]; LANES];
+    for (block, header) in blocks.iter_mut().zip(headers.iter()) {
+        block.copy_from_slice(&header[..64]);
+    }
+    sha256_compress_x8(&mut states, &blocks);
+    for (block, header) in blocks.iter_mut().zip(headers.iter()) {
+        *block = tail_block(header[64..].try_into().unwrap());
+    }
+    sha256_compress_x8(&mut states, &blocks);
+    for (block, state) in blocks.iter_mut().zip(sha256_digests_x8(&states).iter()) {
+        *block = short_block(&combined_ripemd160(&state_to_bytes(state)));
+    }
+    let mut states = [H; LANES];
+    sha256_compress_x8(&mut states, &blocks);
+    let mut hashes = [[0u8; 32]; LANES];
+    for (hash, state) in hashes.iter_mut().zip(sha256_digests_x8(&states).iter()) {
+        *hash = state_to_bytes(state);
+    }
+    hashes
+}
+
+// sha256d -> sha512 -> ripemd160 of each half -> sha256d, see lbry's `PoWHash`
+pub fn proof_of_work_from_midstate(midstate: &[u32; 8], tail: &[u8; TAIL_SIZE]) -> [u8; 32] {
+    sha256d(&combined_ripemd160(&header_sha256d(midstate, tail)))
+}
+
+pub fn proof_of_work(header: &[u8; HEADER_SIZE]) -> [u8; 32] {
+    proof_of_work_from_midstate(&midstate(header), header[64..].try_into().unwrap())
+}
+
+/// Compares the little endian `hash` against the big endian `target`, same as `hash[::-1] < target` on python
+pub fn meets_target(hash: &[u8; 32], target: &[u8; 32]) -> bool {
+    hash.iter().rev().lt(target.iter())
+}
+
+/// Device nonces carry the header nonce on the lower 4 bytes and the ntime offset on the upper 4.
+/// `tail` is the header from byte 64 on, so ntime sits at 36..40 and the nonce at 44..48.
+pub fn apply_nonce(tail: &mut [u8; TAIL_SIZE], ntime: u32, nonce: &[u8]) {
+    let offset = u32::from_le_bytes(nonce[4..8].try_into().unwrap());
+    tail[36..40].copy_from_slice(&ntime.wrapping_add(offset).to_le_bytes());
+    tail[44..48].copy_from_slice(&nonce[..4]);
+}
+
+/// Returns the indexes of the 8 bytes nonces (packed together on `nonces`) whose proof of work meets `target`.
+pub fn check_nonces_from_midstate(
+    midstate: &[u32; 8],
+    tail: &[u8; TAIL_SIZE],
+    nonces: &[u8],
+    target: &[u8; 32],
+) -> Vec<usize> {
+    let ntime = u32::from_le_bytes(tail[36..40].try_into().unwrap());
+    let mut candidate = *tail;
+    nonces
+        .chunks_exact(NONCE_SIZE)
+        .enumerate()
+        .filter_map(|(idx, nonce)| {
+            apply_nonce(&mut candidate, ntime, nonce);
+            if meets_target(&proof_of_work_from_midstate(midstate, &candidate), target) {
+                Some(idx)
+            } else {
+                None
+            }
+        })
+        .collect()
+}
+
+/// Writes the 32 bytes proof of work of each 8 bytes nonce (packed together on `nonces`) to `hashes`, in order.
+pub fn hash_nonces_from_midstate(midstate: &[u32; 8], tail: &[u8; TAIL_SIZE], nonces: &[u8], hashes: &mut [u8]) {
+    let ntime = u32::from_le_bytes(tail[36..40].try_into().unwrap());
+    let mut candidate = *tail;
+    for (nonce, hash) in nonces.chunks_exact(NONCE_SIZE).zip(hashes.chunks_exact_mut(32)) {
+        apply_nonce(&mut candidate, ntime, nonce);
+        hash.copy_from_slice(&proof_of_work_from_midstate(midstate, &candidate));
+    }
+}
+
+pub fn check_nonces(header: &[u8; HEADER_SIZE], nonces: &[u8], target: &[u8; 32]) -> Vec<usize> {
+    check_nonces_from_midstate(&midstate(header), header[64..].try_into().unwrap(), nonces, target)
+}
+
+/// Searches the inclusive nonce range returning the nonces whose proof of work meets `target`.
+pub fn scan_nonces(
+    midstate: &[u32; 8],
+    tail: &[u8; TAIL_SIZE],
+    start_nonce: u64,
+    end_nonce: u64,
+    target: &[u8; 32],
+) -> Vec<u64> {
+    let ntime = u32::from_le_bytes(tail[36..40].try_into().unwrap());
+    let mut candidate = *tail;
+    (start_nonce..=end_nonce)
+        .filter(|nonce| {
+            apply_nonce(&mut candidate, ntime, &nonce.to_le_bytes());
+            meets_target(&proof_of_work_from_midstate(midstate, &candidate), target)
+        })
+        .collect()
+}
+
+/// Hashes every 112 bytes header packed on `headers`, writing the 32 bytes proof of work of each one to `hashes`
+/// and whether it meets `target` (0 or 1) to `mask`. Returns how many did.
+/// Goes 8 headers at a time over avx2 unless the SHA extensions are there, which beat it one header at a time.
+pub fn hash_headers(headers: &[u8], target: &[u8; 32], hashes: &mut [u8], mask: &mut [u8]) -> usize {
+    let mut hits = 0;
+    let mut record = |pow: &[u8; 32], hash: &mut [u8], meets: &mut u8| {
+        hash.copy_from_slice(pow);
+        *meets = meets_target(pow, target) as u8;
+        hits += *meets as usize;
+    };
+    let batched = if has_avx2() && !has_sha_extensions() {
+        headers.len() / (HEADER_SIZE * LANES) * LANES
+    } else {
+        0
+    };
+    let mut lanes = [[0u8; HEADER_SIZE]; LANES];
+    for ((chunk, hash_chunk), mask_chunk) in headers[..batched * HEADER_SIZE]
+        .chunks_exact(HEADER_SIZE * LANES)
+        .zip(hashes.chunks_exact_mut(32 * LANES))
+        .zip(mask.chunks_exact_mut(LANES))
+    {
+        for (lane, header) in lanes.iter_mut().zip(chunk.chunks_exact(HEADER_SIZE)) {
+            lane.copy_from_slice(header);
+        }
+        for ((pow, hash), meets) in proof_of_work_x8(&lanes)
+            .iter()
+            .zip(hash_chunk.chunks_exact_mut(32))
+            .zip(mask_chunk.iter_mut())
+        {
+            record(pow, hash, meets);
+        }
+    }
+    for ((header, hash), meets) in headers[batched * HEADER_SIZE..]
+        .chunks_exact(HEADER_SIZE)
+        .zip(hashes[batched * 32..].chunks_exact_mut(32))
+        .zip(mask[batched..].iter_mut())
+    {
+        record(&proof_of_work(header.try_into().unwrap()), hash, meets);
+    }
+    hits
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn test_proof_of_work_x8() {
+        let mut headers = [[0u8; HEADER_SIZE]; LANES];
+        for (lane, header) in headers.iter_mut().enumerate() {
+            for (idx, byte) in header.iter_mut().enumerate() {
+                *byte = (lane * 31 + idx * 13) as u8;
+            }
+        }
+        let hashes = proof_of_work_x8(&headers);
+        for (header, hash) in headers.iter().zip(hashes.iter()) {
+            assert_eq!(proof_of_work(header), *hash);
+        }
+        assert_eq!(
+            proof_of_work(&[0; HEADER_SIZE]),
+            sha256d(&combined_ripemd160(&sha256d(&[0; HEADER_SIZE])))
+        );
+    }
+
+    #[test]
+    fn test_hash_nonces_from_midstate() {
+        let header = [7u8; HEADER_SIZE];
+        let nonces: Vec<u8> = (0..3 * NONCE_SIZE as u8).collect();
+        let mut hashes = [0u8; 3 * 32];
+        hash_nonces_from_midstate(&midstate(&header), header[64..].try_into().unwrap(), &nonces, &mut hashes);
+        for (nonce, hash) in nonces.chunks_exact(NONCE_SIZE).zip(hashes.chunks_exact(32)) {
+            let mut candidate: [u8; TAIL_SIZE] = header[64..].try_into().unwrap();
+            apply_nonce(&mut candidate, u32::from_le_bytes(header[100..104].try_into().unwrap()), nonce);
+            assert_eq!(proof_of_work_from_midstate(&midstate(&header), &candidate), hash);
+        }
+    }
+}
@@ -0,0 +1,118 @@
+use std::convert::TryInto;
+
+const H: [u32; 5] = [0x67452301, 0xefcdab89, 0x98badcfe, 0x10325476, 0xc3d2e1f0];
+const KL: [u32; 5] = [0x00000000, 0x5a827999, 0x6ed9eba1, 0x8f1bbcdc, 0xa953fd4e];
+const KR: [u32; 5] = [0x50a28be6, 0x5c4dd124, 0x6d703ef3, 0x7a6d76e9, 0x00000000];
+const RL: [usize; 80] = [
+    0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 7, 4, 13, 1, 10, 6, 15, 3, 12, 0, 9, 5,
+    2, 14, 11, 8, 3, 10, 14, 4, 9, 15, 8, 1, 2, 7, 0, 6, 13, 11, 5, 12, 1, 9, 11, 10, 0, 8, 12, 4,
+    13, 3, 7, 15, 14, 5, 6, 2, 4, 0, 5, 9, 7, 12, 2, 10, 14, 1, 3, 8, 11, 6, 15, 13,
+];
+const RR: [usize; 80] = [
+    5, 14, 7, 0, 9, 2, 11, 4, 13, 6, 15, 8, 1, 10, 3, 12, 6, 11, 3, 7, 0, 13, 5, 10, 14, 15, 8, 12,
+    4, 9, 1, 2, 15, 5, 1, 3, 7, 14, 6, 9, 11, 8, 12, 2, 10, 0, 4, 13, 8, 6, 4, 1, 3, 11, 15, 0, 5,
+    12, 2, 13, 9, 7, 10, 14, 12, 15, 10, 4, 1, 5, 8, 7, 6, 2, 13, 14, 0, 3, 9, 11,
+];
+const SL: [u32; 80] = [
+    11, 14, 15, 12, 5, 8, 7, 9, 11, 13, 14, 15, 6, 7, 9, 8, 7, 6, 8, 13, 11, 9, 7, 15, 7, 12, 15, 9,
+    11, 7, 13, 12, 11, 13, 6, 7, 14, 9, 13, 15, 14, 8, 13, 6, 5, 12, 7, 5, 11, 12, 14, 15, 14, 15,
+    9, 8, 9, 14, 5, 6, 8, 6, 5, 12, 9, 15, 5, 11, 6, 8, 13, 12, 5, 12, 13, 14, 11, 8, 5, 6,
+];
+const SR: [u32; 80] = [
+    8, 9, 9, 11, 13, 15, 15, 5, 7, 7, 8, 11, 14, 14, 12, 6, 9, 13, 15, 7, 12, 8, 9, 11, 7, 7, 12, 7,
+    6, 15, 13, 11, 9, 7, 15, 11, 8, 6, 6, 14, 12, 13, 5, 14, 13, 13, 7, 5, 15, 5, 8, 11, 14, 14, 6,
+    14, 6, 9, 12, 9, 12, 5, 15, 8, 8, 5, 12, 9, 12, 5, 14, 6, 8, 13, 6, 5, 15, 13, 11, 11,
+];
+
+// https://homes.esat.kuleuven.be/~bosselae/ripemd160/pdf/AB-9601/AB-9601.pdf
+fn f(round: usize, x: u32, y: u32, z: u32) -> u32 {
+    match round {
+        0 => x ^ y ^ z,
+        1 => (x & y) | (!x & z),
+        2 => (x | !y) ^ z,
+        3 => (x & z) | (y & !z),
+        _ => x ^ (y | !z),
+    }
+}
+
+fn ripemd160_compress(state: &mut [u32; 5], payload: &[u8; 64]) {
+    let mut x: [u32; 16] = [0; 16];
+    for (idx, chunk) in payload.chunks(4).enumerate() {
+        x[idx] = u32::from_le_bytes(chunk.try_into().unwrap());
+    }
+
+    let [mut al, mut bl, mut cl, mut dl, mut el] = *state;
+    let [mut ar, mut br, mut cr, mut dr, mut er] = *state;
+    for idx in 0..80 {
+        let round = idx / 16;
+        let t = al
+            .wrapping_add(f(round, bl, cl, dl))
+            .wrapping_add(x[RL[idx]])
+            .wrapping_add(KL[round])
+            .rotate_left(SL[idx])
+            .wrapping_add(el);
+        al = el;
+        el = dl;
+        dl = cl.rotate_left(10);
+        cl = bl;
+        bl = t;
+
+        let t = ar
+            .wrapping_add(f(4 - round, br, cr, dr))
+            .wrapping_add(x[RR[idx]])
+            .wrapping_add(KR[round])
+            .rotate_left(SR[idx])
+            .wrapping_add(er);
+        ar = er;
+        er = dr;
+        dr = cr.rotate_left(10);
+        cr = br;
+        br = t;
+    }
+    let t = state[1].wrapping_add(cl).wrapping_add(dr);
+    state[1] = state[2].wrapping_add(dl).wrapping_add(er);
+    state[2] = state[3].wrapping_add(el).wrapping_add(ar);
+    state[3] = state[4].wrapping_add(al).wrapping_add(br);
+    state[4] = state[0].wrapping_add(bl).wrapping_add(cr);
+    state[0] = t;
+}
+
+/// RIPEMD-160 of a payload shorter than 56 bytes, which always fits a single padded block.
+pub fn ripemd160_short(payload: &[u8]) -> [u8; 20] {
+    assert!(payload.len() < 56);
+    let mut block = [0u8; 64];
+    block[..payload.len()].copy_from_slice(payload);
+    block[payload.len()] = 0x80;
+    block[56..].copy_from_slice(&((payload.len() as u64) * 8).to_le_bytes());
+
+    let mut state = H;
+    ripemd160_compress(&mut state, &block);
+    let mut result = [0; 20];
+    for (chunk, word) in result.chunks_mut(4).zip(state.iter()) {
+        chunk.copy_from_slice(&word.to_le_bytes());
+    }
+    result
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn test_vectors() {
+        assert_eq!(
+            ripemd160_short(b""),
+            [
+                0x9c, 0x11, 0x85, 0xa5, 0xc5, 0xe9, 0xfc, 0x54, 0x61, 0x28, 0x08, 0x97, 0x7e, 0xe8,
+                0xf5, 0x48, 0xb2, 0x25, 0x8d, 0x31
+            ]
+        );
+        assert_eq!(
+            ripemd160_short(b"abc"),
+            [
+                0x8e, 0xb2, 0x08, 0xf7, 0xe0, 0x5d, 0x98, 0x7a, 0x9b, 0x04, 0x4a, 0x8e, 0x98, 0xc6,
+                0xb0, 0x87, 0xf1, 0x5a, 0x0b, 0xfc
+            ]
+        );
+    }
+}
@@ -0,0 +1,394 @@
+use std::convert::TryInto;
+
+pub const H: [u32; 8] = [
+    0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a, 0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19,
+];
+const K: [u32; 64] = [
+    0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
+    0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
+    0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+    0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
+    0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
+    0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+    0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
+    0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2,
+];
+
+/// Compresses one block, with the SHA extensions when the cpu has them.
+pub fn sha256_compress(state: &mut [u32; 8], block: &[u8; 64]) {
+    #[cfg(target_arch = "x86_64")]
+    {
+        if has_sha_extensions() {
+            return unsafe { sha256_compress_shani(state, block) };
+        }
+    }
+    sha256_compress_scalar(state, block)
+}
+
+#[cfg(target_arch = "x86_64")]
+pub fn has_sha_extensions() -> bool {
+    is_x86_feature_detected!("sha") && is_x86_feature_detected!("sse4.1")
+}
+
+#[cfg(not(target_arch = "x86_64"))]
+pub fn has_sha_extensions() -> bool {
+    false
+}
+
+#[cfg(target_arch = "x86_64")]
+pub fn has_avx2() -> bool {
+    is_x86_feature_detected!("avx2")
+}
+
+#[cfg(not(target_arch = "x86_64"))]
+pub fn has_avx2() -> bool {
+    false
+}
+
+/// Which `sha256_compress` and `sha256_compress_x8` end up running on this cpu.
+pub fn backend() -> &'static str {
+    match (has_sha_extensions(), has_avx2()) {
+        (true, true) => "sha-ni+avx2",
+        (true, false) => "sha-ni",
+        (false, true) => "avx2",
+        (false, false) => "scalar",
+    }
+}
+
+// https://en.wikipedia.org/wiki/SHA-2, with the message schedule kept on a rolling 16 words window
+pub fn sha256_compress_scalar(state: &mut [u32; 8], block: &[u8; 64]) {
+    let mut w = [0u32; 16];
+    for (word, chunk) in w.iter_mut().zip(block.chunks_exact(4)) {
+        *word = u32::from_be_bytes(chunk.try_into().unwrap());
+    }
+
+    let [mut a, mut b, mut c, mut d, mut e, mut f, mut g, mut h] = *state;
+    for idx in 0..64 {
+        if idx >= 16 {
+            let w15 = w[(idx + 1) & 15];
+            let w2 = w[(idx + 14) & 15];
+            let s0 = w15.rotate_right(7) ^ w15.rotate_right(18) ^ (w15 >> 3);
+            let s1 = w2.rotate_right(17) ^ w2.rotate_right(19) ^ (w2 >> 10);
+            w[idx & 15] = w[idx & 15]
+                .wrapping_add(s0)
+                .wrapping_add(w[(idx + 9) & 15])
+                .wrapping_add(s1);
+        }
+        let s1 = e.rotate_right(6) ^ e.rotate_right(11) ^ e.rotate_right(25);
+        let ch = (e & f) ^ (!e & g);
+        let temp1 = h
+            .wrapping_add(s1)
+            .wrapping_add(ch)
+            .wrapping_add(K[idx])
+            .wrapping_add(w[idx & 15]);
+        let s0 = a.rotate_right(2) ^ a.rotate_right(13) ^ a.rotate_right(22);
+        let maj = (a & b) ^ (a & c) ^ (b & c);
+        let temp2 = s0.wrapping_add(maj);
+        h = g;
+        g = f;
+        f = e;
+        e = d.wrapping_add(temp1);
+        d = c;
+        c = b;
+        b = a;
+        a = temp1.wrapping_add(temp2);
+    }
+    for (word, value) in state.iter_mut().zip([a, b, c, d, e, f, g, h].iter()) {
+        *word = word.wrapping_add(*value);
+    }
+}
+
+// Intel's SHA extensions white paper: the state goes in as ABEF/CDGH halves, each sha256rnds2 does two rounds
+#[cfg(target_arch = "x86_64")]
+#[target_feature(enable = "sha,sse2,ssse3,sse4.1")]
+unsafe fn sha256_compress_shani(state: &mut [u32; 8], block: &[u8; 64]) {
+    use std::arch::x86_64::*;
+
+    let byteswap = _mm_set_epi64x(0x0c0d0e0f08090a0b, 0x0405060700010203);
+    let dcba = _mm_shuffle_epi32(_mm_loadu_si128(state.as_ptr() as *const __m128i), 0xB1);
+    let efgh = _mm_shuffle_epi32(_mm_loadu_si128(state.as_ptr().add(4) as *const __m128i), 0x1B);
+    let mut abef = _mm_alignr_epi8(dcba, efgh, 8);
+    let mut cdgh = _mm_blend_epi16(efgh, dcba, 0xF0);
+    let (abef_start, cdgh_start) = (abef, cdgh);
+
+    let mut msg = [_mm_setzero_si128(); 4];
+    for (idx, word) in msg.iter_mut().enumerate() {
+        *word = _mm_shuffle_epi8(
+            _mm_loadu_si128(block.as_ptr().add(16 * idx) as *const __m128i),
+            byteswap,
+        );
+    }
+    for group in 0..16 {
+        if group >= 4 {
+            // w[i..i+4] from w[i-16..], w[i-12..], w[i-7..] and w[i-4..]
+            let previous = msg[(group + 3) & 3];
+            let w7 = _mm_alignr_epi8(previous, msg[(group + 2) & 3], 4);
+            let sum = _mm_add_epi32(_mm_sha256msg1_epu32(msg[group & 3], msg[(group + 1) & 3]), w7);
+            msg[group & 3] = _mm_sha256msg2_epu32(sum, previous);
+        }
+        let k = _mm_loadu_si128(K.as_ptr().add(4 * group) as *const __m128i);
+        let words = _mm_add_epi32(msg[group & 3], k);
+        cdgh = _mm_sha256rnds2_epu32(cdgh, abef, words);
+        abef = _mm_sha256rnds2_epu32(abef, cdgh, _mm_shuffle_epi32(words, 0x0E));
+    }
+
+    let feba = _mm_shuffle_epi32(_mm_add_epi32(abef, abef_start), 0x1B);
+    let dchg = _mm_shuffle_epi32(_mm_add_epi32(cdgh, cdgh_start), 0xB1);
+    _mm_storeu_si128(state.as_mut_ptr() as *mut __m128i, _mm_blend_epi16(feba, dchg, 0xF0));
+    _mm_storeu_si128(state.as_mut_ptr().add(4) as *mut __m128i, _mm_alignr_epi8(dchg, feba, 8));
+}
+
+// One u32 per buffer, so every operation over the lanes maps to a single vector instruction
+#[derive(Clone, Copy)]
+struct Lanes<const N: usize>([u32; N]);
+
+impl<const N: usize> Lanes<N> {
+    #[inline(always)]
+    fn splat(value: u32) -> Self {
+        Lanes([value; N])
+    }
+
+    #[inline(always)]
+    fn map(mut self, op: impl Fn(u32) -> u32) -> Self {
+        for value in self.0.iter_mut() {
+            *value = op(*value);
+        }
+        self
+    }
+
+    #[inline(always)]
+    fn zip(mut self, other: Self, op: impl Fn(u32, u32) -> u32) -> Self {
+        for (value, other) in self.0.iter_mut().zip(other.0.iter()) {
+            *value = op(*value, *other);
+        }
+        self
+    }
+
+    #[inline(always)]
+    fn add(self, other: Self) -> Self {
+        self.zip(other, u32::wrapping_add)
+    }
+
+    #[inline(always)]
+    fn xor(self, other: Self) -> Self {
+        self.zip(other, |x, y| x ^ y)
+    }
+
+    #[inline(always)]
+    fn and(self, other: Self) -> Self {
+        self.zip(other, |x, y| x & y)
+    }
+
+    #[inline(always)]
+    fn and_not(self, other: Self) -> Self {
+        self.zip(other, |x, y| !x & y)
+    }
+
+    #[inline(always)]
+    fn rotr(self, count: u32) -> Self {
+        self.map(|x| x.rotate_right(count))
+    }
+
+    #[inline(always)]
+    fn shr(self, count: u32) -> Self {
+        self.map(|x| x >> count)
+    }
+}
+
+#[inline(always)]
+fn sha256_compress_lanes<const N: usize>(states: &mut [[u32; 8]; N], blocks: &[[u8; 64]; N]) {
+    let mut w = [Lanes::<N>::splat(0); 16];
+    for (idx, word) in w.iter_mut().enumerate() {
+        for (lane, block) in blocks.iter().enumerate() {
+            word.0[lane] = u32::from_be_bytes(block[4 * idx..4 * idx + 4].try_into().unwrap());
+        }
+    }
+    let mut v = [Lanes::<N>::splat(0); 8];
+    for (idx, word) in v.iter_mut().enumerate() {
+        for (lane, state) in states.iter().enumerate() {
+            word.0[lane] = state[idx];
+        }
+    }
+
+    let [mut a, mut b, mut c, mut d, mut e, mut f, mut g, mut h] = v;
+    for idx in 0..64 {
+        if idx >= 16 {
+            let w15 = w[(idx + 1) & 15];
+            let w2 = w[(idx + 14) & 15];
+            let s0 = w15.rotr(7).xor(w15.rotr(18)).xor(w15.shr(3));
+            let s1 = w2.rotr(17).xor(w2.rotr(19)).xor(w2.shr(10));
+            w[idx & 15] = w[idx & 15].add(s0).add(w[(idx + 9) & 15]).add(s1);
+        }
+        let s1 = e.rotr(6).xor(e.rotr(11)).xor(e.rotr(25));
+        let ch = e.and(f).xor(e.and_not(g));
+        let temp1 = h.add(s1).add(ch).add(Lanes::splat(K[idx])).add(w[idx & 15]);
+        let s0 = a.rotr(2).xor(a.rotr(13)).xor(a.rotr(22));
+        let maj = a.and(b).xor(a.and(c)).xor(b.and(c));
+        let temp2 = s0.add(maj);
+        h = g;
+        g = f;
+        f = e;
+        e = d.add(temp1);
+        d = c;
+        c = b;
+        b = a;
+        a = temp1.add(temp2);
+    }
+    for (idx, word) in [a, b, c, d, e, f, g, h].iter().enumerate() {
+        for (lane, state) in states.iter_mut().enumerate() {
+            state[idx] = state[idx].wrapping_add(word.0[lane]);
+        }
+    }
+}
+
+#[cfg(target_arch = "x86_64")]
+#[target_feature(enable = "avx2")]
+unsafe fn sha256_compress_lanes_avx2<const N: usize>(states: &mut [[u32; 8]; N], blocks: &[[u8; 64]; N]) {
+    sha256_compress_lanes(states, blocks)
+}
+
+// llvm only vectorizes the lanes with avx2 around, otherwise one block after the other is faster
+fn sha256_compress_many<const N: usize>(states: &mut [[u32; 8]; N], blocks: &[[u8; 64]; N]) {
+    #[cfg(target_arch = "x86_64")]
+    {
+        if has_avx2() {
+            return unsafe { sha256_compress_lanes_avx2(states, blocks) };
+        }
+    }
+    for (state, block) in states.iter_mut().zip(blocks.iter()) {
+        sha256_compress(state, block);
+    }
+}
+
+/// Compresses 4 independent blocks at once, one per state.
+pub fn sha256_compress_x4(states: &mut [[u32; 8]; 4], blocks: &[[u8; 64]; 4]) {
+    sha256_compress_many(states, blocks)
+}
+
+/// Compresses 8 independent blocks at once, one per state.
+pub fn sha256_compress_x8(states: &mut [[u32; 8]; 8], blocks: &[[u8; 64]; 8]) {
+    sha256_compress_many(states, blocks)
+}
+
+pub fn state_to_bytes(state: &[u32; 8]) -> [u8; 32] {
+    let mut result = [0; 32];
+    for (chunk, word) in result.chunks_mut(4).zip(state.iter()) {
+        chunk.copy_from_slice(&word.to_be_bytes());
+    }
+    result
+}
+
+pub fn sha256_transform(payload: &[u8; 64]) -> [u8; 32] {
+    let mut state = H;
+    sha256_compress(&mut state, payload);
+    state_to_bytes(&state)
+}
+
+pub fn sha256(payload: &[u8]) -> [u8; 32] {
+    let mut state = H;
+    let mut chunks = payload.chunks_exact(64);
+    for chunk in &mut chunks {
+        sha256_compress(&mut state, chunk.try_into().unwrap());
+    }
+    let remainder = chunks.remainder();
+    let mut block = [0u8; 128];
+    block[..remainder.len()].copy_from_slice(remainder);
+    block[remainder.len()] = 0x80;
+    let end = if remainder.len() < 56 { 64 } else { 128 };
+    block[end - 8..end].copy_from_slice(&((payload.len() as u64) * 8).to_be_bytes());
+    for chunk in block[..end].chunks_exact(64) {
+        sha256_compress(&mut state, chunk.try_into().unwrap());
+    }
+    state_to_bytes(&state)
+}
+
+pub fn sha256d(payload: &[u8]) -> [u8; 32] {
+    sha256(&sha256(payload))
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn test_vectors() {
+        let result = sha256_transform(&[0; 64]);
+        assert_eq!(
+            result,
+            [
+                0xda, 0x56, 0x98, 0xbe, 0x17, 0xb9, 0xb4, 0x69, 0x62, 0x33, 0x57, 0x99, 0x77, 0x9f,
+                0xbe, 0xca, 0x8c, 0xe5, 0xd4, 0x91, 0xc0, 0xd2, 0x62, 0x43, 0xba, 0xfe, 0xf9, 0xea,
+                0x18, 0x37, 0xa9, 0xd8
+            ]
+        );
+
+        let result = sha256_transform(&[
+            0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20, 21, 22, 23,
+            24, 25, 26, 27, 28, 29, 30, 31, 32, 33, 34, 35, 36, 37, 38, 39, 40, 41, 42, 43, 44, 45,
+            46, 47, 48, 49, 50, 51, 52, 53, 54, 55, 56, 57, 58, 59, 60, 61, 62, 63,
+        ]);
+        assert_eq!(
+            result,
+            [
+                252, 153, 162, 223, 136, 244, 42, 122, 123, 185, 209, 128, 51, 205, 198, 162, 2,
+                86, 117, 95, 157, 91, 154, 80, 68, 169, 204, 49, 90, 190, 132, 167
+            ]
+        );
+
+        let result = sha256_transform(&[255; 64]);
+        assert_eq!(
+            result,
+            [
+                239, 12, 116, 141, 244, 218, 80, 168, 214, 196, 60, 1, 62, 220, 60, 231, 108, 157,
+                159, 169, 161, 69, 138, 222, 86, 235, 134, 192, 166, 68, 146, 210
+            ]
+        );
+    }
+
+    #[test]
+    fn test_backends() {
+        let mut blocks = [[0u8; 64]; 8];
+        let mut states = [H; 8];
+        for (lane, (block, state)) in blocks.iter_mut().zip(states.iter_mut()).enumerate() {
+            for (idx, byte) in block.iter_mut().enumerate() {
+                *byte = (lane * 64 + idx * 7) as u8;
+            }
+            state[lane] ^= 0x5a5a5a5a;
+        }
+        let mut expected = states;
+        for (state, block) in expected.iter_mut().zip(blocks.iter()) {
+            sha256_compress_scalar(state, block);
+        }
+        let mut single = states;
+        for (state, block) in single.iter_mut().zip(blocks.iter()) {
+            sha256_compress(state, block);
+        }
+        assert_eq!(single, expected);
+        let mut x8 = states;
+        sha256_compress_x8(&mut x8, &blocks);
+        assert_eq!(x8, expected);
+        let mut x4 = [states[0], states[1], states[2], states[3]];
+        sha256_compress_x4(&mut x4, &[blocks[0], blocks[1], blocks[2], blocks[3]]);
+        assert_eq!(x4[..], expected[..4]);
+    }
+
+    #[test]
+    fn test_digest() {
+        assert_eq!(
+            sha256(b"abc"),
+            [
+                0xba, 0x78, 0x16, 0xbf, 0x8f, 0x01, 0xcf, 0xea, 0x41, 0x41, 0x40, 0xde, 0x5d, 0xae,
+                0x22, 0x23, 0xb0, 0x03, 0x61, 0xa3, 0x96, 0x17, 0x7a, 0x9c, 0xb4, 0x10, 0xff, 0x61,
+                0xf2, 0x00, 0x15, 0xad
+            ]
+        );
+        assert_eq!(
+            sha256(&[]),
+            [
+                0xe3, 0xb0, 0xc4, 0x42, 0x98, 0xfc, 0x1c, 0x14, 0x9a, 0xfb, 0xf4, 0xc8, 0x99, 0x6f,
+                0xb9, 0x24, 0x27, 0xae, 0x41, 0xe4, 0x64, 0x9b, 0x93, 0x4c, 0xa4, 0x95, 0x99, 0x1b,
+                0x78, 0x52, 0xb8, 0x55
+            ]
+        );
+    }
+}
@@ -0,0 +1,119 @@
+use crate::sha256;
+use std::convert::TryInto;
+
+pub const HEADER_PREFIX_SIZE: usize = 36;
+pub const HEADER_SUFFIX_SIZE: usize = 44;
+pub const JOB_DATA_SIZE: usize = 136;
+// preamble, type, version, length, target, start and end nonces, job number and job id
+pub const FRAME_PREFIX_SIZE: usize = 35;
+pub const FRAME_SIZE: usize = FRAME_PREFIX_SIZE + JOB_DATA_SIZE + 3;
+
+const PREAMBLE: [u8; 3] = [0xa5, 0x3c, 0x96];
+const FINALIZER: [u8; 3] = [0x69, 0xc3, 0x5a];
+const JOB_DATA_TYPE: u8 = 0xa1;
+const VERSION: u8 = 0x10;
+
+/// Same as `JobTemplate.merkle_root` on python: the coinbase hashed up through the branches.
+pub fn merkle_root(
+    coinbase_prefix: &[u8],
+    extra_nonce2: &[u8],
+    coinbase2: &[u8],
+    branches: &[&[u8; 32]],
+) -> [u8; 32] {
+    let mut coinbase =
+        Vec::with_capacity(coinbase_prefix.len() + extra_nonce2.len() + coinbase2.len());
+    coinbase.extend_from_slice(coinbase_prefix);
+    coinbase.extend_from_slice(extra_nonce2);
+    coinbase.extend_from_slice(coinbase2);
+    let mut root = sha256::sha256d(&coinbase);
+    let mut pair = [0u8; 64];
+    for branch in branches {
+        pair[..32].copy_from_slice(&root);
+        pair[32..].copy_from_slice(*branch);
+        root = sha256::sha256d(&pair);
+    }
+    root
+}
+
+/// The 112 bytes header to verify nonces against and the 136 bytes of job data the device takes: midstate of the
+/// first 64 header bytes, the other 48 and zero padding.
+pub fn encode_work(
+    header_prefix: &[u8; HEADER_PREFIX_SIZE],
+    merkle_root: &[u8; 32],
+    header_suffix: &[u8; HEADER_SUFFIX_SIZE],
+) -> ([u8; JOB_DATA_SIZE], [u8; 112]) {
+    let mut header = [0u8; 112];
+    header[..HEADER_PREFIX_SIZE].copy_from_slice(header_prefix);
+    header[HEADER_PREFIX_SIZE..HEADER_PREFIX_SIZE + 32].copy_from_slice(merkle_root);
+    header[HEADER_PREFIX_SIZE + 32..].copy_from_slice(header_suffix);
+    let mut job_data = [0u8; JOB_DATA_SIZE];
+    job_data[..32].copy_from_slice(&sha256::sha256_transform(header[..64].try_into().unwrap()));
+    job_data[32..80].copy_from_slice(&header[64..]);
+    (job_data, header)
+}
+
+/// Writes a whole `TXJobDataPacket` frame, same layout as its python `frame()`.
+pub fn encode_frame(
+    frame: &mut [u8],
+    target: u64,
+    start_nonce: u64,
+    end_nonce: u64,
+    job_num: u8,
+    job_id: u8,
+    job_data: &[u8; JOB_DATA_SIZE],
+) {
+    frame[..3].copy_from_slice(&PREAMBLE);
+    frame[3] = JOB_DATA_TYPE;
+    frame[4] = VERSION;
+    frame[5..9].copy_from_slice(&((FRAME_SIZE - 6) as u32).to_le_bytes());
+    frame[9..17].copy_from_slice(&target.to_le_bytes());
+    frame[17..25].copy_from_slice(&start_nonce.to_le_bytes());
+    frame[25..33].copy_from_slice(&end_nonce.to_le_bytes());
+    frame[33] = job_num;
+    frame[34] = job_id;
+    frame[FRAME_PREFIX_SIZE..FRAME_PREFIX_SIZE + JOB_DATA_SIZE].copy_from_slice(job_data);
+    frame[FRAME_PREFIX_SIZE + JOB_DATA_SIZE..FRAME_SIZE].copy_from_slice(&FINALIZER);
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn test_encode_frame() {
+        let (job_data, header) =
+            encode_work(&[1; HEADER_PREFIX_SIZE], &[2; 32], &[3; HEADER_SUFFIX_SIZE]);
+        assert_eq!(&header[..36], &[1; 36][..]);
+        assert_eq!(&header[36..68], &[2; 32][..]);
+        assert_eq!(&header[68..], &[3; 44][..]);
+        assert_eq!(
+            job_data[..32],
+            sha256::sha256_transform(header[..64].try_into().unwrap())
+        );
+        assert_eq!(&job_data[32..80], &header[64..]);
+        assert_eq!(&job_data[80..], &[0; 56][..]);
+        let mut frame = [0u8; FRAME_SIZE];
+        encode_frame(&mut frame, 0x33333333, 0, 0xffffffff, 1, 20, &job_data);
+        assert_eq!(
+            &frame[..35],
+            &[
+                0xa5, 0x3c, 0x96, 0xa1, 0x10, 0xa8, 0, 0, 0, 0x33, 0x33, 0x33, 0x33, 0, 0, 0, 0, 0,
+                0, 0, 0, 0, 0, 0, 0, 0xff, 0xff, 0xff, 0xff, 0, 0, 0, 0, 1, 20
+            ][..]
+        );
+        assert_eq!(&frame[FRAME_SIZE - 3..], &FINALIZER[..]);
+    }
+
+    #[test]
+    fn test_merkle_root() {
+        let branch = [7u8; 32];
+        let root = merkle_root(b"ab", b"cd", b"ef", &[&branch]);
+        let mut pair = sha256::sha256d(b"abcdef").to_vec();
+        pair.extend_from_slice(&branch);
+        assert_eq!(root, sha256::sha256d(&pair));
+        assert_eq!(
+            merkle_root(b"ab", b"cd", b"ef", &[]),
+            sha256::sha256d(b"abcdef")
+        );
+    }
+}
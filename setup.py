@@ -18,5 +18,8 @@ setup(
     install_requires=[
         'aiorpcX==0.18.7'
     ],
+    entry_points={
+        'console_scripts': ['lb1miner=lb1miner.cli:main'],
+    },
     zip_safe=False,
 )
@@ -0,0 +1,93 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from lb1miner.capture import DIFFICULTY, EXTRANONCE, MAGIC, NOTIFY, SERIAL_RX, SERIAL_TX, CaptureReader, \
+    CaptureWriter, replay
+from tests.test_emulator import emulated
+from tests.test_device import STATUS, nonce
+from tests.test_miner import STRATUM_PARAMS
+from lb1miner.miner import Job, JobTemplate, Work, diff_to_target
+
+
+class TestCapture(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'capture.lb1')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_entries(self):
+        capture = CaptureWriter(self.path)
+        capture.write_params(NOTIFY, STRATUM_PARAMS)
+        capture.write(SERIAL_RX, capture.stream(), STATUS)
+        capture.close()
+        # appending goes on after the existing entries
+        capture = CaptureWriter(self.path)
+        capture.write(SERIAL_RX, 1, STATUS[:10])
+        capture.close()
+        with open(self.path, 'rb') as written:
+            self.assertEqual(MAGIC, written.read(len(MAGIC)))
+        reader = CaptureReader(self.path)
+        entries = [(kind, stream, bytes(payload)) for _, kind, stream, payload in reader]
+        self.assertEqual([NOTIFY, SERIAL_RX, SERIAL_RX], [kind for kind, _, _ in entries])
+        self.assertEqual((1, STATUS), entries[1][1:])
+        self.assertEqual(STATUS[:10], entries[2][2])
+        reader.close()
+        # a torn last entry is left out
+        with open(self.path, 'ab') as written:
+            written.write(CaptureWriter.entry_parser.pack(0, SERIAL_RX, 1, 100) + STATUS)
+        reader = CaptureReader(self.path)
+        self.assertEqual(3, len(list(reader)))
+        reader.close()
+        with open(self.path, 'wb') as written:
+            written.write(b'not a capture')
+        with self.assertRaises(ValueError):
+            CaptureReader(self.path)
+
+    def test_replay_targets(self):
+        # the nonce of the fake board meets difficulty 5 but not 262144
+        template = JobTemplate.from_job(Job.from_stratum(*STRATUM_PARAMS), bytes.fromhex('485fd81a'), diff_to_target(5))
+        capture = CaptureWriter(self.path)
+        stream = capture.stream()
+        capture.write_params(DIFFICULTY, [5])
+        capture.write_params(NOTIFY, STRATUM_PARAMS)
+        capture.write_params(DIFFICULTY, [262144])  # for the next job, no extranonce needed to tell
+        capture.write(SERIAL_TX, stream, template.encode_job(bytes(4), 0x33333333, job_id=1)[0])
+        capture.write(SERIAL_RX, stream, nonce(1))
+        # only the coinbase changes: the same header suffix, so the jobs can't be told apart on the serial side and
+        # the target of the latest notify goes for both
+        capture.write_params(NOTIFY, ['a30a', *STRATUM_PARAMS[1:]])
+        capture.write(SERIAL_TX, stream, template.encode_job(bytes(4), 0x33333333, job_id=2)[0])
+        capture.write(SERIAL_RX, stream, nonce(2) + nonce(3))
+        capture.close()
+        found, _ = replay(self.path)
+        self.assertEqual((1, 1, 0, 1), (found['shares'], found['below_target'], found['invalid'], found['unknown_job']))
+
+    @emulated(hit_difficulty=2 ** -24, chunk_size=256)
+    async def test_replay(self):
+        capture = CaptureWriter(self.path)
+        self.device.record(capture)
+        capture.write_params(EXTRANONCE, ['485fd81a', 4])
+        capture.write_params(DIFFICULTY, [2 ** -24])
+        capture.write_params(NOTIFY, STRATUM_PARAMS)
+        capture.write_params(DIFFICULTY, [2 ** 40])  # only for the jobs after this one
+        self.device.start()
+        self.device.submit(Work.from_job(Job.from_stratum(*STRATUM_PARAMS), bytes.fromhex("485fd81a"), bytes(4),
+                                         diff_to_target(5)), 0, 1023)
+        for _ in range(100):
+            if self.device.acks and not self.board.jobs:
+                break
+            await asyncio.sleep(0.01)
+        for _ in range(self.board.sent_nonces):
+            await asyncio.wait_for(self.device.nonces.get(), 1)
+        capture.close()
+        found, elapsed = replay(self.path)
+        self.assertGreater(elapsed, 0)
+        self.assertEqual((1, 2, 1), (found['notify'], found['difficulty'], found['extranonce']))
+        self.assertEqual((1, 1), (found['TXJobDataPacket'], found['RXJobResultPacket']))
+        self.assertGreater(self.board.sent_nonces, 0)
+        self.assertEqual(self.board.sent_nonces, found['RXNoncePacket'])
+        self.assertEqual(self.board.sent_nonces, found['shares'])
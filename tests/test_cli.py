@@ -0,0 +1,40 @@
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from lb1miner.cli import main
+from tests.test_device import INFORMATION, STATUS, job_result
+
+
+class TestCLI(unittest.TestCase):
+    def test_lazy_imports(self):
+        loaded = subprocess.run(
+            [sys.executable, '-c', 'import sys, lb1miner.cli; modules = ("asyncio", "lb1ext", "numpy", "aiorpcx", '
+                                   '"lb1miner.miner"); print(*(name for name in modules if name in sys.modules))'],
+            capture_output=True, check=True, text=True, env=dict(os.environ)).stdout.split()
+        self.assertEqual([], loaded)
+        loaded = subprocess.run(
+            [sys.executable, '-c', 'import sys, lb1miner.device; '
+                                   'print(*(name for name in ("numpy", "aiorpcx") if name in sys.modules))'],
+            capture_output=True, check=True, text=True, env=dict(os.environ)).stdout.split()
+        self.assertEqual([], loaded)  # what probe loads
+
+    def test_replay(self):
+        with tempfile.NamedTemporaryFile() as capture:
+            capture.write((STATUS + INFORMATION + job_result(3) * 2) * 10)
+            capture.flush()
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                self.assertEqual(0, main(['replay', capture.name, '--chunk', '7']))
+        self.assertIn('RXJobResultPacket: 20', output.getvalue())
+        self.assertIn('RXStatusPacket: 10', output.getvalue())
+
+    def test_bench(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.assertEqual(0, main(['bench', '--nonces', '4096', '--workers', '1']))
+        self.assertIn('kH/s', output.getvalue())
@@ -0,0 +1,30 @@
+import asyncio
+from unittest import TestCase
+
+from lb1miner.cpu import CPUMiner
+from lb1miner.miner import Job, Work
+from tests.test_miner import STRATUM_PARAMS
+
+
+class TestCPUMiner(TestCase):
+    def setUp(self):
+        self.work = Work.from_job(Job.from_stratum(*STRATUM_PARAMS), bytes.fromhex("485fd81a"), bytes(4),
+                                  bytes.fromhex('0000000033333333' + 'ff' * 24))
+        self.miner = CPUMiner(workers=2, chunk_size=16)
+        self.addCleanup(self.miner.close)
+
+    def test_scan(self):
+        nonce = int.from_bytes(bytes.fromhex('1e0cb44802000000'), 'little')
+        hits = self.miner.scan(self.work, nonce - 40, nonce + 40, job_id=0x12)
+        self.assertIn(nonce, [hit.nonce for hit in hits])
+        for hit in hits:
+            self.assertEqual(hit.job_id, 0x12)
+            self.assertIn(hit.chip_id, (0, 1))
+            self.assertTrue(self.work.check_nonce(hit.nonce.to_bytes(8, 'little')))
+        self.assertEqual(self.miner.hashes, 81)
+        self.assertGreater(self.miner.hashrate, 0)
+
+    def test_scan_async(self):
+        nonce = int.from_bytes(bytes.fromhex('1e0cb44802000000'), 'little')
+        hits = asyncio.run(self.miner.scan_async(self.work, nonce, nonce))
+        self.assertEqual([nonce], [hit.nonce for hit in hits])
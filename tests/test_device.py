@@ -0,0 +1,197 @@
+import asyncio
+import functools
+import os
+import socket
+import termios
+import unittest
+from unittest import mock
+
+from lb1miner.device import HashrateMeter, JobIndex, LB1Device
+from lb1miner.miner import Job, Work, diff_to_target, expected_hashes
+from lb1miner.serialization import PacketFramer, RXNoncePacket, TXDeviceParametersPacket, TXJobDataPacket, \
+    TXQueryDeviceInformationPacket
+from tests.test_miner import STRATUM_PARAMS
+
+INFORMATION = bytes.fromhex('a53c965410360000000d476f6c647368656c6c2d4c423100000005302e302e3100'
+                            '00000f4a4a4a4a4a4a4a4a4a4a4a4a4a4a4a00006d31000869c35a')
+STATUS = bytes.fromhex('a53c9652101b000000087878203c00ae01ee02000000003f00000000fc0869c35a')
+
+
+def job_result(job_id):
+    return bytes.fromhex('a53c965510070000') + bytes([0, job_id]) + bytes.fromhex('69c35a')
+
+
+def nonce(job_id):
+    return bytes.fromhex('a53c965110120000') + bytes([0, job_id, 2, 5]) + bytes.fromhex('1e0cb44802000000') + \
+        bytes.fromhex('0069c35a')
+
+
+class FakeBoard:
+    def __init__(self, sock):
+        self.sock = sock
+        self.jobs = []
+
+    async def run(self):
+        reader, writer = await asyncio.open_connection(sock=self.sock)
+        framer = PacketFramer()
+        while True:
+            try:
+                data = await reader.read(4096)
+            except ConnectionError:  # reset or broken pipe, the device went away as the test ended
+                data = b''
+            if not data:
+                writer.close()
+                return
+            for packet in framer.feed(data):
+                if isinstance(packet, TXQueryDeviceInformationPacket):
+                    writer.write(INFORMATION)
+                elif isinstance(packet, TXDeviceParametersPacket):
+                    writer.write(STATUS)
+                elif isinstance(packet, TXJobDataPacket):
+                    self.jobs.append(packet)
+                    writer.write(job_result(packet.job_id) + nonce(packet.job_id))
+
+
+def with_device(test):
+    @functools.wraps(test)
+    def wrapper(self):
+        async def run():
+            host, board = socket.socketpair()
+            self.board = FakeBoard(board)
+            board_task = asyncio.create_task(self.board.run())
+            self.device = await LB1Device.connect(host, hashrate=1e6, name='test')
+            try:
+                await test(self)
+            finally:
+                await self.device.close()
+                await board_task
+        asyncio.run(run())
+    return wrapper
+
+
+class TestLB1Device(unittest.TestCase):
+    def setUp(self):
+        self.work = Work.from_job(Job.from_stratum(*STRATUM_PARAMS), bytes.fromhex("485fd81a"), bytes(4),
+                                  diff_to_target(5))
+
+    @with_device
+    async def test_queries(self):
+        information = await self.device.query_information()
+        self.assertEqual(8, information.work_depth)
+        self.assertEqual(8, self.device.work_depth)
+        status = await self.device.query_status()
+        self.assertEqual(750, status.freq)
+        self.assertIs(status, self.device.status)
+        self.assertEqual(750, self.device.history.query('freq', 'max', 60))
+
+    def test_send_backlog(self):
+        asyncio.run(self._test_send_backlog())
+
+    async def _test_send_backlog(self):
+        # nobody reads the other end for a while, so most frames wait on the transport
+        host, board = socket.socketpair()
+        board.setblocking(False)
+        device = await LB1Device.connect(host, name='test')
+        for freq in range(400):
+            device.send(TXDeviceParametersPacket(flag=TXDeviceParametersPacket.SET, freq=freq))
+        loop, framer, received = asyncio.get_running_loop(), PacketFramer(), []
+        while len(received) < 400:
+            received.extend(packet.freq for packet in framer.feed(await loop.sock_recv(board, 4096)))
+        self.assertEqual(list(range(400)), received)
+        await device.close()
+        board.close()
+
+    def test_open_serial_errors(self):
+        async def run():
+            master, slave = os.openpty()
+            opened = len(os.listdir('/proc/self/fd'))
+            with self.assertRaises(ValueError):
+                await LB1Device.open_serial(os.ttyname(slave), baudrate=123)
+            with mock.patch.object(termios, 'tcsetattr', side_effect=termios.error(25, 'failed')):
+                with self.assertRaises(termios.error):
+                    await LB1Device.open_serial(os.ttyname(slave))
+            self.assertEqual(opened, len(os.listdir('/proc/self/fd')))
+            for fd in (master, slave):
+                os.close(fd)
+        asyncio.run(run())
+
+    @with_device
+    async def test_pipelined_jobs(self):
+        await self.device.query_information()
+        self.device.start()
+        works = [Work.from_job(Job.from_stratum(*STRATUM_PARAMS), bytes.fromhex("485fd81a"),
+                               index.to_bytes(4, 'little'), diff_to_target(5)) for index in range(10)]
+        for work in works:
+            self.device.submit(work, 0, 9999)
+        found = [await asyncio.wait_for(self.device.nonces.get(), 1) for _ in works]
+        self.assertEqual(works, [work for work, _ in found])
+        self.assertEqual(list(range(1, 11)), [packet.job_id for _, packet in found])
+        self.assertEqual([0x33333333] * 10, [job.target for job in self.board.jobs])
+        self.assertEqual(10, self.device.acks)
+        self.assertTrue(self.device.queued_jobs <= 8)
+
+    @with_device
+    async def test_clear(self):
+        self.device.start()
+        self.device.submit(self.work, 0, 0xffffffff)
+        self.device.submit(self.work, 0, 0xffffffff)
+        await asyncio.wait_for(self.device.nonces.get(), 1)
+        self.assertEqual(1, self.device.queued_jobs)
+        self.device.clear()
+        self.device.submit(self.work, 0, 10)
+        _, packet = await asyncio.wait_for(self.device.nonces.get(), 1)
+        self.assertEqual(2, packet.job_id)
+        self.assertEqual(2, len(self.board.jobs))
+
+    @with_device
+    async def test_nonce_rate(self):
+        self.device.start()
+        work = Work.from_job(Job.from_stratum(*STRATUM_PARAMS), bytes.fromhex("485fd81a"), bytes(4),
+                             diff_to_target(262144))
+        self.device.submit(work, 0, 9999)
+        await asyncio.wait_for(self.device.nonces.get(), 1)
+        self.device.nonce_rate, self.device.hashrate = 2, 10 * (1 << 32)
+        self.device.submit(work, 0, 9999)
+        found, _ = await asyncio.wait_for(self.device.nonces.get(), 1)
+        self.assertEqual([0x3fff, 0x33333333], [job.target for job in self.board.jobs])
+        self.assertEqual((diff_to_target(5), 5), (found.hardware_target, found.hardware_difficulty))
+        self.assertEqual(work.raw_data, found.raw_data)
+
+
+class TestHashrateMeter(unittest.TestCase):
+    def test_rate(self):
+        meter = HashrateMeter(window=10, min_samples=2)
+        self.assertIsNone(meter.rate(1))
+        meter.start(0)
+        meter.add(100, 1)
+        self.assertIsNone(meter.rate(1))
+        meter.add(100, 2)
+        self.assertEqual(50, meter.rate(4))
+        meter.add(100, 15)
+        meter.add(100, 20)
+        self.assertEqual(20, meter.rate(20))
+
+
+class TestJobIndex(unittest.TestCase):
+    def test_index(self):
+        index = JobIndex()
+        work = Work.from_job(Job.from_stratum(*STRATUM_PARAMS), bytes.fromhex("485fd81a"), bytes(4), diff_to_target(5))
+        work.midstate = b''
+        self.assertIsNone(index.get(255))
+        index[255] = work
+        self.assertIs(work, index.get(255))
+        self.assertEqual(work.data[:32], work.midstate)
+        for chip_id, core_id, valid in [(1, 2, True)] * 18 + [(1, 2, False)] * 2 + [(0, 7, True)] * 20 + \
+                [(3, 1, False)] * 4 + [(3, 1, True)] * 12:
+            index.record(RXNoncePacket(chip_id=chip_id, core_id=core_id), valid)
+        self.assertEqual(20, index.valid[(0, 7)])
+        self.assertEqual([(3, 1)], index.bad_cores())
+        self.assertEqual([(1, 2), (3, 1)], index.bad_cores(max_invalid=0.05))
+        self.assertEqual([], index.bad_cores(min_nonces=32))
+        self.assertEqual(0, index.valid_hashes)
+        index.record(RXNoncePacket(job_id=255), True)
+        self.assertEqual(expected_hashes(work.target), index.valid_hashes)
+
+
+if __name__ == '__main__':
+    unittest.main()
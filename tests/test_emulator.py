@@ -0,0 +1,67 @@
+import asyncio
+import unittest
+
+from lb1miner.device import LB1Device
+from lb1miner.emulator import EmulatedBoard
+from lb1miner.miner import Job, Target, Work, diff_to_target
+from tests.test_miner import STRATUM_PARAMS
+
+
+def emulated(**kwargs):
+    def decorator(test):
+        def wrapper(self):
+            async def run():
+                self.board, host = await EmulatedBoard.socketpair(**kwargs)
+                self.device = await LB1Device.connect(host, hashrate=1e6, name='emulated')
+                try:
+                    await test(self)
+                finally:
+                    await self.device.close()
+                    await self.board.closed.wait()
+            asyncio.run(run())
+        return wrapper
+    return decorator
+
+
+class TestEmulatedBoard(unittest.TestCase):
+    def setUp(self):
+        self.work = Work.from_job(Job.from_stratum(*STRATUM_PARAMS), bytes.fromhex("485fd81a"), bytes(4),
+                                  diff_to_target(5))
+
+    @emulated(work_depth=4)
+    async def test_queries(self):
+        information = await self.device.query_information()
+        self.assertEqual((b'Goldshell-LB1', 4), (information.model_name.rstrip(b'\x00'), information.work_depth))
+        self.assertEqual(750, (await self.device.query_status()).freq)
+        status = await self.device.set_parameters(voltage=410, freq=700)
+        self.assertEqual((410, 700), (status.voltage, status.freq))
+
+    @emulated(hashrate=1e6, nonce_rate=1000)
+    async def test_nonce_rate(self):
+        self.device.start()
+        self.device.submit(self.work, 0, 999999)
+        found = [await asyncio.wait_for(self.device.nonces.get(), 1) for _ in range(20)]
+        self.assertEqual(1, self.device.acks)
+        for work, packet in found:
+            self.assertIs(self.work, work)
+            self.assertEqual(1, packet.job_id)
+            self.assertLessEqual(packet.nonce, 999999)
+            self.assertLess(packet.chip_id, 8)
+
+    @emulated(hit_difficulty=2 ** -24, chunk_size=256)
+    async def test_real_hits(self):
+        self.device.start()
+        self.device.submit(self.work, 0, 1023)
+        hit_target = Target.from_difficulty(2 ** -24)
+        for _ in range(100):
+            if self.device.acks and not self.board.jobs:
+                break
+            await asyncio.sleep(0.01)
+        self.assertGreater(self.board.sent_nonces, 0)
+        for _ in range(self.board.sent_nonces):
+            work, packet = await asyncio.wait_for(self.device.nonces.get(), 1)
+            self.assertTrue(work.check_nonce(packet.nonce.to_bytes(8, 'little'), hit_target))
+
+
+if __name__ == '__main__':
+    unittest.main()
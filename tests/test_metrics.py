@@ -0,0 +1,66 @@
+import asyncio
+import unittest
+
+from lb1miner.metrics import Histogram, Metrics
+from lb1miner.miner import SHARE, Job, Work
+from lb1miner.serialization import PacketFramer, TXJobDataPacket
+from tests.test_miner import STRATUM_PARAMS
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.metrics = Metrics()
+
+    def tearDown(self):
+        self.metrics.disable()
+
+    def test_histogram(self):
+        histogram = Histogram((1.0, 2.0))
+        for value in (0.5, 1.0, 1.5, 3.0):
+            histogram.observe(value)
+        self.assertEqual([(1.0, 2), (2.0, 3), (float('inf'), 4)], histogram.cumulative())
+        self.assertEqual(6.0, histogram.total)
+
+    def test_enable_disable(self):
+        originals = {name: vars(Work)[name] for name in ('grade_nonces', 'hash_nonces')}
+        self.metrics.enable()
+        job = Job.from_stratum(*STRATUM_PARAMS)
+        work = Work.from_job(job, bytes.fromhex("485fd81a"), bytes(4), bytes.fromhex('00000000' + 'ff' * 28))
+        self.assertEqual(SHARE, work.grade_nonce(bytes.fromhex('1e0cb44802000000')))
+        packet = TXJobDataPacket(job_data=work.data).pack()
+        self.assertEqual(1, len(list(PacketFramer().feed(packet))))
+        stages = self.metrics.snapshot()['stages']
+        for stage in ('job_from_stratum', 'template_from_job', 'template_work', 'grade_nonces', 'hash_nonces',
+                      'job_pack'):
+            self.assertEqual(1, stages[stage]['count'], stage)
+            self.assertGreater(stages[stage]['sum'], 0)
+        self.assertEqual(2, stages['framer_next_packet']['count'])
+
+        self.metrics.disable()
+        self.assertEqual(originals, {name: vars(Work)[name] for name in originals})
+        self.assertNotIn('pack', vars(TXJobDataPacket))
+        Job.from_stratum(*STRATUM_PARAMS)
+        self.assertEqual(1, self.metrics.snapshot()['stages']['job_from_stratum']['count'])
+
+    def test_prometheus(self):
+        asyncio.run(self._test_prometheus())
+
+    async def _test_prometheus(self):
+        self.metrics.count('accepted', 3)
+        self.metrics.histograms['grade_nonces'].observe(3e-6)
+        server = await self.metrics.serve(port=0)
+        reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+        writer.write(b'GET /metrics HTTP/1.0\r\n\r\n')
+        response = (await reader.read()).decode()
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        self.assertTrue(response.startswith('HTTP/1.0 200 OK'))
+        self.assertIn('lb1_stage_seconds_bucket{stage="grade_nonces",le="2e-06"} 0\n', response)
+        self.assertIn('lb1_stage_seconds_bucket{stage="grade_nonces",le="4e-06"} 1\n', response)
+        self.assertIn('lb1_stage_seconds_count{stage="grade_nonces"} 1\n', response)
+        self.assertIn('lb1_accepted 3\n', response)
+
+
+if __name__ == '__main__':
+    unittest.main()
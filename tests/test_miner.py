@@ -1,6 +1,25 @@
-from unittest import TestCase
+import pickle
+from dataclasses import replace
+from fractions import Fraction
+from unittest import TestCase, mock, skipIf
 
-from lb1miner.miner import Job, Work, diff_to_target
+from lb1ext.lb1ext import py_hash_headers, py_sha256_transform  # pylint: disable=no-name-in-module, import-error
+from lb1miner import miner
+from lb1miner.miner import BELOW_TARGET, INVALID, SHARE, Job, JobTemplate, Target, Work, diff_to_target, \
+    hash_headers, numpy_module, proof_of_work, rate_difficulty
+from lb1miner.serialization import TXJobDataPacket
+
+
+STRATUM_PARAMS = ["a309", "5334d82d54583671aa7e8f9e5f482204d101e74104c8056af2280c7d2dffb941",
+                  "b27a34586645220b88082e3f5520793bd01ff1ccce4d5c936d5b12802920c481",
+                  "01000000010000000000000000000000000000000000000000000000000000000000000000ffffffff2003fd380f04d01af56008",
+                  "0d2f6e6f64655374726174756d2f00000000020000000000000000266a24aa21a9ed33fe741208823b47a170823b5d7c2d3367cccb5572c2ff3111c01551f9727e4116e13a07060000001976a914bf4881a63ce29d7370f633422e868c2005d751d188ac00000000",
+                  ["6f1d8577d899831597c552ec0065a1cbbd25bc119ad8a04caf3d72af1016da03",
+                   "0fb08b473071bdf8166248d5e692432007ff6ec0688a907454c4f10e1a4f2678",
+                   "d0dc4ae212225f4ff187be665bce09146903a341508775d1900e0992592f14dc",
+                   "394fb707a447461f4353b8a81d64ef3d48c9dccab2a8fa4bb80e7f84e40f679b",
+                   "92d1b6b8bc05878f642e0132bda2582c4ff64eab9b857e11eea19d0245716e70"], "20000000", "1a015329",
+                  "60f51ad0", True]
 
 
 class TestJob(TestCase):
@@ -28,3 +47,132 @@ class TestJob(TestCase):
         self.assertFalse(work.check_nonce(bytes.fromhex('1e0cb44802000000')))
         work.target = bytes.fromhex('0000000033333333ffffffffffffffffffffffffffffffffffffffffffffffff')
         self.assertTrue(work.check_nonce(bytes.fromhex('1e0cb44802000000')))
+
+    def test_check_nonces(self):
+        job = Job.from_stratum(*STRATUM_PARAMS)
+        work = Work.from_job(job, bytes.fromhex("485fd81a"), bytes([0] * 4),
+                             bytes.fromhex('0000000033333333ffffffffffffffffffffffffffffffffffffffffffffffff'))
+        nonces = bytes.fromhex('1e0cb44803000000' '1e0cb44802000000' '1f0cb44802000000')
+        self.assertEqual([1], work.check_nonces(nonces))
+        self.assertEqual([], work.check_nonces(b''))
+        ntime = (int.from_bytes(work.raw_data[100:104], 'little') + 2).to_bytes(4, 'little')
+        header = work.raw_data[:100] + ntime + work.raw_data[104:108] + bytes.fromhex('1e0cb448')
+        self.assertEqual(96, len(work.hash_nonces(nonces)))
+        self.assertEqual(proof_of_work(header), work.hash_nonces(nonces)[32:64])
+        self.assertEqual([1], Work.from_job_data(work.data, work.target).check_nonces(nonces))
+        self.assertEqual(work.midstate, work.data[:32])
+        work.midstate = b''
+        self.assertEqual([1], work.check_nonces(nonces))
+        self.assertEqual(work.midstate, work.data[:32])
+        with self.assertRaises(ValueError):
+            work.check_nonces(nonces[:-1])
+
+    def test_for_hardware(self):
+        self.assertEqual(5, rate_difficulty(10 * (1 << 32), 2))
+        self.assertEqual(1, rate_difficulty(1e6, 1))
+        work = Work.from_job(Job.from_stratum(*STRATUM_PARAMS), bytes.fromhex("485fd81a"), bytes(4),
+                             diff_to_target(262144))
+        hardware = work.for_hardware(5)
+        self.assertEqual((diff_to_target(5), 5), (hardware.hardware_target, hardware.hardware_difficulty))
+        self.assertEqual((b'', 0), (work.hardware_target, work.hardware_difficulty))
+        self.assertIs(hardware, hardware.for_hardware(5))
+        self.assertIs(work, work.for_hardware(1 << 20))  # harder than the pool target
+        self.assertFalse(hardware.check_nonce(bytes.fromhex('1e0cb44802000000')))
+        self.assertTrue(hardware.check_nonce(bytes.fromhex('1e0cb44802000000'), hardware.hardware_target))
+        nonces = bytes.fromhex('1e0cb44802000000' '1e0cb44803000000')
+        self.assertEqual([BELOW_TARGET, INVALID], hardware.grade_nonces(nonces))
+        self.assertEqual([SHARE, INVALID], replace(hardware, target=hardware.hardware_target).grade_nonces(nonces))
+        self.assertEqual(INVALID, work.grade_nonce(nonces[:8]))
+
+    def test_target(self):
+        self.assertEqual(bytes.fromhex('0000000033333333' + '33' * 24), diff_to_target(5))
+        self.assertEqual(bytes.fromhex('00000000ffffffff' + 'ff' * 24), diff_to_target(1))
+        self.assertEqual(Target.MAX * 10, diff_to_target(0.1).value)
+        self.assertEqual(Target.MAX * 3 // 2, diff_to_target(Fraction(2, 3)).value)
+        self.assertEqual(Target.MAX >> 40, diff_to_target(1 << 40).value)
+        self.assertEqual(5, diff_to_target(5).difficulty)
+        self.assertEqual((1 << 256) - 1, diff_to_target(1e-10).value)
+        with self.assertRaises(ValueError):
+            diff_to_target(0)
+        target = pickle.loads(pickle.dumps(diff_to_target(5)))
+        self.assertEqual((diff_to_target(5), diff_to_target(5).high), (target, target.high))
+
+    def test_target_matches(self):
+        header = Work.from_job(Job.from_stratum(*STRATUM_PARAMS), bytes.fromhex("485fd81a"), bytes(4),
+                               diff_to_target(5)).raw_data
+        headers = b''.join(header[:108] + index.to_bytes(4, 'little') for index in range(64))
+        hashes = b''.join(proof_of_work(headers[index:index + 112]) for index in range(0, len(headers), 112))
+        target = Target(int.from_bytes(hashes[32 * 7:32 * 8], 'little'))  # hash 7 ties on the target
+        expected = [index for index in range(64) if hashes[index * 32:index * 32 + 32][::-1] < target]
+        self.assertNotIn(7, expected)
+        self.assertEqual(expected, [index for index in range(64) if target.meets(hashes[index * 32:index * 32 + 32])])
+        self.assertEqual(expected, target.matches(hashes))
+        self.assertEqual(expected, target.matches(bytearray(hashes)))
+        self.assertEqual([index for index in expected if index < 8], target.matches(hashes[:8 * 32]))
+        self.assertIs(target, Target.from_bytes(target))
+        self.assertEqual(target.value, Target.from_bytes(bytes(target)).value)
+        with mock.patch.object(miner, 'numpy_module', lambda: None):
+            self.assertEqual(expected, target.matches(hashes))
+
+    def test_job_template(self):
+        job = Job.from_stratum(*STRATUM_PARAMS)
+        target = diff_to_target(262144)
+        template = JobTemplate.from_job(job, bytes.fromhex("485fd81a"), target)
+        extra_nonce2s = [index.to_bytes(4, 'little') for index in range(4)]
+        works = template.works(extra_nonce2s)
+        self.assertEqual(4, len({work.data for work in works}))
+        for extra_nonce2, work in zip(extra_nonce2s, works):
+            expected = Work.from_job(job, bytes.fromhex("485fd81a"), extra_nonce2, target)
+            self.assertEqual(expected.data, work.data)
+            self.assertEqual(expected.raw_data, work.raw_data)
+            self.assertEqual(expected.midstate, work.midstate)
+            self.assertEqual(136, len(work.data))
+            self.assertEqual(template.header_prefix + template.merkle_root(extra_nonce2) + template.header_suffix,
+                             work.raw_data)
+            self.assertEqual(py_sha256_transform(work.raw_data[:64]) + work.raw_data[64:] + bytes(56), work.data)
+
+    def test_encode_job(self):
+        template = JobTemplate.from_job(Job.from_stratum(*STRATUM_PARAMS), bytes.fromhex("485fd81a"),
+                                        diff_to_target(5))
+        work = template.work(bytes(4))
+        frame, header = template.encode_job(bytes(4), 0x33333333, 10, 20000, job_id=7)
+        self.assertEqual(work.raw_data, header)
+        self.assertEqual(TXJobDataPacket(target=0x33333333, start_nonce=10, end_nonce=20000, job_num=1, job_id=7,
+                                         job_data=work.data).pack(), frame)
+        buffer = bytearray(256)
+        self.assertEqual((len(frame), header), template.encode_job(bytes(4), 0x33333333, 10, 20000, 7, buffer, 3))
+        self.assertEqual(bytes(3) + frame + bytes(256 - 3 - len(frame)), buffer)
+        with self.assertRaises(ValueError):
+            template.encode_job(bytes(4), 0x33333333, buffer=bytearray(100))
+        for offset in (256 - len(frame) + 1, 257, 2 ** 64 - 1):  # past the end, even wrapping around
+            with self.assertRaises(ValueError):
+                template.encode_job(bytes(4), 0x33333333, buffer=buffer, offset=offset)
+        self.assertEqual(bytes(3) + frame + bytes(256 - 3 - len(frame)), buffer)
+
+    def test_hash_headers(self):
+        job = Job.from_stratum(*STRATUM_PARAMS)
+        target = bytes.fromhex('0000000033333333ffffffffffffffffffffffffffffffffffffffffffffffff')
+        header = Work.from_job(job, bytes.fromhex("485fd81a"), bytes([0] * 4), target).raw_data
+        ntime = (int.from_bytes(header[100:104], 'little') + 2).to_bytes(4, 'little')
+        headers = [header, header[:100] + ntime + header[104:108] + bytes.fromhex('1e0cb448'), header[::-1]]
+        hashes, mask = hash_headers(b''.join(headers), target)
+        self.assertEqual(b''.join(map(proof_of_work, headers)), hashes)
+        self.assertEqual(bytes([0, 1, 0]), mask)
+        self.assertEqual((bytearray(), bytearray()), hash_headers(b'', target))
+        with self.assertRaises(ValueError):
+            hash_headers(header[1:], target)
+        buffer = memoryview(bytearray(header + bytes(33)))
+        self.assertEqual(1, py_hash_headers(buffer[:112], bytes([255] * 32), buffer[112:144], buffer[144:]))
+        with self.assertRaises(ValueError):
+            py_hash_headers(buffer[:112], target, buffer[80:112], bytearray(1))  # the hashes would overwrite headers
+
+    @skipIf(numpy_module() is None, 'numpy is not installed')
+    def test_hash_headers_numpy(self):
+        numpy = numpy_module()
+        job = Job.from_stratum(*STRATUM_PARAMS)
+        header = Work.from_job(job, bytes.fromhex("485fd81a"), bytes([0] * 4), diff_to_target(1)).raw_data
+        headers = numpy.frombuffer(header * 3, dtype=numpy.uint8).reshape(3, 112)
+        hashes, mask = hash_headers(headers, bytes(32))
+        self.assertEqual((3, 32), hashes.shape)
+        self.assertEqual(proof_of_work(header), hashes[2].tobytes())
+        self.assertEqual([False] * 3, mask.tolist())
@@ -0,0 +1,64 @@
+import asyncio
+import os
+import unittest
+from unittest import mock
+
+from lb1miner.device import LB1Device
+from lb1miner.miner import Job, JobTemplate, diff_to_target
+from lb1miner.orchestrator import Orchestrator, discover
+from lb1miner.verifier import VerificationPool
+from tests.test_device import INFORMATION
+from tests.test_miner import STRATUM_PARAMS
+
+
+class TestOrchestrator(unittest.TestCase):
+    def test_ranges_follow_hashrate(self):
+        async def run():
+            orchestrator = Orchestrator('127.0.0.1', 0, 'worker', job_seconds=1.0)
+            template = JobTemplate.from_job(Job.from_stratum(*STRATUM_PARAMS), bytes(4), diff_to_target(5))
+            orchestrator.template = template
+            fast, slow = LB1Device(hashrate=2e9), LB1Device(hashrate=5e8)
+            for device in (fast, slow):
+                orchestrator.assign(device, template.work(bytes(4)))
+                for _ in range(3):
+                    orchestrator.job_taken(device)
+            ranges = {device: [device._pending.get_nowait()[1:3] for _ in range(device._pending.qsize())]
+                      for device in (fast, slow)}
+            self.assertEqual([(0, 1999999999), (2000000000, 3999999999), (4000000000, 0xffffffff)], ranges[fast])
+            self.assertEqual(1, len(orchestrator._tasks))  # the fast device ran out of nonces and needs a new work
+            self.assertEqual([(0, 499999999), (500000000, 999999999), (1000000000, 1499999999),
+                              (1500000000, 1999999999)], ranges[slow])
+            for task in orchestrator._tasks:
+                task.cancel()
+        asyncio.run(run())
+
+    def test_close(self):
+        orchestrator = Orchestrator('127.0.0.1', 0, 'worker', verification_workers=1)
+        orchestrator.close()
+        with self.assertRaises(RuntimeError):
+            orchestrator.verifier.executor.submit(int)
+        pool = VerificationPool(workers=1)
+        Orchestrator('127.0.0.1', 0, 'worker', verifier=pool).close()
+        self.assertEqual(0, pool.executor.submit(int).result())
+        pool.close()
+
+    def test_discover(self):
+        async def run():
+            master, slave = os.openpty()
+            silent_master, silent_slave = os.openpty()
+            loop = asyncio.get_running_loop()
+            loop.add_reader(master, lambda: os.read(master, 1024) and os.write(master, INFORMATION))
+            with mock.patch.object(LB1Device, 'QUERY_TIMEOUT', 0.2):
+                devices = await discover([os.ttyname(slave), os.ttyname(silent_slave)])
+            loop.remove_reader(master)
+            self.assertEqual([os.ttyname(slave)], [device.name for device in devices])
+            self.assertEqual(8, devices[0].work_depth)
+            for device in devices:
+                await device.close()
+            for fd in (master, slave, silent_master, silent_slave):
+                os.close(fd)
+        asyncio.run(run())
+
+
+if __name__ == '__main__':
+    unittest.main()
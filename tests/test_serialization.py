@@ -1,6 +1,9 @@
+import random
 import unittest
 from lb1miner.serialization import RXStatusPacket, RXNoncePacket, RXJobResultPacket, TXJobDataPacket, \
-    TXDeviceParametersPacket, TXQueryDeviceInformationPacket, RXDeviceInformationPacket, TXRestartPacket
+    TXDeviceParametersPacket, TXQueryDeviceInformationPacket, RXDeviceInformationPacket, TXRestartPacket, \
+    PacketFramer, deserialize_packet
+from tests.test_deserialize_simple import DATA
 
 
 class SerializationTestCase(unittest.TestCase):
@@ -116,6 +119,111 @@ class SerializationTestCase(unittest.TestCase):
         self.assertEqual(packet.length, 6)
         self.assertEqual(hex_packet, packet.pack().hex())
         self.assertEqual(hex_packet, TXRestartPacket().pack().hex())
+        self.assertNotIsInstance(packet, TXQueryDeviceInformationPacket)
+
+    def test_pack_into(self):
+        packets = [TXJobDataPacket(target=0x33333333, end_nonce=0xffffffff, job_num=1, job_id=20, job_data=bytes(136)),
+                   TXDeviceParametersPacket(flag=TXDeviceParametersPacket.QUERY),
+                   TXDeviceParametersPacket(flag=TXDeviceParametersPacket.SET, freq=750, voltage=430, temp=80),
+                   TXQueryDeviceInformationPacket(), TXRestartPacket()]
+        buffer, offset = bytearray(1024), 5
+        for packet in packets:
+            size = packet.pack_into(buffer, offset)
+            self.assertEqual(packet.pack(), buffer[offset:offset + size])
+            self.assertEqual(packet, deserialize_packet(buffer[offset:offset + size]))
+            offset += size
+        self.assertEqual(bytes(5), buffer[:5])
+        with self.assertRaises(NotImplementedError):
+            RXNoncePacket(has_hash=True).pack_into(buffer)
+
+    def test_rx_pack(self):
+        for hex_packet in ('a53c965410360000000d476f6c647368656c6c2d4c423100000005302e302e3100'
+                           '00000f4a4a4a4a4a4a4a4a4a4a4a4a4a4a4a00006d31000869c35a',
+                           'a53c9652101b000000087878203c00ae01ee02000000003f00000000fc0869c35a',
+                           'a53c9651101200000011010511dba0d13a0000000069c35a',
+                           'a53c965510070000001569c35a'):
+            packet = deserialize_packet(bytes.fromhex(hex_packet))
+            self.assertEqual(hex_packet, packet.pack().hex())
+            packet.length = 0
+            self.assertEqual(hex_packet, packet.pack().hex())
+        self.assertEqual('a53c9651101200000011010511dba0d13a0000000069c35a',
+                         RXNoncePacket(job_id=17, chip_id=1, core_id=5, nonce=252625083153).pack().hex())
+
+    def test_slots(self):
+        for packet in (RXNoncePacket(), RXStatusPacket(), TXJobDataPacket(), TXRestartPacket()):
+            self.assertFalse(hasattr(packet, '__dict__'))
+        self.assertEqual(0x51, RXNoncePacket.type)
+        self.assertEqual(0xAC, TXRestartPacket.type)
+        self.assertEqual(0x10, TXRestartPacket.version)
+
+    def test_type_and_version_fields(self):
+        # still the first fields, taken positionally or by keyword, and kept per instance
+        packet = TXJobDataPacket(0xA1, 0x10, 0, 0x0000ffff, 1, 2, 3, 4, bytes(136))
+        self.assertEqual(packet, TXJobDataPacket(target=0x0000ffff, start_nonce=1, end_nonce=2, job_num=3, job_id=4,
+                                                 job_data=bytes(136)))
+        self.assertEqual(packet, deserialize_packet(packet.pack()))
+        packet = RXNoncePacket(version=0x11, job_id=17)
+        self.assertEqual((0x51, 0x11), (packet.type, packet.version))
+        self.assertEqual(0x11, packet.pack()[4])
+        self.assertEqual(0x10, RXNoncePacket().version)
+        self.assertEqual(0x10, RXNoncePacket.version)
+        self.assertEqual('a53c96ac100600000069c35a', TXRestartPacket(0xAC, 0x10, 6).pack().hex())
+
+
+class PacketFramerTestCase(unittest.TestCase):
+    def test_chunked_stream(self):
+        expected = [deserialize_packet(bytes.fromhex(message)) for message in DATA]
+        stream = bytes.fromhex(''.join(DATA))
+        rng = random.Random(0)
+        for _ in range(20):
+            framer, packets, offset = PacketFramer(1024), [], 0
+            while offset < len(stream):
+                size = rng.randint(1, 300)
+                packets.extend(framer.feed(stream[offset:offset + size]))
+                offset += size
+            self.assertEqual(expected, packets)
+            self.assertEqual(0, framer.discarded)
+            self.assertEqual(0, len(framer))
+
+    def test_buffered_protocol(self):
+        framer = PacketFramer()
+        stream = bytes.fromhex(''.join(DATA[:5]))
+        buffer = framer.get_buffer()
+        buffer[:len(stream)] = stream
+        framer.buffer_updated(len(stream))
+        self.assertEqual([deserialize_packet(bytes.fromhex(message)) for message in DATA[:5]], list(framer))
+
+    def test_unconsumed_feed(self):
+        expected = [deserialize_packet(bytes.fromhex(message)) for message in DATA]
+        stream = bytes.fromhex(''.join(DATA))
+        framer = PacketFramer(1024)
+        half = len(bytes.fromhex(''.join(DATA[:len(DATA) // 2])))
+        packets = [next(framer.feed(stream[:half]))]
+        # the rest of the first chunk was never iterated, it comes out ahead of the second
+        packets.extend(framer.feed(stream[half:]))
+        self.assertEqual(expected, packets)
+        self.assertEqual(0, len(framer))
+        # bigger than the whole buffer at once
+        self.assertEqual(expected * 4, list(framer.feed(stream * 4)))
+
+    def test_resync(self):
+        nonce = bytes.fromhex('a53c9651101200000011010511dba0d13a0000000069c35a')
+        corrupt_finalizer = nonce[:-1] + b'\x00'
+        unknown_type = nonce[:3] + b'\x99' + nonce[4:]
+        huge_length = nonce[:5] + b'\xff\xff\x00\x00' + nonce[9:]
+        stream = b''.join([b'garbage\xa5\x3c', nonce, corrupt_finalizer, unknown_type, nonce[:10], huge_length,
+                           nonce])
+        framer = PacketFramer()
+        packets = list(framer.feed(stream))
+        self.assertEqual([RXNoncePacket.unpack(nonce)] * 2, packets)
+        self.assertEqual(len(stream) - 2 * len(nonce), framer.discarded)
+        self.assertEqual(0, len(framer))
+
+    def test_job_data_does_not_reference_buffer(self):
+        framer = PacketFramer()
+        packet, = framer.feed(bytes.fromhex(DATA[2]))
+        self.assertIsInstance(packet.job_data, bytes)
+        self.assertEqual(DATA[2], packet.pack().hex())
 
 
 if __name__ == '__main__':
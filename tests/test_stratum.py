@@ -0,0 +1,203 @@
+import asyncio
+import os
+import socket
+import tempfile
+import time
+import unittest
+from functools import partial
+from types import SimpleNamespace
+
+from aiorpcx import JSONRPCConnection, JSONRPCv1, RPCSession, serve_rs
+
+from lb1miner.capture import CaptureWriter, replay
+from lb1miner.device import JobIndex, LB1Device
+from lb1miner.metrics import METRICS
+from lb1miner.miner import Job, JobTemplate, diff_to_target
+from lb1miner.serialization import RXNoncePacket
+from lb1miner.stratum import ShareFilter, StratumClient
+from lb1miner.verifier import VerificationPool
+from tests.test_device import FakeBoard
+from tests.test_miner import STRATUM_PARAMS
+
+
+class FakePool(RPCSession):
+    def __init__(self, pool, transport, **kwargs):
+        super().__init__(transport, connection=JSONRPCConnection(JSONRPCv1), **kwargs)
+        self.pool = pool
+
+    async def handle_request(self, request):
+        if request.method == 'mining.subscribe':
+            self.pool.session = self
+            return [[["mining.notify", "1"]], "485fd81a", 4]
+        if request.method == 'mining.authorize':
+            asyncio.get_running_loop().call_soon(self.pool.authorized.set)
+            return True
+        if request.method == 'mining.submit':
+            self.pool.submits.append(request.args)
+            return True
+        return None
+
+
+class Pool:
+    def __init__(self):
+        self.session = None
+        self.submits = []
+        self.authorized = asyncio.Event()
+
+
+class TestStratumClient(unittest.TestCase):
+    def test_mining(self):
+        asyncio.run(self._test_mining())
+
+    async def _test_mining(self):
+        pool = Pool()
+        server = await serve_rs(partial(FakePool, pool), '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        host, board_socket = socket.socketpair()
+        board = FakeBoard(board_socket)
+        board_task = asyncio.create_task(board.run())
+        device = await LB1Device.connect(host, hashrate=1e6, name='test')
+        await device.query_information()
+        client = StratumClient('127.0.0.1', port, 'worker', devices=[device])
+        client._extra_nonce2 = -1  # first work gets extranonce2 0, which the fake board has a nonce for
+        directory = tempfile.TemporaryDirectory()
+        capture = CaptureWriter(os.path.join(directory.name, 'capture.lb1'))
+        client.record(capture)
+        client_task = asyncio.create_task(client.run())
+        await asyncio.wait_for(pool.authorized.wait(), 5)
+        self.assertEqual(bytes.fromhex('485fd81a'), client.extra_nonce1)
+
+        await pool.session.send_notification('mining.set_difficulty', [5])
+        await pool.session.send_notification('mining.notify', STRATUM_PARAMS)
+        for _ in range(100):
+            if client.accepted and len(board.jobs) >= 8:
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual(1, client.accepted)
+        self.assertEqual([['worker', 'a309', '00000000', '60f51ad2', '48b40c1e']], pool.submits)
+        self.assertEqual(1, len(client.notify_latency))
+        self.assertGreaterEqual(len(board.jobs), 8)
+        self.assertGreater(client.invalid, 0)
+
+        stale_job = list(STRATUM_PARAMS)
+        stale_job[0] = 'a30a'
+        await pool.session.send_notification('mining.notify', stale_job)
+        for _ in range(100):
+            if b'\xa3\x0a' in client.templates:
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual([b'\xa3\x0a'], list(client.templates))
+
+        client_task.cancel()
+        await asyncio.gather(client_task, return_exceptions=True)
+        await device.close()
+        await board_task
+        server.close()
+        await server.wait_closed()
+
+        capture.close()
+        found, _ = replay(capture.path)
+        self.assertEqual((2, 1, 1), (found['notify'], found['difficulty'], found['extranonce']))
+        self.assertEqual(len(board.jobs), found['TXJobDataPacket'])
+        # the fake board answers every job with the same nonce, a share only for the first work. the client can be
+        # cancelled before getting to the last nonces read, so its counts are a lower bound
+        self.assertEqual(client.accepted, found['shares'])
+        self.assertEqual(found['RXNoncePacket'], found['shares'] + found['invalid'])
+        self.assertGreaterEqual(found['invalid'], client.invalid)
+        directory.cleanup()
+
+    def test_superseded_clean_notify(self):
+        asyncio.run(self._test_superseded_clean_notify())
+
+    async def _test_superseded_clean_notify(self):
+        class Client(StratumClient):
+            def _build(self, params, extra_nonce2s):
+                if params[-1]:
+                    time.sleep(0.05)  # the clean job is still being built when the next one arrives
+                return super()._build(params, extra_nonce2s)
+
+        client = Client('127.0.0.1', 0, 'worker')
+        client.templates[b'\x01'] = JobTemplate.from_job(Job.from_stratum('01', *STRATUM_PARAMS[1:]), b'', client.target)
+        newer = ['a30a', *STRATUM_PARAMS[1:-1], False]
+        clean = asyncio.create_task(client.on_notify(*STRATUM_PARAMS))
+        await asyncio.sleep(0)
+        await client.on_notify(*newer)
+        await clean
+        self.assertEqual([b'\xa3\x0a'], list(client.templates))
+        self.assertEqual(b'\xa3\x0a', client.template.job.job_id)
+
+    def test_client_below_target(self):
+        asyncio.run(self._test_client_below_target())
+        pool = VerificationPool(1)
+        asyncio.run(self._test_client_below_target(pool))
+        self.assertEqual(2, pool.checked)  # hashed once for both the pool and the hardware target
+        pool.close()
+
+    async def _test_client_below_target(self, verifier=None):
+        client = StratumClient('127.0.0.1', 0, 'worker', verifier=verifier)
+        client.templates[b'\xa3\x09'] = template = JobTemplate.from_job(
+            Job.from_stratum(*STRATUM_PARAMS), bytes.fromhex('485fd81a'), diff_to_target(262144))
+        work = template.work(bytes(4)).for_hardware(5)
+        device = SimpleNamespace(nonces=asyncio.Queue(), jobs=JobIndex())
+        for nonce in (0x0248b40c1e, 0x0148b40c1e):
+            device.nonces.put_nowait((work, RXNoncePacket(length=18, nonce=nonce)))
+        task = asyncio.create_task(client._process_nonces(device))  # pylint: disable=protected-access
+        for _ in range(100):
+            if client.below_target + client.invalid == 2:
+                break
+            await asyncio.sleep(0.01)
+        task.cancel()
+        self.assertEqual((1, 1, 0), (client.below_target, client.invalid, client.accepted))
+        self.assertEqual(({(0, 0): 1}, {(0, 0): 1}), (device.jobs.valid, device.jobs.invalid))
+
+
+class TestShareFilter(unittest.TestCase):
+    def test_duplicates(self):
+        template = JobTemplate.from_job(Job.from_stratum(*STRATUM_PARAMS), bytes.fromhex('485fd81a'), diff_to_target(5))
+        first, second = template.works([bytes(4), bytes([1, 0, 0, 0])])
+        shares = ShareFilter(size=2)
+        self.assertTrue(shares.add(first, 0x0248b40c1e))
+        self.assertFalse(shares.add(first, 0x0248b40c1e))
+        self.assertTrue(shares.add(first, 0x0348b40c1e))  # same nonce, another ntime offset
+        self.assertTrue(shares.add(second, 0x0248b40c1e))
+        self.assertEqual(2, len(shares))
+        self.assertTrue(shares.add(first, 0x0248b40c1e))  # the oldest went away
+        self.assertEqual(1, shares.duplicates)
+        shares.clear()
+        self.assertEqual(0, len(shares))
+
+    def test_client_drops_duplicates(self):
+        asyncio.run(self._test_client_drops_duplicates())
+
+    async def _test_client_drops_duplicates(self):
+        class Client(StratumClient):
+            async def submit(self, work, nonce):
+                submits.append((work, nonce))
+                return True
+
+        submits: list = []
+        counters = dict(METRICS.counters)
+        client = Client('127.0.0.1', 0, 'worker')
+        client.templates[b'\xa3\x09'] = template = JobTemplate.from_job(
+            Job.from_stratum(*STRATUM_PARAMS), bytes.fromhex('485fd81a'), diff_to_target(5))
+        work = template.work(bytes(4))
+        device = SimpleNamespace(nonces=asyncio.Queue(), jobs=JobIndex())
+        for nonce in (0x0248b40c1e, 0x0248b40c1e, 0x0148b40c1e, 0x0248b40c1e):
+            device.nonces.put_nowait((work, RXNoncePacket(length=18, nonce=nonce)))
+        task = asyncio.create_task(client._process_nonces(device))  # pylint: disable=protected-access
+        for _ in range(100):
+            if device.nonces.empty():
+                break
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.01)
+        task.cancel()
+        self.assertEqual(2, client.shares.duplicates)
+        self.assertEqual(1, client.invalid)
+        self.assertEqual((2, 1), tuple(METRICS.counters.get(name, 0) - counters.get(name, 0)
+                                       for name in ('duplicates', 'invalid')))
+        self.assertEqual([(work, bytes.fromhex('1e0cb44802000000'))], submits)
+        self.assertEqual(({(0, 0): 1}, {(0, 0): 1}), (device.jobs.valid, device.jobs.invalid))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+
+from lb1miner.serialization import RXStatusPacket
+from lb1miner.telemetry import StatusHistory
+
+START = 300000 * 3600.0
+
+
+class TestStatusHistory(unittest.TestCase):
+    def setUp(self):
+        self.history = StatusHistory(tiers=((0, 32), (60, 60), (3600, 24)))
+        # a day of one status every 10 seconds, temperature going up by one every hour
+        for second in range(0, 86400, 10):
+            self.history.add(RXStatusPacket(temp=40 + second // 3600, good_cores=120 - (second >= 43200)),
+                             now=START + second)
+        self.now = START + 86400 - 10
+
+    def test_tiers(self):
+        self.assertEqual([32, 60, 24], [tier.size for tier in self.history.tiers])
+        self.assertEqual(([0, 32], [60, 60], [3600, 24]),
+                         tuple([tier.period, tier.capacity] for tier in self.history.tiers))
+        self.assertEqual(0, self.history.tier(self.now - 60, self.now).period)
+        self.assertEqual(60, self.history.tier(self.now - 1800, self.now).period)
+        self.assertEqual(3600, self.history.tier(self.now - 86400, self.now).period)
+
+    def test_query(self):
+        history, now = self.history, self.now
+        self.assertEqual(63, history.query('temp', 'max', 100, now))
+        self.assertEqual(11, history.query('temp', 'count', 100, now))
+        self.assertEqual(40, history.query('temp', 'min', 86400, now))
+        self.assertEqual(63, history.query('temp', 'max', 86400, now))
+        self.assertEqual(8640, history.query('temp', 'count', 86400, now))
+        self.assertAlmostEqual(119.5, history.query('good_cores', 'mean', 86400, now))
+        self.assertEqual(120, history.query('good_cores', 'min', 3600, now - 43200))
+        self.assertIsNone(history.query('temp', 'max', 100, now - 86400 - 100))
+        with self.assertRaises(ValueError):
+            history.query('temp', 'median', 100, now)
+        self.assertEqual(63, history.last.temp)
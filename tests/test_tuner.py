@@ -0,0 +1,56 @@
+import os
+import tempfile
+import unittest
+
+from lb1miner.serialization import RXStatusPacket
+from lb1miner.tuner import Setting, Tuner, TuningStore
+from tests.test_emulator import emulated
+
+
+class ModelTuner(Tuner):
+    # a board needing 10mV more for every 25MHz above 600MHz, drawing some static power on top of the dynamic one
+    async def measure(self, setting: Setting):
+        status = await self.apply(setting)
+        stable = setting.voltage >= 400 + (setting.freq - 600) * 10 // 25
+        return self.judge(setting, setting.freq * 1e7, 0.0 if stable else 0.5, [status])
+
+
+def model_power(setting: Setting) -> float:
+    return setting.voltage ** 2 * setting.freq + 3e7
+
+
+class TestTuner(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'tuning.json')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    @emulated()
+    async def test_tune(self):
+        store = TuningStore(self.path)
+        tuner = ModelTuner(self.device, store, power=model_power, min_gain=0)
+        self.assertEqual(Setting(550, 380), await tuner.run())
+        self.assertEqual((380, 550), (self.board.status.voltage, self.board.status.freq))
+        self.assertTrue(tuner.trials[Setting(650, 430)].stable)
+        self.assertFalse(tuner.trials[Setting(700, 430)].stable)
+        serial = self.device.information.serial_number.rstrip(b'\x00').hex()
+        self.assertEqual(Setting(550, 380), TuningStore(self.path).get(serial))
+        # a stored setting goes back on without measuring anything
+        await self.device.set_parameters(voltage=430, freq=750)
+        tuner = ModelTuner(self.device, TuningStore(self.path))
+        self.assertEqual(Setting(550, 380), await tuner.run())
+        self.assertEqual({}, tuner.trials)
+        self.assertEqual((380, 550), (self.board.status.voltage, self.board.status.freq))
+
+    def test_judge(self):
+        tuner = Tuner(None, TuningStore())
+        good = RXStatusPacket(good_cores=120)
+        self.assertTrue(tuner.judge(Setting(700, 420), 1e9, 0.0, [good]).stable)
+        self.assertEqual(1e9 / (420 ** 2 * 700), tuner.judge(Setting(700, 420), 1e9, 0.0, [good]).score)
+        for status in (RXStatusPacket(good_cores=119), RXStatusPacket(good_cores=120, tempwarn=1),
+                       RXStatusPacket(good_cores=120, powerwarn=1)):
+            trial = tuner.judge(Setting(700, 420), 1e9, 0.0, [good, status])
+            self.assertEqual((False, 0.0), (trial.stable, trial.score))
+        self.assertFalse(tuner.judge(Setting(700, 420), 1e9, 0.05, [good]).stable)
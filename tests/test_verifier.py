@@ -0,0 +1,71 @@
+import asyncio
+import os
+import threading
+import unittest
+
+from lb1miner.miner import BELOW_TARGET, INVALID, SHARE, Job, JobTemplate, diff_to_target
+from lb1miner.verifier import VerificationPool
+from tests.test_miner import STRATUM_PARAMS
+
+
+class TestVerificationPool(unittest.TestCase):
+    def setUp(self):
+        template = JobTemplate.from_job(Job.from_stratum(*STRATUM_PARAMS), bytes.fromhex('485fd81a'), diff_to_target(5))
+        self.works = template.works([bytes(4), bytes([1, 0, 0, 0])])
+        self.pool = VerificationPool(workers=2, max_batch=64)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_grade(self):
+        async def run():
+            hit = bytes.fromhex('1e0cb44802000000')
+            # pool target at 1/8 of the hashes and hardware one at 1/2, so random nonces get every grade
+            easy = JobTemplate.from_job(Job.from_stratum(*STRATUM_PARAMS), bytes.fromhex('485fd81a'),
+                                        diff_to_target(2 ** -29))
+            easy_works = [work.for_hardware(2 ** -31) for work in easy.works([bytes(4), bytes([1, 0, 0, 0])])]
+            requests = [(self.works[0], hit), (self.works[1], hit)]
+            requests += [(easy_works[index % 2], os.urandom(8)) for index in range(250)]
+            results = await asyncio.gather(*(self.pool.grade(*request) for request in requests))
+            self.assertEqual([work.grade_nonce(nonce) for work, nonce in requests], results)
+            self.assertEqual([SHARE, INVALID], results[:2])
+            self.assertEqual({INVALID, BELOW_TARGET, SHARE}, set(results[2:]))
+            # everything came in together, so it went out in as few batches as the batch size allows
+            self.assertEqual(252, self.pool.checked)
+            self.assertLessEqual(self.pool.batches, 6)
+            self.assertEqual(0, self.pool.pending)
+        asyncio.run(run())
+
+    def test_backpressure(self):
+        async def run():
+            pool = VerificationPool(workers=1, max_pending=3)
+            gate = threading.Event()
+            verify = pool.verify
+            pool.verify = lambda batch: gate.wait() and verify(batch)
+            checks = [asyncio.ensure_future(pool.grade(self.works[0], os.urandom(8))) for _ in range(10)]
+            await asyncio.sleep(0.05)
+            self.assertEqual(3, pool.pending)
+            self.assertEqual(1, pool.batches)
+            gate.set()
+            self.assertEqual([INVALID] * 10, await asyncio.gather(*checks))
+            self.assertEqual(10, pool.checked)
+            pool.close()
+        asyncio.run(run())
+
+    def test_errors(self):
+        async def run():
+            self.pool.verify = lambda batch: 1 / 0
+            with self.assertRaises(ZeroDivisionError):
+                await self.pool.grade(self.works[0], bytes(8))
+        asyncio.run(run())
+
+    def test_cancelled_batch(self):
+        async def run():
+            loop = asyncio.get_running_loop()
+            waiter, done = loop.create_future(), loop.create_future()
+            done.cancel()
+            self.pool._busy = 1
+            self.pool._finish(loop, [(self.works[0], bytes(8), waiter)], done)
+            self.assertTrue(waiter.cancelled())
+            self.assertEqual(0, self.pool._busy)
+        asyncio.run(run())